@@ -0,0 +1,341 @@
+# admission.py - Admission control and load shedding in front of the API
+#
+# Every routed request passes three gates before it can take a database
+# connection:
+#   1. a per-client token bucket (429 + Retry-After when empty),
+#   2. a per-route concurrency limit, and
+#   3. a shared pool of slots, sized below the connection pool. Browsing
+#      may fill only part of it, so bookings and payments always find
+#      room.
+# A request that cannot get through gates 2 and 3 within its class's
+# queue budget is shed with 503 + Retry-After instead of queueing on the
+# connection pool. Time the request already spent queued upstream
+# (X-Request-Start from the proxy) counts against the budget. A request
+# whose pool checkout times out anyway is answered with 503 too.
+#
+# Each admitted request also runs under a deadline (ROUTE_DEADLINES, or the
+# client's X-Request-Timeout in seconds, up to MAX_DEADLINE) that caps the
+# admission wait, the pool checkout and every query; a request stopped by
+# it is answered with 504.
+import asyncio
+import json
+import math
+import threading
+import time
+from fastapi import HTTPException
+from starlette.routing import Match
+from auth.login import decode_access_token
+from database.database import pool_exhausted
+from database.deadlines import Deadline, current_deadline
+
+# Share of the slots each class may occupy, and how long it may wait for one
+CLASSES = {
+    "critical": {"share": 1.0, "queue_seconds": 2.0},
+    "standard": {"share": 0.8, "queue_seconds": 0.5},
+    "browse": {"share": 0.5, "queue_seconds": 0.1},
+}
+
+# Route template -> class; anything else routed is "standard"
+ROUTE_CLASSES = {
+    "/payment/checkout/{final_trip_id}": "critical",
+    "/booking/finalize/{user_id}/{filtered_suggestion_id}": "critical",
+    "/jobs/{job_id}": "critical",
+    "/planning/suggestions/{user_id}": "browse",
+    "/planning/filter": "browse",
+    "/planning/nearby": "browse",
+    "/planning/tour": "browse",
+    "/planning/destinations/{dest_id}/stats": "browse",
+    "/planning/destinations/{dest_id}/price-calendar": "browse",
+    "/destinations": "browse",
+    "/destinations/autocomplete": "browse",
+    "/food": "browse",
+    "/accommodations": "browse",
+    "/transport": "browse",
+    "/itineraries/{final_trip_id}": "browse",
+}
+
+# Route template -> most requests of that route in flight at once
+ROUTE_LIMITS = {
+    "/planning/filter": 8,
+    "/planning/suggestions/{user_id}": 8,
+    "/admin/export/final-trips": 2,
+    "/admin/analytics/consistency": 1,
+}
+
+# Route template -> seconds a request may take; None for no deadline
+DEFAULT_DEADLINE = 10.0
+MAX_DEADLINE = 60.0
+ROUTE_DEADLINES = {
+    "/planning/filter": 5.0,
+    "/planning/suggestions/{user_id}": 5.0,
+    "/planning/nearby": 5.0,
+    "/planning/tour": 5.0,
+    "/destinations": 5.0,
+    "/destinations/autocomplete": 5.0,
+    "/payment/checkout/{final_trip_id}": 30.0,
+    "/booking/finalize/{user_id}/{filtered_suggestion_id}": 30.0,
+    "/admin/export/final-trips": None,  # streams for as long as it takes
+    "/admin/analytics/consistency": 60.0,
+}
+
+# Not counted against anything (health checks, docs, and event streams,
+# which stay open for as long as the client does)
+EXEMPT = {"/", "/docs", "/openapi.json", "/redoc", "/events/{user_id}"}
+
+
+class TokenBuckets:
+    """In-memory token bucket per client key"""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """0 if a token was taken, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._forget_idle(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / self.rate
+
+    def _forget_idle(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [key for key, (tokens, last) in self._buckets.items()
+                if tokens + (now - last) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+class Shed(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after)) if retry_after is not None else None
+
+
+class Admission:
+    """Slot accounting for one event loop (one uvicorn worker)"""
+
+    def __init__(self, capacity, route_limits=None, classes=None):
+        self.capacity = capacity
+        self.classes = classes or CLASSES
+        self.route_limits = ROUTE_LIMITS if route_limits is None else route_limits
+        self.in_use = 0
+        self.by_route = {}
+        self._changed = None
+        self.admitted = {name: 0 for name in self.classes}
+        self.shed = {name: 0 for name in self.classes}
+        self.queue_seconds = {name: 0.0 for name in self.classes}
+        self.rate_limited = 0
+        self.pool_timeouts = 0
+        self.deadline_exceeded = 0
+
+    def _limit(self, klass):
+        return max(1, int(self.capacity * self.classes[klass]["share"]))
+
+    def _fits(self, klass, route):
+        limit = self.route_limits.get(route)
+        if limit is not None and self.by_route.get(route, 0) >= limit:
+            return False
+        return self.in_use < self._limit(klass)
+
+    async def acquire(self, klass, route, already_waited=0.0, max_wait=None):
+        """Take a slot or raise Shed once the class's queue budget is spent"""
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        budget = self.classes[klass]["queue_seconds"] - already_waited
+        if max_wait is not None:
+            budget = min(budget, max_wait)
+        started = time.monotonic()
+        async with self._changed:
+            if not self._fits(klass, route):
+                if budget <= 0:
+                    self.shed[klass] += 1
+                    raise Shed(503, "Request waited too long upstream", 1)
+                try:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: self._fits(klass, route)),
+                                           timeout=budget)
+                except asyncio.TimeoutError:
+                    self.shed[klass] += 1
+                    raise Shed(503, "Server is busy", self.classes[klass]["queue_seconds"] * 2)
+            self.in_use += 1
+            self.by_route[route] = self.by_route.get(route, 0) + 1
+        self.admitted[klass] += 1
+        self.queue_seconds[klass] += time.monotonic() - started
+
+    async def release(self, route):
+        async with self._changed:
+            self.in_use -= 1
+            self.by_route[route] -= 1
+            self._changed.notify_all()
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "classes": {
+                name: {
+                    "limit": self._limit(name),
+                    "admitted": self.admitted[name],
+                    "shed": self.shed[name],
+                    "avg_queue_ms": round(self.queue_seconds[name] / self.admitted[name] * 1000, 2)
+                    if self.admitted[name] else 0.0,
+                }
+                for name in self.classes
+            },
+            "routes_in_flight": {route: n for route, n in self.by_route.items() if n},
+            "rate_limited": self.rate_limited,
+            "pool_timeouts": self.pool_timeouts,
+            "deadline_exceeded": self.deadline_exceeded,
+        }
+
+
+def upstream_wait(headers):
+    """Seconds since the proxy's X-Request-Start ("t=<epoch>" in s, ms or us)"""
+    raw = headers.get(b"x-request-start")
+    if not raw:
+        return 0.0
+    try:
+        value = float(raw.decode().removeprefix("t="))
+    except ValueError:
+        return 0.0
+    # Guess the unit from the magnitude
+    while value > 1e11:
+        value /= 1000
+    return max(0.0, time.time() - value)
+
+
+def request_deadline(route, headers):
+    """Seconds this request may take, or None.
+
+    X-Request-Timeout is only honoured when it is a number in
+    (0, MAX_DEADLINE]; larger values are capped, anything else ignored.
+    """
+    seconds = ROUTE_DEADLINES.get(route, DEFAULT_DEADLINE)
+    raw = headers.get(b"x-request-timeout")
+    if raw:
+        try:
+            asked = float(raw)
+        except ValueError:
+            asked = math.nan
+        if math.isfinite(asked) and asked > 0:
+            seconds = min(asked, MAX_DEADLINE)
+    return seconds
+
+
+def rate_key(headers, client):
+    """Token-bucket key: the signed-in user, else the client address.
+
+    Never the user_id in the path: anyone can put any id there, to dodge
+    their own limit or use up someone else's.
+    """
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{decode_access_token(token)}"
+        except HTTPException:
+            pass  # invalid or expired: the route itself will refuse it
+    return f"ip:{client[0]}"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the gates above to every routed request"""
+
+    def __init__(self, app, admission, buckets=None):
+        self.app = app
+        self.admission = admission
+        self.buckets = buckets
+
+    def _route(self, scope):
+        """(template, path params) of the route serving this request"""
+        for route in scope["app"].router.routes:
+            match, child = route.matches(scope)
+            if match == Match.FULL:
+                return route.path, child.get("path_params", {})
+        return None, {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route, _ = self._route(scope)
+        if route is None or route in EXEMPT:
+            return await self.app(scope, receive, send)
+        klass = ROUTE_CLASSES.get(route, "standard")
+        headers = dict(scope["headers"])
+
+        if self.buckets is not None:
+            wait = self.buckets.take(rate_key(headers, scope.get("client") or ("unknown", 0)))
+            if wait:
+                self.admission.rate_limited += 1
+                return await _reject(send, Shed(429, "Too many requests", wait))
+
+        waited = upstream_wait(headers)
+        seconds = request_deadline(route, headers)
+        deadline = Deadline(seconds - waited) if seconds is not None else None
+        try:
+            await self.admission.acquire(klass, route, waited,
+                                         deadline.remaining() if deadline else None)
+        except Shed as shed:
+            return await _reject(send, shed)
+
+        exhausted = threading.Event()
+        token = pool_exhausted.set(exhausted)
+        deadline_token = current_deadline.set(deadline)
+        started = False
+
+        def replacement():
+            # Handlers report most failures as 500; say what actually happened
+            if deadline is not None and deadline.hit:
+                self.admission.deadline_exceeded += 1
+                return Shed(504, f"Request deadline of {seconds:g}s exceeded", None)
+            if exhausted.is_set():
+                # No connection was free in time
+                self.admission.pool_timeouts += 1
+                return Shed(503, "Database is busy", 1)
+            return None
+
+        async def guarded_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                shed = replacement() if message["status"] >= 500 else None
+                if shed is not None:
+                    started = None
+                    return await _reject(send, shed)
+                started = True
+            elif started is None:
+                return  # body of the replaced error response
+            await send(message)
+
+        try:
+            await self.app(scope, receive, guarded_send)
+        except Exception:
+            shed = replacement() if started is False else None
+            if shed is None:
+                raise
+            await _reject(send, shed)
+        finally:
+            current_deadline.reset(deadline_token)
+            pool_exhausted.reset(token)
+            await self.admission.release(route)
+
+
+async def _reject(send, shed):
+    body = json.dumps({"detail": shed.reason}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if shed.retry_after is not None:
+        headers.append((b"retry-after", str(shed.retry_after).encode()))
+    await send({"type": "http.response.start", "status": shed.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
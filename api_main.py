@@ -1,19 +1,88 @@
 # api_main.py - FastAPI Application
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from datetime import date
+import os
+import secrets
 
 # Import your existing modules
 from auth.signup import signup
-from auth.login import login
-from database.database import db, User, Trip, Destination, FinalTrip
+from auth.login import login, decode_access_token
+from database.database import db, User, Trip, Destination, FinalTrip, check_connection
 import planning
+import dashboard
+import price_calendar
+import tours
+import itinerary
 import booking
 import payment
+import destination_stats
+import catalog
+from dataloader import parse_ids
+import jobs
+import exports
+import rollups
+import catalog_snapshot
+from autocomplete import destination_autocomplete, KINDS as AUTOCOMPLETE_KINDS
+from cache_bus import bus
+import admission
+import events
+import tasks  # registers job handlers
+from database import workload
 
-app = FastAPI(title="Travel Planner API")
+job_worker = jobs.JobWorker(concurrency=int(os.getenv("JOB_WORKERS", 4)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect and start background work when serving, not at import"""
+    # QUERY_LOG=<file> records the SQL workload for `python -m database.migrations advise`
+    if os.getenv("QUERY_LOG"):
+        workload.start_capture(os.getenv("QUERY_LOG"))
+    connected = check_connection()
+    # Hear about rows other workers change so per-process caches drop them
+    bus.start()
+    if connected:
+        # Typeahead indexes take seconds to build at catalog scale
+        destination_autocomplete.warm()
+    # Periodic full rebuild of destination_stats on top of the incremental updates
+    reconciler = destination_stats.start_reconciler(int(os.getenv("STATS_RECONCILE_SECONDS", 3600)))
+    if job_worker.concurrency > 0:
+        if connected:
+            # Periodic compaction of the booking rollups; the job reschedules itself
+            interval = int(os.getenv("ROLLUP_COMPACT_SECONDS", 86400))
+            with db.connection_context():
+                jobs.enqueue_unique("compact_rollups", {"interval_seconds": interval}, delay=interval)
+                # Monthly partitions: create upcoming ones, move old months to cold storage
+                every = int(os.getenv("ARCHIVE_SECONDS", 86400))
+                jobs.enqueue_unique("archive_partitions", {"interval_seconds": every}, delay=every)
+                # CATALOG_SNAPSHOT=<file> shares one mmapped destination catalog
+                # between this machine's workers; build it now if missing
+                path = catalog_snapshot.snapshot_path()
+                if path:
+                    every = int(os.getenv("CATALOG_SNAPSHOT_SECONDS", 3600))
+                    jobs.enqueue_unique("rebuild_catalog_snapshot",
+                                        {"path": path, "interval_seconds": every},
+                                        delay=every if os.path.exists(path) else 0)
+        job_worker.start()
+    yield
+    reconciler.set()
+    if job_worker.concurrency > 0:
+        job_worker.stop()
+    bus.stop()
+
+app = FastAPI(title="Travel Planner API", lifespan=lifespan)
+
+# Admission control: keep ADMISSION_CAPACITY below DB_MAX_CONNECTIONS minus
+# JOB_WORKERS so admitted requests never queue on the connection pool.
+# Added before CORS so shed responses still carry CORS headers.
+admission_control = admission.Admission(capacity=int(os.getenv("ADMISSION_CAPACITY", 12)))
+rate_limits = admission.TokenBuckets(rate=float(os.getenv("RATE_LIMIT_PER_SECOND", 20)),
+                                     burst=float(os.getenv("RATE_LIMIT_BURST", 40)))
+app.add_middleware(admission.AdmissionMiddleware, admission=admission_control, buckets=rate_limits)
 
 # CORS Configuration - Allow React frontend
 app.add_middleware(
@@ -45,6 +114,14 @@ class CreateTripRequest(BaseModel):
     destination_city: Optional[str] = None
     destination_country: Optional[str] = None
 
+class CreateTourRequest(BaseModel):
+    user_id: int
+    max_budget: float
+    start_date: str
+    end_date: str
+    destination_ids: List[int]
+    round_trip: bool = True
+
 class FilterRequest(BaseModel):
     user_id: int
     budget: Optional[float] = None
@@ -97,42 +174,71 @@ def api_signup(request: SignupRequest):
 def api_create_trip(request: CreateTripRequest):
     """Create a new trip"""
     try:
-        if db.is_closed():
-            db.connect()
-        
-        # Find or use first destination
-        dest_query = Destination.select()
-        if request.destination_city:
-            dest_query = dest_query.where(Destination.city.contains(request.destination_city))
-        if request.destination_country:
-            dest_query = dest_query.where(Destination.country.contains(request.destination_country))
-        
-        destination = dest_query.first()
-        if not destination:
-            destination = Destination.select().first()
-        
-        # Create trip
-        trip = Trip.create(
-            maxBudget=request.max_budget,
-            destination=destination,
-            startDate=request.start_date,
-            endDate=request.end_date,
-            user_id=request.user_id
+        result = planning.create_trip(
+            user_id=request.user_id,
+            max_budget=request.max_budget,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            destination_city=request.destination_city,
+            destination_country=request.destination_country
         )
-        
-        return {
-            "message": "Trip created successfully",
-            "trip_id": trip.trip_id,
-            "destination": {
-                "city": destination.city,
-                "country": destination.country
-            }
-        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if not db.is_closed():
-            db.close()
+    if "conflicts" in result:
+        raise HTTPException(status_code=409, detail={
+            "message": result["error"],
+            "conflicts": result["conflicts"]
+        })
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    trip = result.pop("trip")
+    try:
+        # What the chosen dates should cost, and cheaper ones close by
+        result["price"] = price_calendar.quote(trip.destination_id, trip.startDate, trip.endDate)
+    except Exception as e:
+        # The trip exists either way; don't fail the request over an estimate
+        print(f"⚠️  Price estimate failed for trip {trip.trip_id}: {e}")
+    return result
+
+@app.get("/planning/tour")
+def api_plan_tour(ids: str, user_id: Optional[int] = None, round_trip: bool = True):
+    """Best order to visit several destinations (?ids=1,2,3), from user_id's home city if given"""
+    try:
+        dest_ids = parse_ids(ids, limit=tours.MAX_STOPS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        result = tours.plan_tour(dest_ids, user_id, round_trip)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@app.post("/planning/create-tour")
+def api_create_tour(request: CreateTourRequest):
+    """Create a multi-city trip, visiting the destinations in the best order"""
+    if len(request.destination_ids) > tours.MAX_STOPS:
+        raise HTTPException(status_code=400, detail=f"At most {tours.MAX_STOPS} destinations")
+    try:
+        result = tours.create_tour(
+            user_id=request.user_id,
+            max_budget=request.max_budget,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            dest_ids=request.destination_ids,
+            round_trip=request.round_trip
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "conflicts" in result:
+        raise HTTPException(status_code=409, detail={
+            "message": result["error"],
+            "conflicts": result["conflicts"]
+        })
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
 
 @app.get("/planning/suggestions/{user_id}")
 def api_get_suggestions(user_id: int):
@@ -143,80 +249,333 @@ def api_get_suggestions(user_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _render_json(result):
+    return JSONResponse(content=result).body
+
 @app.post("/planning/filter")
-def api_filter_suggestions(request: FilterRequest):
+async def api_filter_suggestions(request: FilterRequest):
     """Filter destinations based on criteria"""
     try:
-        result = planning.filter_suggestions(
+        # Rendered once per coalesced group, not once per client
+        body = await planning.filter_suggestions_async(
             user_id=request.user_id,
             budget=request.budget,
             destination=request.destination,
-            category=request.category
+            category=request.category,
+            encode=_render_json
+        )
+        return Response(content=body, media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/planning/nearby")
+def api_nearby_destinations(user_id: Optional[int] = None, lat: Optional[float] = None,
+                            lon: Optional[float] = None, k: int = 10,
+                            radius_km: Optional[float] = None):
+    """Get the k nearest destinations to a point or the user's home"""
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="lat and lon must be given together")
+    if lat is None and user_id is None:
+        raise HTTPException(status_code=400, detail="Provide lat/lon or user_id")
+    try:
+        result = planning.nearby_destinations(
+            user_id=user_id,
+            lat=lat,
+            lon=lon,
+            k=max(1, min(k, 100)),
+            radius_km=radius_km
         )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/planning/destinations/{dest_id}/stats")
+def api_destination_stats(dest_id: int):
+    """Get precomputed aggregates for one destination"""
+    try:
+        result = planning.destination_stats(dest_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@app.get("/planning/destinations/{dest_id}/price-calendar")
+def api_price_calendar(dest_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                       nights: int = Query(price_calendar.DEFAULT_NIGHTS, ge=1, le=price_calendar.MAX_NIGHTS),
+                       limit: int = Query(5, ge=1, le=50)):
+    """Cheapest trips of `nights` nights between start and end (default: the next 90 days)"""
+    try:
+        result = price_calendar.cheapest_windows(dest_id, start, end, nights, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        status = 404 if result["error"].startswith("Destination") else 400
+        raise HTTPException(status_code=status, detail=result["error"])
+    return result
+
+# ===== CATALOG BATCH ENDPOINTS =====
+
+def _multi_get(kind: str, ids: str):
+    try:
+        id_list = parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return catalog.multi_get(kind, id_list)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/destinations/autocomplete")
+def api_autocomplete_destinations(q: str, kind: Optional[str] = None, limit: int = 10):
+    """Most booked cities and countries with a word starting with q (kind=city|country)"""
+    if kind is not None and kind not in AUTOCOMPLETE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(AUTOCOMPLETE_KINDS)}")
+    try:
+        return {"query": q, "suggestions": destination_autocomplete.suggest(q, kind, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/destinations")
+def api_get_destinations(ids: str):
+    """Get several destinations at once (?ids=1,2,3)"""
+    return _multi_get("destinations", ids)
+
+@app.get("/food")
+def api_get_food(ids: str):
+    """Get several food places at once (?ids=1,2,3)"""
+    return _multi_get("food", ids)
+
+@app.get("/accommodations")
+def api_get_accommodations(ids: str):
+    """Get several accommodations at once (?ids=1,2,3)"""
+    return _multi_get("accommodations", ids)
+
+@app.get("/transport")
+def api_get_transport(ids: str):
+    """Get several transport options at once (?ids=1,2,3)"""
+    return _multi_get("transport", ids)
+
 # ===== TRIP ENDPOINTS =====
 
 @app.get("/trips/{user_id}")
 def api_get_user_trips(user_id: int):
     """Get all trips for a user"""
+    try:
+        return {"trips": dashboard.final_trips(user_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _bearer_user(authorization: Optional[str]) -> int:
+    """user_id of the request's bearer token; 401 without a valid one"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Bearer token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return decode_access_token(token)
+
+@app.get("/me/dashboard")
+def api_dashboard(authorization: Optional[str] = Header(None)):
+    """Profile, recent bookings, pending trips and suggestions for the signed-in user"""
+    user_id = _bearer_user(authorization)
+    try:
+        result = dashboard.build_dashboard(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@app.get("/trips/{user_id}/conflicts")
+def api_trip_conflicts(user_id: int, start: str, end: str):
+    """List the user's trips overlapping [start, end)"""
+    try:
+        result = planning.trip_conflicts(user_id, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@app.get("/itineraries/{final_trip_id}")
+def api_get_itinerary(final_trip_id: int):
+    """Day-by-day activities and meals for a booked trip"""
+    try:
+        result = itinerary.get_itinerary(final_trip_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+# ===== BOOKING ENDPOINTS =====
+
+def _enqueue(name: str, payload: dict):
     try:
         if db.is_closed():
             db.connect()
-        
-        trips = FinalTrip.select().where(FinalTrip.user_id == user_id)
-        
-        trips_list = []
-        for trip in trips:
-            trips_list.append({
-                "trip_id": trip.f_trip_id,
-                "destination": f"{trip.destination.city}, {trip.destination.country}",
-                "totalbudget": float(trip.totalbudget),
-                "startDate": str(trip.startDate),
-                "endDate": str(trip.endDate)
-            })
-        
-        return {"trips": trips_list}
+        job_id = jobs.enqueue(name, payload)
+        job_worker.wake()
+        return job_id
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if not db.is_closed():
             db.close()
 
-# ===== BOOKING ENDPOINTS =====
-
-@app.post("/booking/finalize/{user_id}/{filtered_suggestion_id}")
+@app.post("/booking/finalize/{user_id}/{filtered_suggestion_id}", status_code=202)
 def api_finalize_booking(user_id: int, filtered_suggestion_id: int):
-    """Finalize a trip booking"""
+    """Queue a trip booking; the result arrives on /events/{user_id} (or poll /jobs/{job_id})"""
+    job_id = _enqueue("finalize_trip", {
+        "user_id": user_id,
+        "filtered_suggestion_id": filtered_suggestion_id
+    })
+    return {"message": "Booking queued", "job_id": job_id}
+
+# ===== PAYMENT ENDPOINTS =====
+
+@app.post("/payment/checkout/{final_trip_id}", status_code=202)
+def api_checkout(final_trip_id: int):
+    """Queue payment for a trip; the result arrives on /events/{user_id} (or poll /jobs/{job_id})"""
+    job_id = _enqueue("checkout", {"final_trip_id": final_trip_id})
+    return {"message": "Payment queued", "job_id": job_id}
+
+# ===== EVENT STREAM =====
+
+@app.get("/events/{user_id}")
+async def api_user_events(user_id: int, last_event_id: Optional[str] = Header(None),
+                          authorization: Optional[str] = Header(None)):
+    """Server-sent booking and payment events for the signed-in user, instead of polling /jobs"""
+    if _bearer_user(authorization) != user_id:
+        raise HTTPException(status_code=403, detail="You can only follow your own events")
+    return StreamingResponse(
+        events.stream(user_id, last_event_id),
+        media_type="text/event-stream",
+        # No caching, and no buffering by nginx-style proxies
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ===== JOB ENDPOINTS =====
+
+@app.get("/jobs/{job_id}")
+def api_get_job(job_id: int):
+    """Get the status and result of a background job"""
     try:
-        result = booking.finalizeTrip(user_id, filtered_suggestion_id)
-        if result:
-            return {
-                "message": "Trip finalized successfully",
-                "trip_id": result.f_trip_id,
-                "total_budget": float(result.totalbudget)
-            }
-        else:
-            raise HTTPException(status_code=404, detail="Could not finalize trip")
+        if db.is_closed():
+            db.connect()
+        result = jobs.get_job(job_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not db.is_closed():
+            db.close()
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return result
 
-# ===== PAYMENT ENDPOINTS =====
+# ===== ADMIN ENDPOINTS =====
 
-@app.post("/payment/checkout/{final_trip_id}")
-def api_checkout(final_trip_id: int):
-    """Process payment for a trip"""
+def _require_admin(token: Optional[str]):
+    # Admin endpoints are off unless ADMIN_TOKEN is configured
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected or not token or not secrets.compare_digest(token, expected):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/export/final-trips")
+def api_export_final_trips(format: str = "csv", chunk_size: int = exports.CHUNK_SIZE,
+                           x_admin_token: Optional[str] = Header(None)):
+    """Stream every finalized trip with its user, destination, transport and accommodation"""
+    _require_admin(x_admin_token)
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(exports.FORMATS)}")
+    if format == "arrow" and not exports.arrow_available():
+        raise HTTPException(status_code=501, detail="Arrow export needs pyarrow on the server")
+    if not 100 <= chunk_size <= 100000:
+        raise HTTPException(status_code=400, detail="chunk_size must be between 100 and 100000")
+    media_type, extension = exports.FORMATS[format]
+    return StreamingResponse(
+        exports.stream_in_thread(format, chunk_size),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="final_trips.{extension}"'}
+    )
+
+
+def _analytics(fn, *args):
     try:
-        result = payment.checkout(final_trip_id)
-        if result:
-            return {"message": "Payment processed successfully"}
-        else:
-            raise HTTPException(status_code=400, detail="Payment failed")
+        if db.is_closed():
+            db.connect()
+        return fn(*args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not db.is_closed():
+            db.close()
+
+@app.get("/admin/analytics/destinations/{dest_id}/monthly")
+def api_destination_monthly(dest_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                            x_admin_token: Optional[str] = Header(None)):
+    """Bookings and revenue per month for one destination (dates as YYYY-MM-DD)"""
+    _require_admin(x_admin_token)
+    return {"destination_id": dest_id,
+            "months": _analytics(rollups.destination_monthly, dest_id, start, end)}
+
+@app.get("/admin/analytics/countries/{country}/weekly")
+def api_country_weekly(country: str, start: Optional[str] = None, end: Optional[str] = None,
+                       x_admin_token: Optional[str] = Header(None)):
+    """Bookings and revenue per week for one country"""
+    _require_admin(x_admin_token)
+    return {"country": country, "weeks": _analytics(rollups.country_weekly, country, start, end)}
+
+@app.get("/admin/analytics/top-destinations")
+def api_top_destinations(month: str, limit: int = 10, by: str = "booked_revenue",
+                         x_admin_token: Optional[str] = Header(None)):
+    """Best destinations of a month by bookings, booked_revenue or paid_revenue"""
+    _require_admin(x_admin_token)
+    if by not in rollups.MEASURES:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(rollups.MEASURES)}")
+    return {"month": month, "destinations": _analytics(rollups.top_destinations, month, min(limit, 100), by)}
+
+@app.get("/admin/analytics/consistency")
+def api_rollup_consistency(x_admin_token: Optional[str] = Header(None)):
+    """Compare the rollups with a full aggregate of final_trips (slow; for audits)"""
+    _require_admin(x_admin_token)
+    mismatches = _analytics(rollups.check)
+    return {"consistent": not mismatches, "mismatches": mismatches}
+
+@app.post("/admin/itineraries/build", status_code=202)
+def api_build_itineraries(x_admin_token: Optional[str] = Header(None)):
+    """Queue a batch job solving every missing or stale itinerary"""
+    _require_admin(x_admin_token)
+    job_id = _enqueue("build_itineraries", {})
+    return {"message": "Itinerary build queued", "job_id": job_id}
+
+@app.post("/admin/archive/run", status_code=202)
+def api_run_archive(x_admin_token: Optional[str] = Header(None)):
+    """Queue a run of the partition maintenance: new partitions, old months to cold storage"""
+    _require_admin(x_admin_token)
+    job_id = _enqueue("archive_partitions", {})
+    return {"message": "Archive run queued", "job_id": job_id}
+
+@app.get("/admin/metrics/coalescing")
+def api_coalescing_metrics(x_admin_token: Optional[str] = Header(None)):
+    """How many planning requests shared an in-flight computation (this worker only)"""
+    _require_admin(x_admin_token)
+    return {planning.filter_flight.name: planning.filter_flight.stats()}
+
+@app.get("/admin/metrics/admission")
+def api_admission_metrics(x_admin_token: Optional[str] = Header(None)):
+    """Slots in use, admitted/shed counts per class and rate-limited requests (this worker only)"""
+    _require_admin(x_admin_token)
+    return admission_control.stats()
+
+@app.get("/admin/metrics/events")
+def api_event_metrics(x_admin_token: Optional[str] = Header(None)):
+    """Open event streams and events delivered (this worker only)"""
+    _require_admin(x_admin_token)
+    return events.hub.stats()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("api_main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("api_main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,216 @@
+# archive.py - Old months of the partitioned tables in compressed cold storage
+#
+#   python archive.py run                 # archive every month due
+#   python archive.py trips <user_id>     # a user's bookings that left final_trips
+#
+# Once a monthly partition (database/partitions.py) is ARCHIVE_AFTER_MONTHS
+# old, archive_old() writes its rows to ARCHIVE_DIR/<partition>.jsonl.gz a
+# chunk at a time, records the file in archive_segments (with the users it
+# holds, for final_trips) and drops the partition. The file is written under
+# a temporary name and renamed once synced, and the partition is only
+# dropped if it still holds exactly the rows written, so a crash or a late
+# write leaves the month in place for the next run.
+#
+# older_final_trips() reads a user's bookings back from the SQLite month
+# tables and the cold files, so /trips/{user_id} answers the same whatever
+# has been moved; archived_final_trips() reads all of them, for exports.
+import gzip
+import json
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from peewee import chunked, SQL
+from database.database import (
+    db, connected, write_transaction, FinalTrip, Itinerary, ArchiveSegment, ArchiveSegmentUser
+)
+from database import partitions
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", 24))
+CHUNK_SIZE = 5000
+SEGMENT_CACHE = 64  # parsed final_trips segments kept in memory
+
+
+def _json(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Can't archive {type(value).__name__}")
+
+
+def _rows(name, pk):
+    """Every row of table `name` as a dict, in chunks by primary key"""
+    last = 0
+    while True:
+        cursor = db.execute_sql(
+            f'SELECT * FROM "{name}" WHERE "{pk}" > {db.param} ORDER BY "{pk}" LIMIT {db.param}',
+            (last, CHUNK_SIZE))
+        columns = [column[0] for column in cursor.description]
+        chunk = [dict(zip(columns, values)) for values in cursor.fetchall()]
+        if not chunk:
+            return
+        yield from chunk
+        last = chunk[-1][pk]
+
+
+def _write_segment(path, rows):
+    """Write rows as gzipped JSON lines to path, atomically; returns how many"""
+    temporary = path + ".tmp"
+    count = 0
+    with gzip.open(temporary, "wt", encoding="utf-8") as out:
+        for row in rows:
+            out.write(json.dumps(row, default=_json) + "\n")
+            count += 1
+    with open(temporary, "rb") as written:
+        os.fsync(written.fileno())
+    os.replace(temporary, path)
+    return count
+
+
+def read_segment(path):
+    with gzip.open(path, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def archive_partition(table, period, name):
+    """Move one monthly partition to a cold file; returns its rows, or None if it changed meanwhile"""
+    model, _ = partitions.policy(table)
+    pk = model._meta.primary_key.column_name
+    user_column = FinalTrip.user_id.column_name if model is FinalTrip else None
+    existing = ArchiveSegment.get_or_none((ArchiveSegment.table == table) & (ArchiveSegment.period == period))
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    # A month archived before gets a new file holding the old rows too
+    suffix = f"-{datetime.utcnow():%Y%m%d%H%M%S}" if existing else ""
+    path = os.path.abspath(os.path.join(ARCHIVE_DIR, f"{name}{suffix}.jsonl.gz"))
+    users = set()
+
+    def rows():
+        if existing is not None:
+            yield from read_segment(existing.path)
+        for row in _rows(name, pk):
+            if user_column:
+                users.add(row[user_column])
+            yield row
+
+    written = _write_segment(path, rows())
+    added = written - (existing.rows if existing else 0)
+    previous = existing.path if existing else None
+
+    with write_transaction():
+        if not partitions.is_sqlite():
+            # Nothing may land in the partition between the count and the drop
+            db.execute_sql(f'LOCK TABLE "{name}" IN EXCLUSIVE MODE')
+        now, = db.execute_sql(f'SELECT COUNT(*) FROM "{name}"').fetchone()
+        if now == added:
+            segment = existing or ArchiveSegment(table=table, period=period)
+            segment.path, segment.rows, segment.bytes = path, written, os.path.getsize(path)
+            segment.save()
+            for batch in chunked(sorted(users), 500):
+                (ArchiveSegmentUser
+                 .insert_many([{"segment": segment, "user_id": user_id} for user_id in batch])
+                 .on_conflict_ignore()
+                 .execute())
+            if model is FinalTrip:
+                # Their itineraries can be solved again if ever needed
+                (Itinerary
+                 .delete()
+                 .where(SQL(f'"{Itinerary.final_trip.column_name}" IN (SELECT "{pk}" FROM "{name}")'))
+                 .execute())
+            partitions.drop_partition(table, name)
+    if now != added:
+        os.remove(path)
+        return None
+    if previous:
+        os.remove(previous)
+    _segment_users.cache_clear()
+    return added
+
+
+@connected
+def archive_old(after_months=ARCHIVE_AFTER_MONTHS):
+    """Archive every partition whose month is after_months old; returns {table: rows archived}"""
+    cutoff = partitions.add_months(partitions.month_start(date.today()), -after_months)
+    archived = {}
+    for model, _ in partitions.POLICIES:
+        table = model._meta.table_name
+        archived[table] = 0
+        for period, name in partitions.partitions(table):
+            if period >= cutoff:
+                break
+            rows = archive_partition(table, period, name)
+            if rows is None:
+                print(f"⚠️  {name} changed while archiving; it will be retried")
+            else:
+                archived[table] += rows
+    return archived
+
+
+# --- Reads ---
+
+@lru_cache(maxsize=SEGMENT_CACHE)
+def _segment_users(path):
+    """{user_id: [row]} of one final_trips segment"""
+    by_user = {}
+    for row in read_segment(path):
+        by_user.setdefault(row[FinalTrip.user_id.column_name], []).append(row)
+    return by_user
+
+
+def _final_trip(row):
+    trip = FinalTrip()
+    for field in FinalTrip._meta.sorted_fields:
+        if field.column_name in row:
+            trip.__data__[field.name] = field.python_value(row[field.column_name])
+    return trip
+
+
+@connected
+def older_final_trips(user_id: int):
+    """The user's FinalTrips moved out of final_trips, latest start date first"""
+    trips = []
+    if partitions.is_sqlite():
+        user_column = FinalTrip.user_id.column_name
+        for _, name in partitions.partitions("final_trips"):
+            cursor = db.execute_sql(f'SELECT * FROM "{name}" WHERE "{user_column}" = ?', (user_id,))
+            columns = [column[0] for column in cursor.description]
+            trips += [_final_trip(dict(zip(columns, values))) for values in cursor.fetchall()]
+    segments = (ArchiveSegment
+                .select(ArchiveSegment.path)
+                .join(ArchiveSegmentUser)
+                .where((ArchiveSegment.table == "final_trips") & (ArchiveSegmentUser.user_id == user_id)))
+    for segment in segments:
+        trips += [_final_trip(row) for row in _segment_users(segment.path).get(user_id, ())]
+    trips.sort(key=lambda trip: (trip.startDate, trip.f_trip_id), reverse=True)
+    return trips
+
+
+def archived_final_trips():
+    """Rows (dicts) of every FinalTrip moved out of final_trips, oldest month first"""
+    if partitions.is_sqlite():
+        for _, name in partitions.partitions("final_trips"):
+            yield from _rows(name, FinalTrip._meta.primary_key.column_name)
+    if not ArchiveSegment.table_exists():  # before migration 9
+        return
+    segments = (ArchiveSegment
+                .select(ArchiveSegment.path)
+                .where(ArchiveSegment.table == "final_trips")
+                .order_by(ArchiveSegment.period))
+    for segment in list(segments):
+        yield from read_segment(segment.path)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if command == "run":
+        for table, rows in archive_old().items():
+            print(f"✅ {table}: {rows} rows archived")
+    elif command == "trips":
+        for trip in older_final_trips(int(sys.argv[2])):
+            print(f"  #{trip.f_trip_id}  {trip.startDate} → {trip.endDate}  {trip.totalbudget}")
+    else:
+        print(f"Unknown command {command!r}; use run or trips <user_id>")
+        sys.exit(2)
@@ -6,7 +6,6 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import HTTPException, status
 from database.database import User, db 
 from datetime import datetime, timezone, timedelta
-import jwt
 import hashlib
 import secrets
 
@@ -24,9 +23,23 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     
+    import jwt  # deferred: only needed when issuing a token
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> int:
+    """user_id from a token issued by login or signup; 401 if it isn't valid"""
+    import jwt
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return int(payload["user_id"])
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password against hash with multiple format support"""
     # Try modern hashing first (bcrypt, etc.)
@@ -7,7 +7,6 @@ from fastapi import HTTPException, status
 # Import models and db connection from your files
 from database.database import User, db 
 from datetime import datetime, timedelta
-import jwt 
 import hashlib
 import secrets
 
@@ -53,10 +52,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
             return secrets.compare_digest(computed_hash, stored_hash)
         return False
 
-# --- Security Configuration ---
-SECRET_KEY = "YOUR_SUPER_SECRET_KEY" 
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# --- Security Configuration (shared with login.py, so both issue the same tokens) ---
+from auth.login import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Creates JWT token with expiration time"""
@@ -66,6 +63,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    import jwt  # deferred: only needed when issuing a token
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
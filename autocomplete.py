@@ -0,0 +1,222 @@
+# autocomplete.py - In-memory prefix index for destination typeahead
+#
+# Cities and countries are normalized (accents stripped, case-folded,
+# whitespace collapsed) and every word start becomes a key, so "par",
+# "new y" and "york" all find what they should. Keys live in one sorted
+# list: a prefix is a contiguous slice of it, found by two bisects. Ranking
+# by popularity (bookings, from the monthly rollups) would still mean
+# scanning the slice, so for every prefix whose slice is larger than
+# SCAN_LIMIT the top TOP_K entries are worked out once at build time, by
+# walking the implicit trie of the sorted keys bottom-up and merging each
+# node's children. Queries never touch the database.
+import bisect
+import heapq
+import os
+import threading
+import time
+import unicodedata
+from peewee import fn
+from database.database import db, Destination, DestinationMonthRollup
+from cache_bus import bus
+
+TOP_K = 10
+SCAN_LIMIT = 64  # prefixes matching at most this many keys are ranked on the fly
+REFRESH_SECONDS = int(os.getenv("AUTOCOMPLETE_REFRESH_SECONDS", 600))
+KINDS = ("city", "country")
+
+
+def normalize(text):
+    """Lower-case, accent-free, single-spaced form used for matching"""
+    text = text or ""
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over (label, popularity) entries of one kind"""
+
+    def __init__(self, entries, k=TOP_K, scan_limit=SCAN_LIMIT):
+        """entries: list of (label, popularity, payload), payload being what a query returns"""
+        self.k = k
+        self.scan_limit = scan_limit
+        self.payloads = [payload for _, _, payload in entries]
+        labels = [normalize(label) for label, _, _ in entries]
+        # One int per entry: higher popularity first, then alphabetical
+        order = sorted(range(len(entries)), key=labels.__getitem__)
+        self._rank = [0] * len(entries)
+        for position, entry in enumerate(order):
+            self._rank[entry] = entries[entry][1] * len(entries) + len(entries) - position
+        keys, entry_of = [], []
+        for entry, label in enumerate(labels):
+            keys.append(label)
+            entry_of.append(entry)
+            start = label.find(" ")
+            while start != -1:
+                keys.append(label[start + 1:])
+                entry_of.append(entry)
+                start = label.find(" ", start + 1)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.entry_of = [entry_of[i] for i in order]
+        self.top = {}  # prefix -> best entries, for prefixes matching > scan_limit keys
+        if self.keys:
+            self._build(0, len(self.keys), 0, "")
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def _best(self, entries):
+        return heapq.nlargest(self.k, set(entries), key=self._rank.__getitem__)
+
+    def _build(self, lo, hi, depth, prefix):
+        """Best entries among keys[lo:hi] (all starting with prefix)"""
+        if hi - lo <= self.scan_limit:
+            return self._best(self.entry_of[lo:hi])
+        keys = self.keys
+        candidates = []
+        i = lo
+        # Keys equal to the prefix sort first
+        while i < hi and len(keys[i]) == depth:
+            candidates.append(self.entry_of[i])
+            i += 1
+        while i < hi:
+            child = prefix + keys[i][depth]
+            j = bisect.bisect_left(keys, child[:-1] + chr(ord(child[-1]) + 1), i, hi)
+            candidates.extend(self._build(i, j, depth + 1, child))
+            i = j
+        best = self._best(candidates)
+        self.top[prefix] = best
+        return best
+
+    def search(self, query, limit=TOP_K):
+        """Payloads of the most popular entries with a word starting with query"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if prefix in self.top:
+            best = self.top[prefix]
+        else:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+            best = self._best(self.entry_of[lo:hi])
+        return [self.payloads[entry] for entry in best[:limit]]
+
+
+def load_entries():
+    """(cities, countries) entries for PrefixIndex, read from the database"""
+    popularity = dict(DestinationMonthRollup
+                      .select(DestinationMonthRollup.destination, fn.SUM(DestinationMonthRollup.bookings))
+                      .group_by(DestinationMonthRollup.destination)
+                      .tuples())
+    cities = {}     # (city, country) -> [bookings, first dest_id]
+    countries = {}  # country -> [bookings, destinations]
+    rows = (Destination
+            .select(Destination.dest_id, Destination.city, Destination.country)
+            .order_by(Destination.dest_id)
+            .tuples()
+            .iterator())
+    for dest_id, city, country in rows:
+        bookings = int(popularity.get(dest_id) or 0)
+        entry = cities.setdefault((city, country), [0, dest_id])
+        entry[0] += bookings
+        entry = countries.setdefault(country, [0, 0])
+        entry[0] += bookings
+        entry[1] += 1
+    city_entries = [(city, bookings, {"type": "city", "city": city, "country": country, "dest_id": dest_id})
+                    for (city, country), (bookings, dest_id) in cities.items()]
+    country_entries = [(country, bookings, {"type": "country", "country": country, "destinations": count})
+                       for country, (bookings, count) in countries.items()]
+    return city_entries, country_entries
+
+
+class Autocomplete:
+    """Per-process city and country indexes, rebuilt in the background.
+
+    The first query builds them; afterwards a destination change (from the
+    cache bus) or an index older than REFRESH_SECONDS starts a rebuild on a
+    thread while queries keep using the current indexes.
+    """
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._indexes = None  # kind -> PrefixIndex
+        self._built_at = 0.0
+        self._dirty = False
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def invalidate(self, *args):
+        self._dirty = True
+
+    def rebuild(self):
+        """Build fresh indexes from the database and swap them in"""
+        self._dirty = False
+        connection_was_open = not db.is_closed()
+        if not connection_was_open:
+            db.connect()
+        try:
+            cities, countries = load_entries()
+        finally:
+            if not connection_was_open:
+                db.close()
+        self._indexes = {"city": PrefixIndex(cities), "country": PrefixIndex(countries)}
+        self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"❌ Autocomplete rebuild failed: {e}")
+        finally:
+            self._rebuilding = False
+
+    def indexes(self):
+        with self._lock:
+            if self._indexes is None:
+                self.rebuild()
+            elif (self._dirty or time.monotonic() - self._built_at > self.refresh_seconds) \
+                    and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild_in_background, name="autocomplete",
+                                 daemon=True).start()
+            return self._indexes
+
+    def warm(self):
+        """Build the indexes on a thread so the first query does not have to"""
+        def build():
+            try:
+                self.indexes()
+            except Exception as e:
+                print(f"❌ Autocomplete build failed: {e}")
+        threading.Thread(target=build, name="autocomplete", daemon=True).start()
+
+    def suggest(self, query, kind=None, limit=TOP_K):
+        """Most booked cities and/or countries with a word starting with query"""
+        indexes = self.indexes()
+        limit = max(1, min(limit, TOP_K))
+        if kind is not None:
+            return indexes[kind].search(query, limit)
+        # Both kinds: interleave so neither crowds the other out
+        cities = indexes["city"].search(query, limit)
+        countries = indexes["country"].search(query, limit)
+        merged = []
+        for i in range(max(len(cities), len(countries))):
+            merged.extend(match[i] for match in (countries, cities) if i < len(match))
+        return merged[:limit]
+
+    def stats(self):
+        if self._indexes is None:
+            return {"built": False}
+        return {
+            "built": True,
+            "age_seconds": round(time.monotonic() - self._built_at, 1),
+            **{f"{kind}_entries": len(index) for kind, index in self._indexes.items()},
+            **{f"{kind}_precomputed_prefixes": len(index.top) for kind, index in self._indexes.items()},
+        }
+
+
+# Shared per-process instance, built on first use
+destination_autocomplete = Autocomplete()
+bus.subscribe("destinations", destination_autocomplete.invalidate)
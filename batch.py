@@ -0,0 +1,304 @@
+# batch.py - Scripted, concurrent runs of the CLI flows
+#
+#   python main.py --batch scenario.json [--concurrency 20] [--report run.json]
+#   python main.py --batch scenario.json --baseline last_run.json
+#
+# A scenario is JSON: either a step template run for N virtual users,
+#
+#   {"users": 50,
+#    "user": {"email": "load{n}-{run}@example.com", "username": "load{n}_{run}",
+#             "password": "secret123", "city": "Lahore", "country": "Pakistan"},
+#    "steps": [{"step": "signup"},
+#              {"step": "login"},
+#              {"step": "plan", "max_budget": 3000, "start_date": "2030-01-01",
+#               "end_date": "2030-01-05", "stagger_days": 7},
+#              {"step": "suggest"},
+#              {"step": "filter", "budget": 200},
+#              {"step": "finalize", "pick": 1},
+#              {"step": "pay"}]}
+#
+# or explicit "sessions": [{"user": {...}, "steps": [...]}, ...]. Strings may
+# use {n} (user number) and {run} (8 hex digits, unique per run). Steps call
+# the same functions the interactive menus do, minus input() and screen
+# handling. A failed step ends its session unless it sets "optional": true.
+import argparse
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from fastapi import HTTPException
+from auth.signup import signup
+from auth.login import login
+from database.database import db, Trip
+import planning
+import booking
+import payment
+
+# p95 may grow by this fraction over the baseline before it counts as a regression
+REGRESSION_TOLERANCE = 0.25
+
+
+class StepFailed(Exception):
+    """A step ran but did not achieve its goal (e.g. no rooms left)"""
+
+
+class Session:
+    """State one virtual user carries from step to step"""
+
+    def __init__(self, n, user):
+        self.n = n
+        self.user = user
+        self.user_id = None
+        self.trip_id = None
+        self.destinations = []
+        self.final_trip_id = None
+
+
+def _fill(value, context):
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, dict):
+        return {key: _fill(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, context) for item in value]
+    return value
+
+
+def load_sessions(scenario, run_id):
+    """Expand a scenario into [(Session, steps)]"""
+    if "sessions" in scenario:
+        specs = scenario["sessions"]
+    else:
+        specs = [{"user": scenario.get("user", {}), "steps": scenario["steps"]}
+                 for _ in range(int(scenario.get("users", 1)))]
+    sessions = []
+    for n, spec in enumerate(specs, 1):
+        context = {"n": n, "run": run_id}
+        sessions.append((Session(n, _fill(spec.get("user", {}), context)),
+                         _fill(spec["steps"], context)))
+    return sessions
+
+
+# --- Steps ---
+
+def _auth(result):
+    if not result or "user_id" not in result:
+        raise StepFailed("authentication failed")
+    return result["user_id"]
+
+
+def step_signup(session, args):
+    user = dict(session.user, **args)
+    session.user_id = _auth(signup(user["email"], user["username"], user["password"],
+                                   user["city"], user["country"]))
+
+
+def step_login(session, args):
+    user = dict(session.user, **args)
+    session.user_id = _auth(login(user["email"], user["password"]))
+
+
+def step_plan(session, args):
+    start = date.fromisoformat(args["start_date"])
+    end = date.fromisoformat(args["end_date"])
+    # Spread users over the calendar so they don't all want the same nights
+    shift = timedelta(days=args.get("stagger_days", 0) * (session.n - 1))
+    result = planning.create_trip(
+        user_id=session.user_id,
+        max_budget=float(args.get("max_budget", 5000)),
+        start_date=str(start + shift),
+        end_date=str(end + shift),
+        destination_city=args.get("destination_city"),
+        destination_country=args.get("destination_country")
+    )
+    if "error" in result:
+        raise StepFailed(result["error"])
+    session.trip_id = result["trip_id"]
+
+
+def step_suggest(session, args):
+    result = planning.show_random_suggestions(session.user_id)
+    session.destinations = result.get("suggestions", [])
+
+
+def step_filter(session, args):
+    result = planning.filter_suggestions(
+        user_id=session.user_id,
+        budget=args.get("budget"),
+        destination=args.get("destination"),
+        category=args.get("category")
+    )
+    session.destinations = result.get("destinations", [])
+    if not session.destinations:
+        raise StepFailed("no destinations matched")
+
+
+def step_finalize(session, args):
+    pick = int(args.get("pick", 1))
+    if not 1 <= pick <= len(session.destinations):
+        raise StepFailed(f"no destination #{pick} to pick")
+    with db.connection_context():
+        trip = Trip.get(Trip.trip_id == session.trip_id)
+        suggestion = booking.create_filtered_suggestion(trip, session.destinations[pick - 1])
+    final_trip = booking.finalizeTrip(session.user_id, suggestion.f_suggest_id)
+    if final_trip is None:
+        raise StepFailed("booking failed")
+    session.final_trip_id = final_trip.f_trip_id
+
+
+def step_pay(session, args):
+    if not payment.checkout(session.final_trip_id):
+        raise StepFailed("payment failed")
+
+
+STEPS = {
+    "signup": step_signup,
+    "login": step_login,
+    "plan": step_plan,
+    "suggest": step_suggest,
+    "filter": step_filter,
+    "finalize": step_finalize,
+    "pay": step_pay,
+}
+
+
+# --- Running ---
+
+class Recorder:
+    """Thread-safe per-step timings and failure reasons"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}   # step -> [seconds]
+        self.failures = {}  # step -> {reason: count}
+
+    def record(self, step, seconds, error=None):
+        with self._lock:
+            self.timings.setdefault(step, []).append(seconds)
+            if error is not None:
+                reasons = self.failures.setdefault(step, {})
+                reasons[error] = reasons.get(error, 0) + 1
+
+
+def run_session(session, steps, recorder):
+    for spec in steps:
+        name = spec["step"]
+        args = {key: value for key, value in spec.items() if key not in ("step", "optional")}
+        started = time.perf_counter()
+        error = None
+        try:
+            STEPS[name](session, args)
+        except (StepFailed, HTTPException) as e:
+            error = str(getattr(e, "detail", e))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        recorder.record(name, time.perf_counter() - started, error)
+        if error is not None and not spec.get("optional"):
+            return False
+    return True
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(recorder, wall_seconds, sessions, completed):
+    steps = {}
+    for name, timings in recorder.timings.items():
+        ordered = sorted(timings)
+        failed = sum(recorder.failures.get(name, {}).values())
+        steps[name] = {
+            "count": len(ordered),
+            "failed": failed,
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+            "failures": recorder.failures.get(name, {}),
+        }
+    return {
+        "sessions": sessions,
+        "completed": completed,
+        "wall_seconds": round(wall_seconds, 2),
+        "sessions_per_second": round(sessions / wall_seconds, 2) if wall_seconds else None,
+        "steps": steps,
+    }
+
+
+def run(scenario, concurrency=10, quiet=True):
+    """Run every session of a scenario; returns the timing report"""
+    run_id = format(int(time.time()), "x")  # short enough for 20-character usernames
+    sessions = load_sessions(scenario, run_id)
+    unknown = {spec["step"] for _, steps in sessions for spec in steps} - set(STEPS)
+    if unknown:
+        raise ValueError(f"Unknown steps: {', '.join(sorted(unknown))}")
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    # The flows print as they go; keep the report readable
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    with output, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda item: run_session(item[0], item[1], recorder), sessions))
+    return summarize(recorder, time.perf_counter() - started, len(sessions), sum(results))
+
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Regressions against a baseline report: slower p95 or more failures"""
+    regressions = []
+    for name, stats in report["steps"].items():
+        before = baseline.get("steps", {}).get(name)
+        if not before:
+            continue
+        if before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name} p95 regressed: {before['p95_ms']:.1f}ms -> {stats['p95_ms']:.1f}ms")
+        if stats["failed"] / stats["count"] > before["failed"] / before["count"]:
+            regressions.append(f"{name} failures rose: {before['failed']}/{before['count']} -> "
+                               f"{stats['failed']}/{stats['count']}")
+    return regressions
+
+
+def print_report(report, step_order):
+    print(f"\n📊 {report['completed']}/{report['sessions']} sessions completed in "
+          f"{report['wall_seconds']}s ({report['sessions_per_second']} sessions/s)\n")
+    print(f"{'step':<10}{'count':>7}{'failed':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in step_order:
+        stats = report["steps"].get(name)
+        if stats is None:
+            continue
+        print(f"{name:<10}{stats['count']:>7}{stats['failed']:>8}"
+              + "".join(f"{stats[key]:>8.1f}ms" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")))
+        for reason, count in stats["failures"].items():
+            print(f"   ❌ {count} x {reason}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run CLI flows from a scenario file")
+    parser.add_argument("--batch", required=True, metavar="SCENARIO", help="scenario JSON file")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--report", help="write the timing report here as JSON")
+    parser.add_argument("--baseline", help="earlier report to compare p95 timings and failures against")
+    parser.add_argument("--verbose", action="store_true", help="show the flows' own output")
+    args = parser.parse_args(argv)
+
+    with open(args.batch) as f:
+        scenario = json.load(f)
+    report = run(scenario, args.concurrency, quiet=not args.verbose)
+    order = list(dict.fromkeys(spec["step"] for _, steps in load_sessions(scenario, "")
+                               for spec in steps))
+    print_report(report, order)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f))
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
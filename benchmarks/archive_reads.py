@@ -0,0 +1,167 @@
+# benchmarks/archive_reads.py - Partition rolling and archival: hot table size and read results
+#
+#   python benchmarks/archive_reads.py [--trips 20000] [--users 200]
+#
+# Fills a throwaway SQLite database (or DATABASE_URL) with --trips bookings
+# starting over the last five years and the next few months, with their
+# filtered suggestions and suggestions. Reads every user's /trips list,
+# then rolls months older than HOT_MONTHS out of the main tables and
+# archives those older than ARCHIVE_AFTER_MONTHS to gzip files, and reads
+# again. Exits 1 unless the lists and the CSV export are identical and the
+# rollups still match final_trips.
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+workdir = tempfile.mkdtemp()
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'archive.db')
+os.environ.setdefault('ARCHIVE_DIR', os.path.join(workdir, 'archive'))
+
+from peewee import chunked  # noqa: E402
+from database.database import (  # noqa: E402
+    db, User, Destination, Trip, Food, Accommodation, Transport, Suggestion, FilteredSuggestion,
+    FinalTrip, DestinationMonthRollup, CountryWeekRollup, ArchiveSegment
+)
+from database import migrations, partitions  # noqa: E402
+from datetime import time as clock  # noqa: E402
+import archive  # noqa: E402
+import dashboard  # noqa: E402
+import exports  # noqa: E402
+import rollups  # noqa: E402
+
+
+def insert(model, rows):
+    for batch in chunked(rows, 500):
+        model.insert_many(batch).execute()
+
+
+def setup(trips, users, rng):
+    migrations.upgrade()
+    with db.atomic():
+        insert(User, [{"user_name": f"user{i}", "email": f"user{i}-{rng.random()}@example.com",
+                       "city": "Lyon", "country": "France"} for i in range(users)])
+        user_ids = [user_id for user_id, in User.select(User.user_id).tuples()]
+        insert(Destination, [{"city": f"City{i}", "country": rng.choice(["France", "Italy", "Spain"]),
+                              "description": ""} for i in range(50)])
+        dest_ids = [dest_id for dest_id, in Destination.select(Destination.dest_id).tuples()]
+        food = Food.create(name="Bistro", location="", rating=4, destination=dest_ids[0])
+        acco = Accommodation.create(name="Hotel", type=1, rating=4, destination=dest_ids[0])
+        transport = Transport.create(originCity="Lyon", originCountry="France", destCity="City0",
+                                     destCountry="France", transportType=1, cost=80, time=clock(9))
+        first = date.today() - timedelta(days=5 * 365)
+        plans = []
+        for _ in range(trips):
+            start = first + timedelta(days=rng.randrange(5 * 365 + 90))
+            plans.append({"user": rng.choice(user_ids), "destination": rng.choice(dest_ids),
+                          "maxBudget": 2000, "startDate": start,
+                          "endDate": start + timedelta(days=rng.randint(2, 13))})
+        insert(Trip, plans)
+        trip_rows = list(Trip.select().order_by(Trip.trip_id).limit(trips).tuples())
+        parts = {"food": food, "transport": transport, "accommodation": acco}
+        columns = [field.name for field in Trip._meta.sorted_fields]
+        trip_rows = [dict(zip(columns, row)) for row in trip_rows]
+        insert(Suggestion, [dict(parts, trip=row["trip_id"], dailybudget=100, destination=row["destination"],
+                                 trip_start=row["startDate"]) for row in trip_rows for _ in range(2)])
+        insert(FilteredSuggestion, [dict(parts, trip=row["trip_id"], totalbudget=700, dailybudget=100,
+                                         destination=row["destination"], trip_start=row["startDate"])
+                                    for row in trip_rows])
+        suggestions = FilteredSuggestion.select(FilteredSuggestion.f_suggest_id, FilteredSuggestion.trip)
+        by_trip = {trip_id: f_suggest_id for f_suggest_id, trip_id in suggestions.tuples()}
+        insert(FinalTrip, [dict(parts, f_suggest=by_trip[row["trip_id"]], destination=row["destination"],
+                                user_id=row["user"], totalbudget=round(rng.uniform(300, 3000), 2),
+                                startDate=row["startDate"], endDate=row["endDate"])
+                           for row in trip_rows])
+    rollups.rebuild()
+    return user_ids
+
+
+def read_all(user_ids):
+    started = time.perf_counter()
+    lists = {user_id: dashboard.final_trips(user_id) for user_id in user_ids}
+    return lists, (time.perf_counter() - started) * 1000 / len(user_ids)
+
+
+def latest(user_ids, limit=5):
+    timings = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        dashboard.final_trips(user_id, limit=limit)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def exported():
+    out = io.BytesIO()
+    exports.export(out, "csv")
+    header, *lines = out.getvalue().decode().splitlines()
+    return [header] + sorted(lines)
+
+
+def counts():
+    return {model._meta.table_name: model.select().count() for model, _ in partitions.POLICIES}
+
+
+def stored_rollups():
+    # Float sums differ in the last digits with the order rows are added in
+    return [sorted(tuple(round(value, 2) if isinstance(value, float) else value for value in row)
+                   for row in model.select().tuples())
+            for model in (DestinationMonthRollup, CountryWeekRollup)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trips", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with db.connection_context():
+        user_ids = setup(args.trips, args.users, rng)
+        before_counts = counts()
+        before, full_ms = read_all(user_ids)
+        before_latest = latest(user_ids)
+        before_rollups = stored_rollups()
+        before_export = exported()
+        print(f"before    rows {before_counts}")
+        print(f"          all trips {full_ms:.2f} ms/user, latest 5 {before_latest:.2f} ms")
+
+        started = time.perf_counter()
+        rolled = partitions.roll()
+        roll_s = time.perf_counter() - started
+        started = time.perf_counter()
+        archived = archive.archive_old()
+        archive_s = time.perf_counter() - started
+        segments = list(ArchiveSegment.select())
+        print(f"rolled    {rolled} in {roll_s:.2f}s")
+        print(f"archived  {archived} in {archive_s:.2f}s, {len(segments)} files, "
+              f"{sum(segment.bytes for segment in segments) / 1e6:.1f} MB")
+
+        after_counts = counts()
+        after, full_ms = read_all(user_ids)
+        after_latest = latest(user_ids)
+        print(f"after     rows {after_counts}")
+        print(f"          all trips {full_ms:.2f} ms/user, latest 5 {after_latest:.2f} ms")
+
+        same_export = exported() == before_export
+        print(f"export    {len(before_export) - 1} trips, unchanged by archival: {same_export}")
+
+        rollups.rebuild()
+        mismatches = rollups.check()
+        same_rollups = stored_rollups() == before_rollups
+        print(f"rollups   unchanged by archival and rebuild: {same_rollups}, "
+              f"{len(mismatches)} mismatches with final_trips")
+
+    same = before == after
+    ok = same and same_export and same_rollups and not mismatches
+    print("✅ Reads, export and rollups unchanged by archival" if ok else
+          f"❌ {'Trip lists' if not same else 'Export' if not same_export else 'Rollups'} changed by archival")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,87 @@
+# benchmarks/autocomplete_latency.py - Typeahead latency of the prefix index at catalog scale
+#
+#   python benchmarks/autocomplete_latency.py [--destinations 1000000] [--queries 20000]
+#
+# Builds the city index over --destinations synthetic names with
+# Zipf-like booking counts (no database involved), then times lookups of
+# prefixes of 1 to 8 characters taken from real names, the way a user
+# types them. A full scan over the names, which is what a per-keystroke
+# LIKE query amounts to, is timed on a few queries for comparison.
+# Exits 1 if p99 is over --budget-ms.
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'autocomplete.db')
+
+from autocomplete import PrefixIndex, normalize  # noqa: E402
+
+SYLLABLES = ["ba", "ca", "da", "el", "fa", "go", "ha", "is", "ja", "ka", "lo", "ma", "na", "or",
+             "pa", "qu", "ro", "sa", "ta", "ul", "va", "wa", "xe", "yo", "za", "an", "be", "ri"]
+PREFIXES = ["", "", "", "", "San ", "New ", "Port ", "Saint-", "Los ", "El "]
+
+
+def synthetic_entries(count, rng):
+    entries = []
+    for i in range(count):
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        city = rng.choice(PREFIXES) + name
+        bookings = int(1000 / (1 + rng.paretovariate(1.2))) if rng.random() < 0.3 else 0
+        entries.append((city, bookings, {"type": "city", "city": city, "dest_id": i + 1}))
+    return entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--destinations", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    entries = synthetic_entries(args.destinations, rng)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    index = PrefixIndex(entries)
+    build_seconds = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"Index over {len(index)} cities ({len(index.keys)} keys): built in {build_seconds:.1f}s, "
+          f"{len(index.top)} prefixes precomputed, ~{(rss_after - rss_before) / 1024:.0f} MiB")
+
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(entries)[0]
+        queries.append(name[:rng.randint(1, min(8, len(name)))])
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    print(f"search         p50 {pct(0.5) * 1000:.0f}us  p95 {pct(0.95) * 1000:.0f}us  "
+          f"p99 {pct(0.99) * 1000:.0f}us  max {latencies[-1]:.2f}ms")
+
+    names = [normalize(city) for city, _, _ in entries]
+    started = time.perf_counter()
+    for query in queries[:20]:
+        prefix = normalize(query)
+        matches = [i for i, name in enumerate(names) if prefix in name]
+        sorted(matches, key=lambda i: -entries[i][1])[:10]
+    scan_ms = (time.perf_counter() - started) / 20 * 1000
+    print(f"full scan      {scan_ms:.0f}ms per query ({scan_ms / pct(0.5):.0f}x the index p50)")
+
+    ok = pct(0.99) <= args.budget_ms
+    print("✅ Within budget" if ok else f"❌ Over the {args.budget_ms}ms p99 budget")
+    sys.exit(0 if ok else 1)
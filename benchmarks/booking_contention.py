@@ -0,0 +1,102 @@
+# benchmarks/booking_contention.py - Many clients racing for the same rooms
+#
+#   python benchmarks/booking_contention.py [--clients 200] [--attempts 20]
+#
+# Uses DATABASE_URL if set, otherwise a throwaway SQLite file. Reports
+# bookings/second and fails if any night ends up overbooked.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'contention.db')
+
+from database.database import db, Destination, Accommodation, RoomInventory  # noqa: E402
+import inventory  # noqa: E402
+
+
+def setup(properties, rooms):
+    db.create_tables([Destination, Accommodation, RoomInventory], safe=True)
+    dest = Destination.create(city="Benchmark", country="Nowhere", description="contention test")
+    return [Accommodation.create(name=f"Popular {i}", type=1, rating=5.0, rooms=rooms,
+                                 destination=dest).acco_id
+            for i in range(properties)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--attempts", type=int, default=20, help="bookings tried per client")
+    parser.add_argument("--properties", type=int, default=5)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--days", type=int, default=14, help="width of the date window")
+    args = parser.parse_args()
+
+    acco_ids = setup(args.properties, args.rooms)
+    first_night = date(2030, 1, 1)
+    booked = Counter()      # (acco_id, night) -> rooms we were told we got
+    outcomes = Counter()
+    lock = threading.Lock()
+    start_gate = threading.Barrier(args.clients)
+
+    def client(seed):
+        rng = random.Random(seed)
+        start_gate.wait()
+        for _ in range(args.attempts):
+            acco_id = rng.choice(acco_ids)
+            start = first_night + timedelta(days=rng.randrange(args.days))
+            end = start + timedelta(days=rng.randint(1, 4))
+            try:
+                # Check a pooled connection out per booking, like a request would
+                with db.connection_context():
+                    inventory.reserve(acco_id, start, end)
+            except inventory.NoAvailability:
+                result = "sold_out"
+            except Exception as e:
+                result = f"error: {type(e).__name__}"
+            else:
+                result = "booked"
+                with lock:
+                    for night in inventory.stay_nights(start, end):
+                        booked[(acco_id, night)] += 1
+            with lock:
+                outcomes[result] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    # Every night must match what clients were promised and stay within capacity
+    overbooked = mismatched = 0
+    for row in RoomInventory.select():
+        if row.booked_rooms > row.total_rooms:
+            overbooked += 1
+        if row.booked_rooms != booked.get((row.accommodation_id, row.night), 0):
+            mismatched += 1
+
+    attempts = sum(outcomes.values())
+    print(f"Backend:       {type(db).__name__}")
+    print(f"Clients:       {args.clients} x {args.attempts} attempts on {args.properties} properties "
+          f"({args.rooms} rooms, {args.days}-day window)")
+    print(f"Outcomes:      {dict(outcomes)}")
+    print(f"Elapsed:       {elapsed:.2f}s")
+    print(f"Attempts/sec:  {attempts / elapsed:,.0f}")
+    print(f"Bookings/sec:  {outcomes['booked'] / elapsed:,.0f}")
+    print(f"Overbooked nights: {overbooked}, ledger mismatches: {mismatched}")
+    sys.exit(1 if overbooked or mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
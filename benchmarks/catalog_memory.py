@@ -0,0 +1,101 @@
+# benchmarks/catalog_memory.py - Memory of N workers: own catalog copies vs one mapped snapshot
+#
+#   python benchmarks/catalog_memory.py [--destinations 200000] [--workers 4]
+#
+# Uses DATABASE_URL if set, otherwise a throwaway SQLite file filled with
+# --destinations synthetic rows. Each worker either loads every destination
+# into formatted dicts (what a per-process cache would hold) or maps the
+# snapshot and touches every column. Private memory is read from
+# /proc/<pid>/smaps_rollup (Linux); Pss splits shared pages between workers.
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from peewee import chunked
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'catalog.db')
+
+from database.database import db, Destination  # noqa: E402
+import catalog_snapshot  # noqa: E402
+import planning  # noqa: E402
+from ranking import CATEGORIES  # noqa: E402
+
+
+def setup(count):
+    db.create_tables([Destination], safe=True)
+    have = Destination.select().count()
+    rng = random.Random(0)
+    rows = [{"city": f"City{i}", "country": rng.choice(["Pakistan", "France", "Japan", "Peru"]),
+             "description": "A place worth a detour. " * rng.randint(1, 6)}
+            for i in range(have, count)]
+    with db.atomic():
+        for batch in chunked(rows, 1000):
+            Destination.insert_many(batch).execute()
+
+
+def memory_kb():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def worker(mode, path, ready, done, results):
+    before = memory_kb()
+    if mode == "copy":
+        with db.connection_context():
+            catalog = [planning.format_destination(d) for d in Destination.select()]
+        checksum = sum(d["cost"] for d in catalog)
+    else:
+        snapshot = catalog_snapshot.Snapshot(path)
+        checksum = float(snapshot.cost.sum())
+        for name in snapshot.header["sections"]:
+            getattr(snapshot, name).sum()  # fault every page in
+    ready.wait()
+    after = memory_kb()
+    results.put({key: after[key] - before.get(key, 0) for key in after} | {"checksum": checksum})
+    done.wait()
+
+
+def run(mode, path, workers):
+    ctx = multiprocessing.get_context("fork")
+    ready, done = ctx.Barrier(workers), ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, path, ready, done, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    measured = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return measured
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--destinations", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    setup(args.destinations)
+    path = os.path.join(tempfile.mkdtemp(), "catalog.snap")
+    started = time.perf_counter()
+    header = catalog_snapshot.build(path, planning.simulated_attributes, CATEGORIES)
+    print(f"Snapshot: {header['count']:,} destinations, {os.path.getsize(path) / 1024:,.0f} KiB, "
+          f"built in {time.perf_counter() - started:.2f}s\n")
+    db.close()
+
+    for mode in ("copy", "snapshot"):
+        measured = run(mode, path, args.workers)
+        private = sum(m["Private_Clean"] + m["Private_Dirty"] for m in measured)
+        pss = sum(m["Pss"] for m in measured)
+        print(f"{mode:<9} {args.workers} workers: private {private / 1024:8.1f} MiB, "
+              f"Pss {pss / 1024:8.1f} MiB")
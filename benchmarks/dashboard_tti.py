@@ -0,0 +1,146 @@
+# benchmarks/dashboard_tti.py - Time to interactive after login: separate calls vs /me/dashboard
+#
+#   python benchmarks/dashboard_tti.py [--runs 30] [--rtt-ms 60]
+#
+# Starts the API with uvicorn and plays what the app does after the login
+# form is submitted:
+#   before: login, then suggestions, then trips, one call after the other
+#   after:  login, then /me/dashboard
+# Each call opens a fresh connection and is charged --rtt-ms of simulated
+# network round trip, as a browser on a real network would pay. Uses
+# DATABASE_URL if set, otherwise a throwaway SQLite file with
+# --destinations synthetic rows.
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'dashboard.db')
+
+from peewee import chunked  # noqa: E402
+from database.database import db, Destination, Trip  # noqa: E402
+from database import migrations  # noqa: E402
+
+
+def setup(count):
+    migrations.upgrade()
+    have = Destination.select().count()
+    rng = random.Random(0)
+    rows = [{"city": f"City{i}", "country": rng.choice(["Pakistan", "France", "Japan", "Peru"]),
+             "description": "A place worth a detour."}
+            for i in range(have, count)]
+    with db.atomic():
+        for batch in chunked(rows, 1000):
+            Destination.insert_many(batch).execute()
+    db.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    def __init__(self, port, rtt):
+        self.port = port
+        self.rtt = rtt
+
+    def call(self, method, path, body=None, token=None):
+        time.sleep(self.rtt)  # the round trip the network would add
+        conn = http.client.HTTPConnection("127.0.0.1", self.port)
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = conn.getresponse()
+        data = json.loads(response.read())
+        conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"{method} {path}: {response.status} {data}")
+        return data
+
+
+def before(client, credentials):
+    user = client.call("POST", "/auth/login", credentials)
+    logged_in = time.perf_counter()
+    client.call("GET", f"/planning/suggestions/{user['user_id']}", token=user["token"])
+    client.call("GET", f"/trips/{user['user_id']}")
+    return logged_in
+
+
+def after(client, credentials):
+    user = client.call("POST", "/auth/login", credentials)
+    logged_in = time.perf_counter()
+    client.call("GET", "/me/dashboard", token=user["token"])
+    return logged_in
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--rtt-ms", type=float, default=60.0)
+    parser.add_argument("--destinations", type=int, default=20000)
+    args = parser.parse_args()
+
+    setup(args.destinations)
+    port = free_port()
+    env = dict(os.environ, JOB_WORKERS="0", RATE_LIMIT_PER_SECOND="1000", RATE_LIMIT_BURST="1000")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api_main:app", "--port", str(port),
+                               "--log-level", "warning"], cwd=ROOT, env=env)
+    try:
+        client = Client(port, args.rtt_ms / 1000)
+        for _ in range(100):
+            try:
+                client.call("GET", "/")
+                break
+            except (ConnectionRefusedError, RuntimeError):
+                time.sleep(0.2)
+
+        name = f"tti{format(int(time.time()), 'x')}"
+        credentials = {"email": f"{name}@example.com", "password": "benchmark"}
+        user = client.call("POST", "/auth/signup", {**credentials, "username": name,
+                                                      "city": "City1", "country": "France"})
+        with db.connection_context():
+            for i in range(3):
+                start = date.today() + timedelta(days=30 * (i + 1))
+                Trip.create(maxBudget=1000, destination=i + 1, startDate=start,
+                            endDate=start + timedelta(days=5), user=user["user_id"])
+
+        # Warm both paths (ranker, autocomplete, connection pool) before timing
+        before(client, credentials)
+        after(client, credentials)
+
+        timings = {"before": [], "after": []}
+        post_login = {"before": [], "after": []}
+        for _ in range(args.runs):
+            for label, flow in (("before", before), ("after", after)):
+                started = time.perf_counter()
+                logged_in = flow(client, credentials)
+                done = time.perf_counter()
+                timings[label].append((done - started) * 1000)
+                post_login[label].append((done - logged_in) * 1000)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Login to interactive, {args.runs} runs, {args.rtt_ms:g}ms simulated RTT per call")
+    for label, calls in (("before", "login + suggestions + trips"), ("after", "login + /me/dashboard")):
+        samples = sorted(timings[label])
+        print(f"{label:7s} {calls:28s} median {statistics.median(samples):7.1f}ms  "
+              f"p95 {samples[int(0.95 * (len(samples) - 1))]:7.1f}ms  "
+              f"(after the login response: {statistics.median(post_login[label]):6.1f}ms)")
+    saved = statistics.median(timings["before"]) - statistics.median(timings["after"])
+    print(f"✅ {saved:.0f}ms faster" if saved > 0 else f"❌ {-saved:.0f}ms slower")
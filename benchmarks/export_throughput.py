@@ -0,0 +1,79 @@
+# benchmarks/export_throughput.py - Rows/second and peak memory of the trip export
+#
+#   python benchmarks/export_throughput.py [--rows 10000000] [--format csv|arrow]
+#
+# Uses DATABASE_URL if set, otherwise a throwaway SQLite file filled with
+# --rows synthetic bookings. The export is written to /dev/null; peak RSS
+# should stay flat as --rows grows.
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from peewee import chunked
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'export.db')
+
+from database.database import (  # noqa: E402
+    db, User, Destination, Trip, Food, Accommodation, Transport, FilteredSuggestion, FinalTrip
+)
+import exports  # noqa: E402
+
+
+def setup(rows, batch=50000):
+    db.create_tables([User, Destination, Trip, Food, Accommodation, Transport,
+                      FilteredSuggestion, FinalTrip], safe=True)
+    if FinalTrip.select().count() >= rows:
+        return
+    user = User.create(user_name="bench", email="bench@example.com", city="A", country="B")
+    dest = Destination.create(city="Benchmark", country="Nowhere", description="export test")
+    food = Food.create(name="Cafe", location="Main St", rating=4.0, destination=dest)
+    acco = Accommodation.create(name="Hotel", type=1, rating=4.5, destination=dest)
+    transport = Transport.create(originCity="A", originCountry="B", destCity="Benchmark",
+                                 destCountry="Nowhere", transportType=1, cost=120.0, time="08:00")
+    trip = Trip.create(maxBudget=5000, destination=dest, startDate=date(2030, 1, 1),
+                       endDate=date(2030, 1, 5), user=user)
+    suggestion = FilteredSuggestion.create(trip=trip, totalbudget=1000, dailybudget=200, food=food,
+                                           transport=transport, destination=dest, accommodation=acco)
+    rng = random.Random(0)
+    print(f"Generating {rows:,} bookings...")
+    for start in range(0, rows, batch):
+        values = []
+        for _ in range(min(batch, rows - start)):
+            day = date(2030, 1, 1) + timedelta(days=rng.randrange(365))
+            values.append((suggestion.f_suggest_id, dest.dest_id, transport.transport_id,
+                           acco.acco_id, food.cuisine_id, user.user_id,
+                           round(rng.uniform(300, 5000), 2), day, day + timedelta(days=4)))
+        with db.atomic():
+            for part in chunked(values, 1000):
+                FinalTrip.insert_many(part, fields=[
+                    FinalTrip.f_suggest, FinalTrip.destination, FinalTrip.transport,
+                    FinalTrip.accommodation, FinalTrip.food, FinalTrip.user_id,
+                    FinalTrip.totalbudget, FinalTrip.startDate, FinalTrip.endDate]).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--format", choices=list(exports.ENCODERS), default="csv")
+    parser.add_argument("--chunk-size", type=int, default=exports.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    setup(args.rows)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(os.devnull, "wb") as out:
+        rows, seconds = exports.export(out, args.format, args.chunk_size)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"Exported {rows:,} rows as {args.format} in {seconds:.1f}s "
+          f"({rows / seconds:,.0f} rows/s)")
+    print(f"Peak RSS {rss_after / 1024:.0f} MiB (+{(rss_after - rss_before) / 1024:.0f} MiB during export)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/invalidation_latency.py - Save-to-eviction latency of the cache bus across processes
+#
+#   python benchmarks/invalidation_latency.py [--listeners 4] [--events 500]
+#
+# Uses DATABASE_URL if set (Postgres exercises LISTEN/NOTIFY), otherwise a
+# throwaway SQLite file and the Unix-socket fallback. Listener processes
+# keep a TableCache of one destination; the parent saves that row
+# --events times and each listener records how long after the publish its
+# cache entry was evicted. Exits 1 if an event is lost or p99 is over
+# --budget-ms.
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bus.db')
+
+from playhouse.pool import PooledSqliteDatabase  # noqa: E402
+from database.database import db, Destination  # noqa: E402
+from cache_bus import bus, TableCache  # noqa: E402
+
+
+def listener(dest_id, events, ready, results):
+    latencies = []
+    done = multiprocessing.Event()
+    cache = TableCache(["destinations"])
+
+    def on_event(event):
+        if event.key == dest_id:
+            latencies.append((time.time_ns() - event.version) / 1e6)
+            if len(latencies) == events:
+                done.set()
+
+    bus.subscribe("destinations", on_event)
+    bus.start()
+    cache.get(dest_id, lambda: "cached")
+    ready.wait()
+    done.wait(timeout=60)
+    results.put((latencies, cache.stats()))
+    bus.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listeners", type=int, default=4)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--interval-ms", type=float, default=2.0)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    db.create_tables([Destination], safe=True)
+    dest = Destination.create(city="Busville", country="Nowhere", description="latency test")
+    db.close()
+
+    ctx = multiprocessing.get_context("fork")
+    ready = ctx.Barrier(args.listeners + 1)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=listener, args=(dest.dest_id, args.events, ready, results))
+             for _ in range(args.listeners)]
+    for p in procs:
+        p.start()
+    ready.wait()
+
+    with db.connection_context():
+        for i in range(args.events):
+            dest.description = f"latency test {i}"
+            dest.save()
+            time.sleep(args.interval_ms / 1000)
+
+    latencies, lost, evictions = [], 0, 0
+    for _ in procs:
+        received, stats = results.get()
+        latencies.extend(received)
+        lost += args.events - len(received)
+        evictions += stats["evictions"]
+    for p in procs:
+        p.join()
+
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    backend = "SQLite/Unix sockets" if isinstance(db, PooledSqliteDatabase) else "Postgres LISTEN/NOTIFY"
+    print(f"{backend}: {args.events} saves x {args.listeners} listeners, {lost} events lost, "
+          f"{evictions} cache evictions")
+    print(f"save -> evict  p50 {pct(0.5):.2f}ms  p95 {pct(0.95):.2f}ms  "
+          f"p99 {pct(0.99):.2f}ms  max {latencies[-1]:.2f}ms")
+    ok = not lost and pct(0.99) <= args.budget_ms
+    print("✅ Within budget" if ok else f"❌ Over the {args.budget_ms}ms p99 budget or lost events")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,112 @@
+# benchmarks/itinerary_batch.py - Batch itinerary solving: one process vs a process pool
+#
+#   python benchmarks/itinerary_batch.py [--trips 5000] [--workers N]
+#
+# Fills a throwaway SQLite database (or DATABASE_URL) with --trips booked
+# trips of 3 to 14 days over 200 destinations with 40 restaurants each,
+# then solves every itinerary with build_batch in this process, again over
+# a pool of --workers processes (default: one per CPU, at least 2), and a
+# third time with nothing changed, which should only compare hashes. Finally changes one restaurant's
+# rating and checks that exactly the trips to that destination are solved
+# again.
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'itinerary.db')
+
+from datetime import time as clock  # noqa: E402
+from peewee import chunked  # noqa: E402
+from database.database import (  # noqa: E402
+    db, User, Destination, Trip, Food, Accommodation, Transport, FilteredSuggestion, FinalTrip, Itinerary
+)
+from database import migrations  # noqa: E402
+import itinerary  # noqa: E402
+
+
+def insert(model, rows):
+    for batch in chunked(rows, 500):
+        model.insert_many(batch).execute()
+
+
+def setup(trips, rng):
+    migrations.upgrade()
+    with db.atomic():
+        user = User.create(user_name="bench", email=f"bench{rng.random()}@example.com",
+                           city="Lyon", country="France")
+        first = Destination.select().count() + 1
+        insert(Destination, [{"city": f"City{i}", "country": "France", "description": "",
+                              "latitude": 43 + rng.uniform(0, 5), "longitude": rng.uniform(-1, 6)}
+                             for i in range(200)])
+        dest_ids = list(range(first, first + 200))
+        insert(Food, [{"name": f"Bistro {d}-{i}", "location": "", "rating": round(rng.uniform(2.5, 5), 1),
+                       "destination": d} for d in dest_ids for i in range(40)])
+        foods = {}
+        for cuisine_id, dest_id in Food.select(Food.cuisine_id, Food.destination).tuples():
+            foods.setdefault(dest_id, []).append(cuisine_id)
+        acco = Accommodation.create(name="Hotel", type=1, rating=4, destination=dest_ids[0])
+        transport = Transport.create(originCity="Lyon", originCountry="France", destCity="City0",
+                                     destCountry="France", transportType=1, cost=80, time=clock(9))
+        rows = []
+        for i in range(trips):
+            dest_id = rng.choice(dest_ids)
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(365))
+            end = start + timedelta(days=rng.randint(2, 13))
+            trip = Trip.create(maxBudget=2000, destination=dest_id, startDate=start, endDate=end, user=user)
+            daily = rng.uniform(40, 150)
+            suggestion = FilteredSuggestion.create(
+                trip=trip, totalbudget=daily * 7, dailybudget=daily, food=rng.choice(foods[dest_id]),
+                transport=transport, destination=dest_id, accommodation=acco)
+            rows.append({"f_suggest": suggestion, "destination": dest_id, "transport": transport,
+                         "accommodation": acco, "food": suggestion.food_id, "user_id": user,
+                         "totalbudget": daily * 7, "startDate": start, "endDate": end})
+        insert(FinalTrip, rows)
+    return dest_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trips", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    if (os.cpu_count() or 1) < args.workers:
+        print(f"⚠️  {os.cpu_count()} CPU(s) for {args.workers} workers: the pool can only add overhead here")
+    rng = random.Random(0)
+    with db.connection_context():
+        dest_ids = setup(args.trips, rng)
+        ids = [trip_id for trip_id, in FinalTrip.select(FinalTrip.f_trip_id)
+               .where(FinalTrip.destination.in_(dest_ids)).tuples()]
+
+        single = itinerary.build_batch(ids, workers=1)
+        print(f"1 process      {single['solved']} trips solved in {single['seconds']:.2f}s")
+        Itinerary.delete().execute()
+        pooled = itinerary.build_batch(ids, workers=args.workers)
+        print(f"{args.workers} processes    {pooled['solved']} trips solved in {pooled['seconds']:.2f}s "
+              f"({single['seconds'] / pooled['seconds']:.1f}x)")
+        again = itinerary.build_batch(ids, workers=args.workers)
+        print(f"unchanged      {again['cached']} plans reused, {again['solved']} solved "
+              f"in {again['seconds']:.2f}s")
+
+        # One restaurant changes: only trips to its destination go stale
+        changed = Food.select().where(Food.destination == dest_ids[0]).order_by(Food.rating.desc()).first()
+        changed.rating = 1.0
+        changed.save()
+        expected = FinalTrip.select().where(FinalTrip.destination == dest_ids[0]).count()
+        after = itinerary.build_batch(ids, workers=args.workers)
+        print(f"one edit       {after['solved']} solved (trips to that destination: {expected})")
+
+        plan = itinerary.get_itinerary(ids[0])
+        over = sum(day["over_budget"] for day in plan["days"])
+        print(f"sample         trip {ids[0]}: {len(plan['days'])} days, {plan['total_cost']:.2f} total, "
+              f"daily budget {plan['daily_budget']:.2f}, {over} days over budget, cached={plan['cached']}")
+
+    ok = again["solved"] == 0 and after["solved"] == expected
+    print("✅ Plans reused until their inputs change" if ok else "❌ Unexpected re-solves")
+    sys.exit(0 if ok else 1)
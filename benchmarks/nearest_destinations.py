@@ -0,0 +1,94 @@
+# benchmarks/nearest_destinations.py - Grid index k-nearest lookups against a brute-force scan
+#
+#   python benchmarks/nearest_destinations.py [--points 10000] [--queries 500] [--k 10]
+#
+# Fills a DestinationIndex with --points random destinations (most of them
+# clustered around a few cities, like real data) and a sparse one with a
+# handful spread over the globe, then answers --queries random k-nearest
+# and radius queries on both. Exits 1 unless every answer matches a
+# brute-force haversine scan, including a point on the far side of the
+# globe from the query.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'nearest.db')
+
+from spatial_index import DestinationIndex, haversine_km  # noqa: E402
+
+
+def random_point(rng):
+    return rng.uniform(-89.9, 89.9), rng.uniform(-180, 180)
+
+
+def clustered(rng, n):
+    centres = [random_point(rng) for _ in range(50)]
+    points = {}
+    for dest_id in range(1, n + 1):
+        if rng.random() < 0.9:
+            lat, lon = rng.choice(centres)
+            points[dest_id] = (max(-90, min(90, lat + rng.gauss(0, 1))), (lon + rng.gauss(0, 1) + 180) % 360 - 180)
+        else:
+            points[dest_id] = random_point(rng)
+    return points
+
+
+def brute_force(points, lat, lon, k, radius_km=None):
+    hits = sorted((haversine_km(lat, lon, plat, plon), dest_id) for dest_id, (plat, plon) in points.items())
+    if radius_km is not None:
+        hits = [hit for hit in hits if hit[0] <= radius_km]
+    return [(dest_id, round(d, 3)) for d, dest_id in hits[:k]]
+
+
+def same(got, expected):
+    # Ties at the k-th distance may pick either point; compare distances
+    return [d for _, d in got] == [d for _, d in expected]
+
+
+def check(name, points, queries, k, rng):
+    index = DestinationIndex()
+    for dest_id, (lat, lon) in points.items():
+        index.upsert(dest_id, lat, lon)
+    timings, wrong = [], 0
+    for _ in range(queries):
+        lat, lon = random_point(rng)
+        radius = rng.choice([None, 50, 500, 5000])
+        started = time.perf_counter()
+        got = index.nearest(lat, lon, k, radius)
+        timings.append((time.perf_counter() - started) * 1000)
+        if not same(got, brute_force(points, lat, lon, k, radius)):
+            wrong += 1
+    print(f"{name:<10} {len(points):>6} points  median {statistics.median(timings):.3f} ms  "
+          f"max {max(timings):.3f} ms  {wrong} wrong")
+    return wrong
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    wrong = check("clustered", clustered(rng, args.points), args.queries, args.k, rng)
+    wrong += check("sparse", {dest_id: random_point(rng) for dest_id in range(1, 6)}, args.queries, args.k, rng)
+
+    # The only point is in the column opposite the query's (column 371 vs 11)
+    antipode = {1: (0.0, 5.75)}
+    index = DestinationIndex()
+    index.upsert(1, *antipode[1])
+    got = index.nearest(0.0, -174.25, 1)
+    far_side = same(got, brute_force(antipode, 0.0, -174.25, 1))
+    print(f"far side   {got}")
+
+    ok = not wrong and far_side
+    print("✅ Index answers match the brute-force scan" if ok else "❌ Index answers differ from the brute-force scan")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,83 @@
+# benchmarks/price_calendar_latency.py - Building price calendars and finding the cheapest dates
+#
+#   python benchmarks/price_calendar_latency.py [--destinations 1000] [--queries 20000]
+#
+# Builds one PriceCalendar per synthetic destination (no database
+# involved) and times cheapest-window queries over random date ranges and
+# trip lengths, the way /planning/destinations/{id}/price-calendar serves
+# them from the per-destination cache. One grid is also computed cell by
+# cell in pure Python, to check the vectorized totals and show what they
+# save. Exits 1 if the query p99 is over --budget-ms.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'price_calendar.db')
+
+import numpy as np  # noqa: E402
+from price_calendar import PriceCalendar, HORIZON_DAYS, MAX_NIGHTS  # noqa: E402
+
+
+def loop_grid(calendar):
+    """The same totals, one cell at a time"""
+    grid = [[0.0] * MAX_NIGHTS for _ in range(HORIZON_DAYS)]
+    for s in range(HORIZON_DAYS):
+        for n in range(1, MAX_NIGHTS + 1):
+            grid[s][n - 1] = (calendar.fare[s] + calendar.fare[s + n] +
+                              sum(calendar.nightly[s:s + n]) + sum(calendar.food[s:s + n + 1]))
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--destinations", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    today = date.today()
+    started = time.perf_counter()
+    calendars = [PriceCalendar(today, fare=rng.uniform(40, 400), nightly=rng.uniform(35, 150),
+                               daily_food=rng.uniform(20, 80), latitude=rng.uniform(-60, 70),
+                               monthly_bookings=np.array([rng.randint(0, 50) for _ in range(12)], dtype=float))
+                 for _ in range(args.destinations)]
+    build_ms = (time.perf_counter() - started) * 1000 / args.destinations
+    print(f"build          {build_ms:.2f}ms per destination "
+          f"({HORIZON_DAYS} start dates x {MAX_NIGHTS} lengths, "
+          f"{calendars[0].grid.nbytes / 1024:.0f} KiB each)")
+
+    started = time.perf_counter()
+    reference = loop_grid(calendars[0])
+    loop_ms = (time.perf_counter() - started) * 1000
+    worst = float(np.max(np.abs(np.array(reference) - calendars[0].grid) / np.array(reference)))
+    print(f"pure Python    {loop_ms:.0f}ms for one destination ({loop_ms / build_ms:.0f}x), "
+          f"largest relative difference {worst:.1e}")
+
+    latencies = []
+    for _ in range(args.queries):
+        calendar = rng.choice(calendars)
+        first = today + timedelta(days=rng.randrange(HORIZON_DAYS - 60))
+        last = first + timedelta(days=rng.randint(30, 180))
+        nights = rng.randint(2, 14)
+        started = time.perf_counter()
+        calendar.cheapest(first, last, nights, limit=5)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    print(f"cheapest 5     p50 {pct(0.5) * 1000:.0f}us  p99 {pct(0.99) * 1000:.0f}us  "
+          f"max {latencies[-1]:.2f}ms")
+
+    ok = worst < 1e-5 and pct(0.99) <= args.budget_ms
+    print("✅ Within budget" if ok else f"❌ Totals differ or over the {args.budget_ms}ms p99 budget")
+    sys.exit(0 if ok else 1)
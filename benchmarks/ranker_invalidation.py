@@ -0,0 +1,80 @@
+# benchmarks/ranker_invalidation.py - A booking in one process evicts the user's ranking in another
+#
+#   python benchmarks/ranker_invalidation.py [--timeout 5]
+#
+# Uses DATABASE_URL if set, otherwise a throwaway SQLite file. A listener
+# process ranks destinations for a user (caching the user's vector), then
+# the parent books a trip for that user. Exits 1 unless the listener's
+# ranker dropped the cached vector, and then measures how long that took.
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, time as clock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'ranker.db')
+
+from database.database import (  # noqa: E402
+    db, User, Destination, Trip, Food, Accommodation, Transport, FinalTrip
+)
+from database import migrations  # noqa: E402
+from cache_bus import bus  # noqa: E402
+
+
+def listener(user_id, timeout, ready, booked, results):
+    import planning
+    bus.start()
+    with db.connection_context():
+        planning.ranker.refresh()
+        planning.ranker.top_k(user_id)
+    cached = user_id in planning.ranker._users
+    ready.set()
+    booked.wait(timeout)
+    started = time.perf_counter()
+    while user_id in planning.ranker._users and time.perf_counter() - started < timeout:
+        time.sleep(0.001)
+    results.put((cached, user_id not in planning.ranker._users, (time.perf_counter() - started) * 1000))
+    bus.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with db.connection_context():
+        migrations.upgrade()
+        user = User.create(user_name="ranked", email=f"ranked{time.time_ns()}@example.com",
+                           city="Lyon", country="France")
+        dest = Destination.create(city="Busville", country="Nowhere", description="")
+        food = Food.create(name="Bistro", location="", rating=4, destination=dest)
+        acco = Accommodation.create(name="Hotel", type=1, rating=4, destination=dest)
+        transport = Transport.create(originCity="Lyon", originCountry="France", destCity="Busville",
+                                     destCountry="Nowhere", transportType=1, cost=80, time=clock(9))
+        trip = Trip.create(maxBudget=1000, destination=dest, startDate=date(2030, 1, 1),
+                           endDate=date(2030, 1, 5), user=user)
+    db.close()
+
+    ctx = multiprocessing.get_context("fork")
+    ready, booked, results = ctx.Event(), ctx.Event(), ctx.Queue()
+    process = ctx.Process(target=listener, args=(user.user_id, args.timeout, ready, booked, results))
+    process.start()
+    ready.wait(args.timeout)
+
+    with db.connection_context():
+        import booking
+        suggestion = booking.create_filtered_suggestion(trip, {"id": dest.dest_id, "cost": 500})
+        booking.book(user.user_id, suggestion.f_suggest_id)
+    booked.set()
+    cached, evicted, ms = results.get(timeout=args.timeout * 2)
+    process.join()
+
+    print(f"listener cached the user: {cached}, evicted after the booking: {evicted} ({ms:.1f} ms)")
+    ok = cached and evicted
+    print("✅ Cross-process booking evicted the ranking" if ok else "❌ Ranking not evicted")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,157 @@
+# benchmarks/sse_fanout.py - Idle /events streams: server memory and publish-to-client latency
+#
+#   python benchmarks/sse_fanout.py [--connections 5000] [--users 1000] [--rounds 5]
+#
+# Starts the API with uvicorn, opens --connections event streams spread
+# over --users users and leaves them idle, then publishes one event per
+# user per round from this process (through the cache bus, as a job
+# worker would) and times how long each stream takes to see it. Finally
+# drops one stream, publishes while it is away and checks that
+# reconnecting with Last-Event-ID replays the missed event. Uses
+# DATABASE_URL if set, otherwise a throwaway SQLite file.
+import argparse
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'events.db')
+
+from database import migrations  # noqa: E402
+from auth.login import create_access_token  # noqa: E402
+import events  # noqa: E402
+
+EVENT = re.compile(rb"id: ([\w-]+)\nevent: ([^\n]+)\ndata: ([^\n]*)\n\n")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mib(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class Stream:
+    def __init__(self, port, user_id):
+        self.port = port
+        self.user_id = user_id
+        self.buffer = b""
+        self.last_id = None
+
+    async def open(self, last_event_id=None):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        extra = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id else ""
+        token = create_access_token({"user_id": self.user_id})
+        self.writer.write(f"GET /events/{self.user_id} HTTP/1.1\r\nHost: bench\r\n"
+                          f"Authorization: Bearer {token}\r\n"
+                          f"Accept: text/event-stream\r\n{extra}\r\n".encode())
+        await self.writer.drain()
+        while b"retry:" not in self.buffer:
+            self.buffer += await self.reader.read(4096)
+
+    async def next_event(self):
+        while True:
+            match = EVENT.search(self.buffer)
+            if match:
+                self.buffer = self.buffer[match.end():]
+                self.last_id = match.group(1).decode()
+                return self.last_id, match.group(2).decode(), time.perf_counter()
+            chunk = await self.reader.read(4096)
+            if not chunk:
+                raise ConnectionError("stream closed")
+            self.buffer += chunk
+
+    def close(self):
+        self.writer.close()
+
+
+async def main(args, port, server):
+    streams = []
+    base_rss = rss_mib(server.pid)
+    started = time.perf_counter()
+    for batch in range(0, args.connections, 500):
+        group = [Stream(port, 1 + i % args.users) for i in range(batch, min(batch + 500, args.connections))]
+        await asyncio.gather(*(s.open() for s in group))
+        streams.extend(group)
+    print(f"Opened {len(streams)} streams for {args.users} users in {time.perf_counter() - started:.1f}s; "
+          f"server RSS {base_rss:.0f} -> {rss_mib(server.pid):.0f} MiB "
+          f"({(rss_mib(server.pid) - base_rss) * 1024 / len(streams):.1f} KiB per stream)")
+
+    latencies, resyncs = [], 0
+    for round_ in range(args.rounds):
+        waiting = [asyncio.ensure_future(s.next_event()) for s in streams]
+        published = time.perf_counter()
+        for user_id in range(1, args.users + 1):
+            events.publish(user_id, "payment.settled", final_trip_id=round_)
+        for _, kind, received in await asyncio.gather(*waiting):
+            latencies.append((received - published) * 1000)
+            resyncs += kind == "resync"
+        # A stream told to resync may still have the event itself coming
+        await asyncio.sleep(0.5)
+        for s in streams:
+            s.buffer = b""
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    print(f"publish -> client  p50 {pct(0.5):.1f}ms  p99 {pct(0.99):.1f}ms  max {latencies[-1]:.1f}ms "
+          f"({args.rounds} rounds x {args.users} events, {resyncs} deliveries were resyncs)")
+
+    # Resume: miss an event while disconnected, get it back on reconnect
+    stream = streams[0]
+    stream.close()
+    await asyncio.sleep(0.2)
+    events.publish(stream.user_id, "booking.finalized", final_trip_id=-1)
+    await asyncio.sleep(0.2)
+    resumed = Stream(port, stream.user_id)
+    await resumed.open(last_event_id=stream.last_id)
+    replayed = await asyncio.wait_for(resumed.next_event(), timeout=5)
+    resumed.close()
+    for s in streams[1:]:
+        s.close()
+    ok = replayed[1] == "booking.finalized"
+    print("✅ Missed event replayed after reconnect" if ok else f"❌ Got {replayed} after reconnect")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    migrations.upgrade()
+    port = free_port()
+    env = dict(os.environ, JOB_WORKERS="0")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api_main:app", "--port", str(port),
+                               "--log-level", "warning", "--backlog", "4096"], cwd=ROOT, env=env)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.2)
+        time.sleep(0.5)  # let the server's bus listener bind
+        ok = asyncio.run(main(args, port, server))
+    finally:
+        server.terminate()
+        server.wait()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,71 @@
+# benchmarks/tour_solver.py - Multi-city ordering: solve time and quality against N
+#
+#   python benchmarks/tour_solver.py [--trials 5] [--time-limit 1.0]
+#
+# Solves round trips over N random cities (a home city plus N stops,
+# weights from great-circle distance with some one-way noise, no database
+# involved). Up to the exact limit it runs both Held-Karp and the 2-opt /
+# or-opt heuristic and reports how far the heuristic lands from the
+# optimum; past it, only the heuristic under --time-limit. Exits 1 if any
+# exact solve or the heuristic overran its time limit by more than 50%.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'tours.db')
+
+import numpy as np  # noqa: E402
+import tours  # noqa: E402
+from spatial_index import haversine_km  # noqa: E402
+
+
+def random_weights(n, rng):
+    lat = rng.uniform(35, 60, n)
+    lon = rng.uniform(-10, 30, n)
+    weights = np.zeros((n, n))
+    for a in range(n):
+        for b in range(n):
+            if a != b:
+                km = haversine_km(lat[a], lon[a], lat[b], lon[b])
+                weights[a, b] = (30 + 0.12 * km) * rng.uniform(0.9, 1.2) + 25 * (2 + km / 500)
+    return weights
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--time-limit", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ok = True
+    print(f"{'stops':>5}  {'exact ms':>9}  {'heuristic ms':>12}  {'heuristic gap':>13}")
+    for stops in (3, 5, 8, 10, 12, 20, 50, 100, 200):
+        exact_ms, heuristic_ms, gaps = [], [], []
+        for _ in range(args.trials):
+            extended = tours._with_terminal(random_weights(stops + 1, rng), round_trip=True)
+            path, ms = timed(lambda: tours.improve(
+                extended, tours.nearest_neighbour(extended), time.monotonic() + args.time_limit))
+            heuristic_ms.append(ms)
+            if stops <= tours.EXACT_LIMIT:
+                best, ms = timed(lambda: tours.held_karp(extended))
+                exact_ms.append(ms)
+                optimum = tours.path_weight(extended, best)
+                gaps.append(tours.path_weight(extended, path) / optimum - 1)
+        exact = f"{np.median(exact_ms):9.1f}" if exact_ms else f"{'-':>9}"
+        gap = f"{np.mean(gaps) * 100:12.2f}%" if gaps else f"{'-':>13}"
+        print(f"{stops:5d}  {exact}  {np.median(heuristic_ms):12.1f}  {gap}")
+        ok &= max(heuristic_ms + exact_ms) <= args.time_limit * 1500
+    print("✅ Every solve within its time limit" if ok else "❌ A solve overran its time limit")
+    sys.exit(0 if ok else 1)
@@ -1,29 +1,78 @@
 # booking.py
-from database.database import User, FilteredSuggestion, FinalTrip, db
+from database.database import (
+    User, Destination, Food, Transport, Accommodation, FilteredSuggestion, FinalTrip, db,
+    write_transaction
+)
+from planning import ranker
+import inventory
+import rollups  # counts new FinalTrips in the booking rollups
 
-def finalizeTrip(userid, fsuggestid):
-    """Finalize a trip from filtered suggestion"""
-    try:
-        if db.is_closed():
-            db.connect()
-            
-        user = User.get(User.user_id == userid)
-        fs = FilteredSuggestion.get(FilteredSuggestion.f_suggest_id == fsuggestid)
-        trip = fs.trip
+def create_filtered_suggestion(trip, selected_dest):
+    """Record the destination a user picked (a planning.format_destination dict)"""
+    # Get related entities (simplified for demo)
+    destination_obj = Destination.get(Destination.dest_id == selected_dest["id"])
+    food_obj = Food.select().first()  # Get first available food
+    transport_obj = Transport.select().first()  # Get first available transport
+    accommodation_obj = Accommodation.select().first()  # Get first available accommodation
+
+    return FilteredSuggestion.create(
+        trip=trip,
+        totalbudget=selected_dest["cost"],
+        dailybudget=selected_dest["cost"] / 7,  # Simple calculation
+        food=food_obj,
+        transport=transport_obj,
+        destination=destination_obj,
+        accommodation=accommodation_obj,
+        trip_start=trip.startDate
+    )
 
+def book(userid, fsuggestid):
+    """Create the FinalTrip of a filtered suggestion: (final trip, created).
+
+    Booking the same suggestion again returns its existing FinalTrip, so a
+    retried or re-claimed job never books (or reserves rooms) twice.
+    Raises User/FilteredSuggestion.DoesNotExist or inventory.NoAvailability.
+    """
+    user = User.get(User.user_id == userid)
+    # Hold the rooms and create the booking in one transaction, so a
+    # failed insert never leaves rooms reserved for nobody
+    with write_transaction():
+        query = FilteredSuggestion.select().where(FilteredSuggestion.f_suggest_id == fsuggestid)
+        if db.for_update:
+            # Concurrent bookings of one suggestion queue here (SQLite: the write lock)
+            query = query.for_update()
+        fs = query.get()
+        existing = FinalTrip.get_or_none(FinalTrip.f_suggest == fs.f_suggest_id)
+        if existing is not None:
+            return existing, False
+        trip = fs.trip
+        inventory.reserve(fs.accommodation_id, trip.startDate, trip.endDate)
         ftrip = FinalTrip.create(
             f_suggest=fs,
-            destination=fs.destination,
-            transport=fs.transport,
-            accommodation=fs.accommodation,
-            food=fs.food,
+            destination=fs.destination_id,
+            transport=fs.transport_id,
+            accommodation=fs.accommodation_id,
+            food=fs.food_id,
             user_id=user,
             totalbudget=fs.totalbudget,
             startDate=trip.startDate,
             endDate=trip.endDate
         )
-        print(f"✅ Trip finalized successfully! Trip ID: {ftrip.f_trip_id}")
-        return ftrip    
+    ranker.record_final_trip(user.user_id, fs.destination_id, fs.totalbudget)
+    return ftrip, True
+
+def finalizeTrip(userid, fsuggestid):
+    """Finalize a trip from filtered suggestion"""
+    try:
+        if db.is_closed():
+            db.connect()
+
+        ftrip, created = book(userid, fsuggestid)
+        if created:
+            print(f"✅ Trip finalized successfully! Trip ID: {ftrip.f_trip_id}")
+        else:
+            print(f"ℹ️  Already booked as Trip ID: {ftrip.f_trip_id}")
+        return ftrip
 
     except User.DoesNotExist:
         print(f"❌ Error: User with ID {userid} not found")
@@ -31,6 +80,6 @@ def finalizeTrip(userid, fsuggestid):
     except FilteredSuggestion.DoesNotExist:
         print(f"❌ Error: FilteredSuggestion with ID {fsuggestid} not found")
         return None
-    except Exception as e:
-        print(f"❌ Error creating final trip: {e}")
-        return None
\ No newline at end of file
+    except inventory.NoAvailability as e:
+        print(f"❌ Error: {e}")
+        return None
@@ -0,0 +1,300 @@
+# cache_bus.py - Cross-process cache invalidation events
+#
+# Saves and deletes of the models in PUBLISHED are broadcast as
+# (table, key, version) events to every process serving this database, so
+# per-process caches (the ranker's user vectors, the nearby index, any
+# TableCache) can drop what another worker just changed.
+#
+# Postgres: pg_notify on the writer's own connection. Notifications are
+# transactional, so listeners hear about a change only once it commits and
+# never about a rolled-back one. Each process keeps one extra unpooled
+# connection LISTENing.
+#
+# SQLite stand-in: every listening process binds a Unix datagram socket in
+# CACHE_BUS_DIR (default: a temp directory derived from the database path)
+# and publishers send each event to every socket there. These go out when
+# the statement runs, before the surrounding transaction commits. A
+# listener that falls too far behind loses events; each publisher numbers
+# its events, and a listener that sees a gap treats it as "*".
+import hashlib
+import itertools
+import json
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from peewee import ForeignKeyField
+from playhouse.pool import PooledSqliteDatabase
+from playhouse.signals import post_save, post_delete
+from database.database import db
+
+CHANNEL = "cache_invalidation"
+PUBLISHED = {"users", "destinations", "trips", "final_trips", "filtered_suggestions",
+             "food", "accommodations", "transport"}
+POLL_SECONDS = 0.5
+
+# key is the row's primary key, or None for "anything in this table";
+# user is the row's user_id when it has one, for caches keyed by user;
+# origin identifies the publishing process (see InvalidationBus.origin);
+# data is an optional small JSON-able payload (pg_notify caps the whole
+# event at 8000 bytes)
+Event = namedtuple("Event", "table key version user origin data", defaults=(None,))
+
+
+def _socket_dir():
+    path = os.getenv("CACHE_BUS_DIR")
+    if path:
+        return path
+    digest = hashlib.sha1(os.path.abspath(db.database).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"travel-planner-bus-{digest}")
+
+
+class InvalidationBus:
+    """Publishes model changes and fans received events out to subscribers"""
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12]
+        self._subscribers = {}  # table -> [callback(Event)]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._sender = None
+        self._sequence = itertools.count(1)
+        # Numbering and sending under one lock keeps each listener's view
+        # in order, so concurrent publishers don't look like lost events
+        self._send_lock = threading.Lock()
+        self.received = 0
+        self.gaps = 0
+
+    # --- Publishing ---
+
+    def publish(self, table, key=None, user=None, data=None):
+        """Announce that a row (or with key=None, the whole table) changed"""
+        message = {"t": table, "k": key, "v": time.time_ns(), "u": user, "o": self.origin}
+        if data is not None:
+            message["d"] = data
+        if isinstance(db, PooledSqliteDatabase):
+            with self._send_lock:
+                message["s"] = next(self._sequence)
+                self._send_local(json.dumps(message, default=str).encode())
+        else:
+            db.execute_sql("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(message, default=str)))
+
+    def _send_local(self, data):
+        directory = _socket_dir()
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return  # nobody is listening
+        if self._sender is None:
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.settimeout(0.1)
+            self._sender = sender
+        for name in names:
+            if not name.endswith(".sock"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Listener exited without cleaning up
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except (socket.timeout, BlockingIOError):
+                print(f"⚠️  Cache bus: {name} is not draining, dropped an event")
+
+    # --- Subscribing ---
+
+    def subscribe(self, table, callback):
+        """Call callback(Event) for every event on `table` ("*" for all)"""
+        with self._lock:
+            self._subscribers.setdefault(table, []).append(callback)
+
+    def _dispatch(self, payload):
+        event = Event(payload["t"], payload.get("k"), payload["v"], payload.get("u"), payload.get("o"),
+                      payload.get("d"))
+        self.received += 1
+        with self._lock:
+            if event.table == "*":
+                # Events may have been lost; everyone starts over
+                callbacks = list(dict.fromkeys(cb for cbs in self._subscribers.values() for cb in cbs))
+            else:
+                callbacks = self._subscribers.get(event.table, []) + self._subscribers.get("*", [])
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"❌ Cache bus subscriber failed on {event.table}: {e}")
+
+    # --- Listening ---
+
+    def start(self):
+        """Start this process's listener thread (idempotent)"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        target = self._listen_local if isinstance(db, PooledSqliteDatabase) else self._listen_postgres
+        ready = threading.Event()
+        self._thread = threading.Thread(target=target, args=(ready,), name="cache-bus", daemon=True)
+        self._thread.start()
+        # Events published after start() returns are not missed
+        ready.wait(5)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _listen_local(self, ready):
+        directory = _socket_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}-{self.origin}.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        sock.settimeout(POLL_SECONDS)
+        ready.set()
+        last_sequence = {}  # origin -> sequence number of its last event heard
+        try:
+            while not self._stop.is_set():
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                payload = json.loads(data)
+                origin, sequence = payload.get("o"), payload.get("s")
+                if sequence is not None:
+                    previous = last_sequence.get(origin)
+                    last_sequence[origin] = sequence
+                    if previous is not None and sequence != previous + 1:
+                        print(f"⚠️  Cache bus: missed {sequence - previous - 1} events from {origin}")
+                        self.gaps += 1
+                        self._dispatch({"t": "*", "k": None, "v": time.time_ns()})
+                self._dispatch(payload)
+        finally:
+            sock.close()
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _listen_postgres(self, ready):
+        import psycopg2
+        while not self._stop.is_set():
+            try:
+                conn = psycopg2.connect(dbname=db.database, **db.connect_params)
+            except Exception as e:
+                print(f"❌ Cache bus could not connect: {e}")
+                ready.set()
+                self._stop.wait(5)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                ready.set()
+                while not self._stop.is_set():
+                    if not select.select([conn], [], [], POLL_SECONDS)[0]:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._dispatch(json.loads(conn.notifies.pop(0).payload))
+            except Exception as e:
+                # Anything may have changed while we were deaf
+                print(f"❌ Cache bus connection lost: {e}")
+                self._dispatch({"t": "*", "k": None, "v": time.time_ns()})
+                self._stop.wait(1)
+            finally:
+                conn.close()
+
+
+bus = InvalidationBus()
+
+
+def _after_fork():
+    # A forked worker is another process: it needs its own origin (or it
+    # would ignore the parent's events as its own), sender and listener
+    bus.origin = uuid.uuid4().hex[:12]
+    bus._sender = None
+    bus._thread = None
+    bus._sequence = itertools.count(1)
+    bus._send_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _user_of(model, instance):
+    # The raw FK id: reading the attribute would load the User row
+    for name in ("user_id", "user"):
+        field = model._meta.fields.get(name)
+        if isinstance(field, ForeignKeyField):
+            value = instance.__data__.get(field.name)
+            return int(value) if value is not None else None
+    return None
+
+
+def _on_change(model, instance, *args, **kwargs):
+    table = model._meta.table_name
+    if table in PUBLISHED:
+        bus.publish(table, instance._pk, _user_of(model, instance))
+
+
+post_save.connect(_on_change, name="cache_bus_save")
+post_delete.connect(_on_change, name="cache_bus_delete")
+
+
+class TableCache:
+    """Per-process cache of loader results, evicted by bus events.
+
+    `key_of(event)` maps an event on one of `tables` to the cache key it
+    invalidates (default: the row's primary key); None clears everything.
+    A value loaded while an eviction was happening is not stored, so a
+    slow loader cannot put back what an event just removed; nor is one
+    that `keep(value)`, if given, turns down.
+    """
+
+    def __init__(self, tables, key_of=None, max_size=10000):
+        self._key_of = key_of or (lambda event: event.key)
+        self._data = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.hits = self.misses = self.evictions = 0
+        for table in tables:
+            bus.subscribe(table, self._on_event)
+
+    def get(self, key, loader, keep=None):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation and (keep is None or keep(value)):
+                if len(self._data) >= self.max_size:
+                    self._data.pop(next(iter(self._data)))
+                self._data[key] = value
+        return value
+
+    def _on_event(self, event):
+        key = None if event.table == "*" else self._key_of(event)
+        with self._lock:
+            self._generation += 1
+            self.evictions += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
@@ -0,0 +1,87 @@
+# catalog.py - Batched lookups of destinations and trip components
+from database.database import Destination, Food, Accommodation, Transport, db
+from dataloader import Loaders
+from planning import format_destination
+from typing import Dict, Any, List, Optional
+
+
+def format_food(food: Food) -> Dict[str, Any]:
+    return {
+        "id": food.cuisine_id,
+        "name": food.name,
+        "location": food.location,
+        "rating": food.rating,
+        "destination_id": food.destination_id,
+    }
+
+
+def format_accommodation(acco: Accommodation) -> Dict[str, Any]:
+    return {
+        "id": acco.acco_id,
+        "name": acco.name,
+        "type": acco.type,
+        "rating": acco.rating,
+        "destination_id": acco.destination_id,
+    }
+
+
+def format_transport(transport: Transport) -> Dict[str, Any]:
+    return {
+        "id": transport.transport_id,
+        "origin": f"{transport.originCity}, {transport.originCountry}",
+        "destination": f"{transport.destCity}, {transport.destCountry}",
+        "type": transport.transportType,
+        "cost": float(transport.cost),
+        "time": str(transport.time),
+    }
+
+
+# kind -> (model, formatter)
+KINDS = {
+    "destinations": (Destination, format_destination),
+    "food": (Food, format_food),
+    "accommodations": (Accommodation, format_accommodation),
+    "transport": (Transport, format_transport),
+}
+
+
+def multi_get(kind: str, ids: List[int], loaders: Optional[Loaders] = None):
+    """Fetches many rows of one kind with a single IN query"""
+    model, formatter = KINDS[kind]
+    loaders = loaders or Loaders()
+
+    # Check if connection is already open
+    connection_was_open = not db.is_closed()
+
+    if not connection_was_open:
+        db.connect()
+
+    try:
+        rows = loaders[model].load_many(ids)
+        return {
+            kind: [formatter(row) for row in rows if row is not None],
+            "missing": [key for key, row in zip(ids, rows) if row is None],
+        }
+    finally:
+        # Only close connection if we opened it
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+COMPONENT_FIELDS = (("destination_id", Destination), ("food_id", Food),
+                    ("accommodation_id", Accommodation), ("transport_id", Transport))
+
+
+def resolve_components(items, loaders: Loaders, models=None):
+    """Batch-load the FK targets of FilteredSuggestion/FinalTrip-like rows.
+
+    Each table is hit once no matter how many rows reference it, instead of
+    one lazy query per `row.destination` access. Returns {model: {id: row}}.
+    """
+    resolved = {}
+    for attr, model in COMPONENT_FIELDS:
+        if models is not None and model not in models:
+            continue
+        keys = list({getattr(item, attr) for item in items if hasattr(item, attr)})
+        resolved[model] = dict(zip(keys, loaders[model].load_many(keys)))
+    return resolved
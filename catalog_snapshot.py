@@ -0,0 +1,242 @@
+# catalog_snapshot.py - Read-only columnar destination catalog shared through mmap
+#
+#   python catalog_snapshot.py build catalog.snap
+#   python catalog_snapshot.py info catalog.snap
+#
+# With CATALOG_SNAPSHOT=<path> set, every uvicorn worker maps the same file
+# read-only, so the page cache holds one copy of the catalog per machine
+# instead of one Python object graph per worker. A rebuild writes a new file
+# next to the old one and renames it into place; readers notice the new
+# inode and swap, while requests already holding the old mapping finish on
+# it undisturbed.
+#
+# Layout: 8-byte magic, uint32 header length, JSON header, then 64-byte
+# aligned little-endian sections listed in the header:
+#   ids       int64[n]     dest_id, ascending
+#   cost      float64[n]
+#   rating    float32[n]
+#   category  uint8[n]     index into header["categories"]
+#   names     uint32[2n+1] offsets into text: city i, then country i
+#   descriptions uint32[n+1] offsets into text
+#   search    uint32[n+1]  offsets into keys
+#   text      bytes        UTF-8 city/country/description strings
+#   keys      bytes        per row "city\x1fcountry\x1e", lowercased
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import numpy as np
+from database.database import db, Destination
+
+MAGIC = b"TPCAT\x00\x00\x01"
+ALIGN = 64
+# Readers stat the file at most this often to pick up a rebuilt snapshot
+CHECK_INTERVAL = 1.0
+_KEY_FIELD, _KEY_ROW = "\x1f", "\x1e"
+
+
+def _key(city, country):
+    return f"{city}{_KEY_FIELD}{country}{_KEY_ROW}".lower()
+
+
+def _pack_strings(strings):
+    """(uint32 offsets[n+1], blob) for a list of str"""
+    encoded = [s.encode() for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def build(path, attributes, categories):
+    """Write a snapshot of every Destination to `path`; returns its header.
+
+    `attributes(dest_id)` supplies cost/rating/category (planning's
+    simulated_attributes). The file is written under a temporary name and
+    renamed over `path`, so readers only ever see complete snapshots.
+    """
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        rows = list(Destination
+                    .select(Destination.dest_id, Destination.city, Destination.country,
+                            Destination.description)
+                    .order_by(Destination.dest_id)
+                    .tuples())
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+    n = len(rows)
+    category_codes = {name: i for i, name in enumerate(categories)}
+    ids = np.fromiter((row[0] for row in rows), dtype="<i8", count=n)
+    cost = np.empty(n, dtype="<f8")
+    rating = np.empty(n, dtype="<f4")
+    category = np.empty(n, dtype="u1")
+    for i, (dest_id, _, _, _) in enumerate(rows):
+        attrs = attributes(dest_id)
+        cost[i], rating[i], category[i] = attrs["cost"], attrs["rating"], category_codes[attrs["category"]]
+
+    names, name_text = _pack_strings([part for _, city, country, _ in rows for part in (city, country)])
+    descriptions, description_text = _pack_strings([description or "" for *_, description in rows])
+    descriptions += len(name_text)
+    search, keys = _pack_strings([_key(city, country) for _, city, country, _ in rows])
+
+    sections = [("ids", ids), ("cost", cost), ("rating", rating), ("category", category),
+                ("names", names), ("descriptions", descriptions), ("search", search),
+                ("text", np.frombuffer(name_text + description_text, dtype="u1")),
+                ("keys", np.frombuffer(keys, dtype="u1"))]
+    header = {"version": time.time_ns(), "count": n, "categories": list(categories), "sections": {}}
+    # Offsets depend on the header length, which depends on the offsets;
+    # reserve a generous fixed-width slot for the numbers
+    for name, array in sections:
+        header["sections"][name] = [0, array.dtype.str, int(array.size)]
+    start = _align(len(MAGIC) + 4 + len(json.dumps(header)) + 32 * len(sections))
+    offset = start
+    for name, array in sections:
+        header["sections"][name][0] = offset
+        offset = _align(offset + array.nbytes)
+    encoded = json.dumps(header).encode()
+    assert len(MAGIC) + 4 + len(encoded) <= start
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        for name, array in sections:
+            f.seek(header["sections"][name][0])
+            f.write(array.tobytes())
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return header
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class Snapshot:
+    """One mapped snapshot file; every column is a numpy view of the mapping"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        (length,) = struct.unpack_from("<I", self._map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._map[start:start + length])
+        self.version = self.header["version"]
+        self.categories = self.header["categories"]
+        for name, (offset, dtype, count) in self.header["sections"].items():
+            setattr(self, name, np.frombuffer(self._map, dtype=dtype, count=count, offset=offset))
+
+    def __len__(self):
+        return self.header["count"]
+
+    def _text(self, start, end):
+        return self.text[start:end].tobytes().decode()
+
+    def row(self, i):
+        """Destination fields of row i, decoded"""
+        return {
+            "id": int(self.ids[i]),
+            "city": self._text(self.names[2 * i], self.names[2 * i + 1]),
+            "country": self._text(self.names[2 * i + 1], self.names[2 * i + 2]),
+            "description": self._text(self.descriptions[i], self.descriptions[i + 1]),
+            "cost": float(self.cost[i]),
+            "rating": round(float(self.rating[i]), 1),
+            "category": self.categories[self.category[i]],
+        }
+
+    def rows_for(self, dest_ids):
+        """Row numbers of the given ids that are in the snapshot"""
+        dest_ids = np.asarray(list(dest_ids), dtype="<i8")
+        rows = np.searchsorted(self.ids, dest_ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == dest_ids[found]
+        return rows[found]
+
+    def matching(self, text):
+        """Rows whose city or country contains `text`, case-insensitively"""
+        needle = text.lower().encode()
+        if not needle:
+            return np.arange(len(self))
+        if _KEY_FIELD.encode() in needle or _KEY_ROW.encode() in needle:
+            return np.array([], dtype=np.int64)
+        # Search the mapping in place rather than copying the keys out
+        start, _, size = self.header["sections"]["keys"]
+        end = start + size
+        hits = []
+        position = self._map.find(needle, start, end)
+        while position != -1:
+            hits.append(position - start)
+            # One match per row is enough; resume at the next row
+            row_end = self._map.find(_KEY_ROW.encode(), position, end)
+            position = self._map.find(needle, row_end + 1, end)
+        return np.searchsorted(self.search, hits, side="right") - 1
+
+
+class SnapshotReader:
+    """Hands out the current Snapshot of a path, swapping when it is replaced"""
+
+    def __init__(self, path):
+        self.path = path
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The latest complete snapshot, or None if the file does not exist"""
+        now = time.monotonic()
+        if now - self._checked < CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked >= CHECK_INTERVAL:
+                try:
+                    inode = os.stat(self.path).st_ino
+                except FileNotFoundError:
+                    inode = None
+                if inode is None:
+                    self._snapshot = None
+                elif self._snapshot is None or self._snapshot.inode != inode:
+                    # Old mappings stay valid until the last view of them is dropped
+                    self._snapshot = Snapshot(self.path)
+                self._checked = now
+        return self._snapshot
+
+
+_reader = SnapshotReader(os.environ["CATALOG_SNAPSHOT"]) if os.getenv("CATALOG_SNAPSHOT") else None
+
+
+def current():
+    """Snapshot configured by CATALOG_SNAPSHOT, or None to read the database"""
+    return _reader.current() if _reader is not None else None
+
+
+def snapshot_path():
+    return _reader.path if _reader is not None else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("build", "info"):
+        print("usage: python catalog_snapshot.py [build|info] <path>")
+        sys.exit(2)
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "build":
+        from planning import simulated_attributes
+        from ranking import CATEGORIES
+        started = time.perf_counter()
+        header = build(path, simulated_attributes, CATEGORIES)
+        print(f"✅ Wrote {header['count']:,} destinations to {path} "
+              f"({os.path.getsize(path):,} bytes, {time.perf_counter() - started:.2f}s)")
+    else:
+        snapshot = Snapshot(path)
+        print(f"📦 {path}: version {snapshot.version}, {len(snapshot):,} destinations")
+        for name, (offset, dtype, count) in snapshot.header["sections"].items():
+            print(f"   {name:<13} {dtype:<4} x {count:<10,} @ {offset}")
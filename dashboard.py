@@ -0,0 +1,111 @@
+# dashboard.py - Everything the app shows right after login, in one call
+#
+# The profile, recent bookings, pending trips and first suggestion page
+# don't depend on each other, so build_dashboard runs them at the same
+# time, each on its own pooled connection, and the request takes as long
+# as the slowest part rather than the sum of all four.
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from database.database import connected, User, Trip, Destination, FilteredSuggestion, FinalTrip
+from dataloader import Loaders
+import archive
+import catalog
+import planning
+
+# Shared by all requests, so one dashboard can't fan out past it
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("DASHBOARD_WORKERS", 8)),
+                              thread_name_prefix="dashboard")
+
+
+@connected
+def profile(user_id: int):
+    user = User.get_or_none(User.user_id == user_id)
+    if not user:
+        return None
+    return {
+        "user_id": user.user_id,
+        "username": user.user_name,
+        "email": user.email,
+        "city": user.city,
+        "country": user.country,
+    }
+
+
+def _place(destination):
+    # Archived trips may outlive their destination
+    return f"{destination.city}, {destination.country}" if destination else "Unknown destination"
+
+
+@connected
+def final_trips(user_id: int, limit=None):
+    """The user's booked trips, latest start date first, archived ones included"""
+    query = (FinalTrip
+             .select()
+             .where(FinalTrip.user_id == user_id)
+             .order_by(FinalTrip.startDate.desc(), FinalTrip.f_trip_id.desc()))
+    if limit is not None:
+        query = query.limit(limit)
+    trips = list(query)
+    if limit is None or len(trips) < limit:
+        # Archived months are all older than the ones still in final_trips
+        trips += archive.older_final_trips(user_id)[:None if limit is None else limit - len(trips)]
+    destinations = catalog.resolve_components(trips, Loaders(), [Destination])[Destination]
+    return [
+        {
+            "trip_id": trip.f_trip_id,
+            "destination": _place(destinations.get(trip.destination_id)),
+            "totalbudget": float(trip.totalbudget),
+            "startDate": str(trip.startDate),
+            "endDate": str(trip.endDate),
+            "paid": trip.paid_at is not None,
+        }
+        for trip in trips
+    ]
+
+
+@connected
+def pending_trips(user_id: int, limit=None):
+    """Trips the user is still planning: not over yet and nothing booked for them"""
+    booked = (FinalTrip
+              .select(FilteredSuggestion.trip)
+              .join(FilteredSuggestion, on=(FinalTrip.f_suggest == FilteredSuggestion.f_suggest_id)))
+    query = (Trip
+             .select(Trip, Destination)
+             .join(Destination)
+             .where((Trip.user == user_id) &
+                    (Trip.endDate >= date.today()) &
+                    Trip.trip_id.not_in(booked))
+             .order_by(Trip.startDate))
+    if limit is not None:
+        query = query.limit(limit)
+    return [
+        {
+            "trip_id": trip.trip_id,
+            "destination": f"{trip.destination.city}, {trip.destination.country}",
+            "maxBudget": trip.maxBudget,
+            "startDate": str(trip.startDate),
+            "endDate": str(trip.endDate),
+        }
+        for trip in query
+    ]
+
+
+def build_dashboard(user_id: int, recent: int = 5, suggestions: int = 5):
+    """Profile, recent FinalTrips, pending Trips and suggestions for one user"""
+    def submit(fn, *args):
+        # Each part sees the caller's request deadline and pool accounting
+        return executor.submit(contextvars.copy_context().run, fn, *args)
+
+    parts = {
+        "profile": submit(profile, user_id),
+        "recent_trips": submit(final_trips, user_id, recent),
+        "pending_trips": submit(pending_trips, user_id),
+        "suggestions": submit(planning.show_random_suggestions, user_id, suggestions),
+    }
+    result = {name: future.result() for name, future in parts.items()}
+    if result["profile"] is None:
+        return {"error": f"User {user_id} not found."}
+    result["suggestions"] = result["suggestions"].get("suggestions", [])
+    return result
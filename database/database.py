@@ -1,44 +1,200 @@
 # database/database.py
 from peewee import (
-    Model, CharField, AutoField, IntegerField, ForeignKeyField, DateField, FloatField, TimeField
+    CharField, AutoField, IntegerField, ForeignKeyField, DateField, FloatField, TimeField,
+    TextField, DateTimeField, CompositeKey
 )
-from playhouse.pool import PooledPostgresqlDatabase
+from peewee import OperationalError
+from contextvars import ContextVar
+from datetime import datetime
+from playhouse.pool import (
+    PooledDatabase, PooledPostgresqlDatabase, PooledSqliteDatabase, MaxConnectionsExceeded
+)
+# Signal-aware Model so save/delete hooks (e.g. destination_stats) can subscribe
+from playhouse.signals import Model
 import os
+import time
 from dotenv import load_dotenv
+from database.deadlines import current_deadline, DeadlineExceeded, SQLITE_PROGRESS_STEPS
 from urllib.parse import urlparse
 
 load_dotenv()
 
-try:
-    # Try to use DATABASE_URL first (for cloud), fallback to individual vars
-    database_url = os.getenv('DATABASE_URL')
-
-    if database_url:
-        # Parse the URL
-        parsed = urlparse(database_url)
-        db = PooledPostgresqlDatabase(
-            parsed.path[1:],  # database name (remove leading /)
-            user=parsed.username,
-            password=parsed.password,
-            host=parsed.hostname,
-            port=parsed.port or 5432
-        )
-    else:
-        # Fallback to old method
-        db = PooledPostgresqlDatabase(
-            os.getenv('DB_NAME', 'travel_planner_swe'),
-            user=os.getenv('DB_USER', 'postgres'),
-            password=os.getenv('DB_PASSWORD'),
-            host=os.getenv('DB_HOST', 'localhost'),
-            port=int(os.getenv('DB_PORT', 5432))
-        )
-    
-    db.connect()
-    print("Connected to PostgreSQL successfully!")
+# Set per request by admission.py to a threading.Event; a pool that times out
+# waiting for a connection sets it so the request can be answered with 503
+pool_exhausted = ContextVar('pool_exhausted', default=None)
+
+
+class _RequestAwarePool:
+    """Pool checkout bounded by the request deadline (database/deadlines.py)"""
+
+    def connect(self, reuse_if_open=False):
+        try:
+            current = current_deadline.get()
+            if current is None:
+                return super().connect(reuse_if_open)
+            wait = current.check()
+            if self._wait_timeout:
+                wait = min(wait, self._wait_timeout)
+            expires = time.monotonic() + wait
+            while True:
+                try:
+                    # One attempt, skipping PooledDatabase's own wait loop
+                    return super(PooledDatabase, self).connect(reuse_if_open)
+                except MaxConnectionsExceeded:
+                    if time.monotonic() >= expires:
+                        current.expired()
+                        raise
+                    time.sleep(0.05)
+        except MaxConnectionsExceeded:
+            flag = pool_exhausted.get()
+            if flag is not None:
+                flag.set()
+            raise
+
+
+class SqlitePool(_RequestAwarePool, PooledSqliteDatabase):
+    def execute_sql(self, sql, params=None, commit=None):
+        # The progress handler stays on the connection while the caller
+        # steps through the rows, and is replaced by the next statement
+        current = current_deadline.get()
+        conn = self.connection()
+        if getattr(self._state, 'deadline', None) is not current:
+            if current is None:
+                conn.set_progress_handler(None, 0)
+            else:
+                conn.set_progress_handler(current.expired, SQLITE_PROGRESS_STEPS)
+            self._state.deadline = current
+        if current is not None:
+            current.check()
+        try:
+            return super().execute_sql(sql, params)
+        except OperationalError as e:
+            if current is not None and current.hit:
+                raise DeadlineExceeded(f"Request deadline of {current.seconds:g}s exceeded") from e
+            raise
+
+    def _close(self, conn, close_conn=False):
+        # Pooled connections outlive the request that set the handler
+        try:
+            conn.set_progress_handler(None, 0)
+        except Exception:
+            close_conn = True
+        self._state.deadline = None
+        return super()._close(conn, close_conn)
+
+
+class PostgresPool(_RequestAwarePool, PooledPostgresqlDatabase):
+    def _set_timeout(self, statement):
+        # On its own cursor, so the statement peewee logs (and
+        # database/workload.py captures) is the caller's SQL unchanged
+        with self.connection().cursor() as cursor:
+            cursor.execute(statement)
+
+    def execute_sql(self, sql, params=None, commit=None):
+        current = current_deadline.get()
+        if current is not None:
+            self._set_timeout(f'SET statement_timeout = {max(1, int(current.check() * 1000))}')
+            self._state.timeout_set = True
+        elif getattr(self._state, 'timeout_set', False):
+            self._set_timeout('RESET statement_timeout')
+            # A rollback would undo the RESET along with the transaction
+            self._state.timeout_set = self.in_transaction()
+        try:
+            return super().execute_sql(sql, params)
+        except OperationalError as e:
+            if current is not None and 'statement timeout' in str(e):
+                current.hit = True
+                raise DeadlineExceeded(f"Request deadline of {current.seconds:g}s exceeded") from e
+            raise
+
+    def _close(self, conn, close_conn=False):
+        # Hand the connection back to the pool without this request's timeout
+        if getattr(self._state, 'timeout_set', False) and not close_conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+            except Exception:
+                close_conn = True
+        self._state.timeout_set = False
+        return super()._close(conn, close_conn)
+
+
+# Nothing connects at import: peewee opens a connection on first use, so
+# scripts and reloads start without a round trip even if the DB is down.
+# Try to use DATABASE_URL first (for cloud), fallback to individual vars
+database_url = os.getenv('DATABASE_URL')
+
+if database_url and database_url.startswith('sqlite'):
+    # Local stand-in, e.g. DATABASE_URL=sqlite:///travel_planner.db
+    parsed = urlparse(database_url)
+    db = SqlitePool(
+        parsed.path[1:] or ':memory:',
+        pragmas={'journal_mode': 'wal', 'busy_timeout': 10000, 'foreign_keys': 1},
+        check_same_thread=False,
+        max_connections=int(os.getenv('DB_MAX_CONNECTIONS', 32)),
+        timeout=int(os.getenv('DB_POOL_TIMEOUT', 30))  # wait for a free connection
+    )
+elif database_url:
+    # Parse the URL
+    parsed = urlparse(database_url)
+    db = PostgresPool(
+        parsed.path[1:],  # database name (remove leading /)
+        user=parsed.username,
+        password=parsed.password,
+        host=parsed.hostname,
+        port=parsed.port or 5432,
+        max_connections=int(os.getenv('DB_MAX_CONNECTIONS', 20)),
+        timeout=int(os.getenv('DB_POOL_TIMEOUT', 5))  # wait for a free connection
+    )
+else:
+    # Fallback to old method
+    db = PostgresPool(
+        os.getenv('DB_NAME', 'travel_planner_swe'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', 5432)),
+        max_connections=int(os.getenv('DB_MAX_CONNECTIONS', 20)),
+        timeout=int(os.getenv('DB_POOL_TIMEOUT', 5))
+    )
+
+
+def check_connection():
+    """Open and release one connection; True if the database is reachable"""
+    try:
+        with db.connection_context():
+            db.execute_sql('SELECT 1')
+        print(f"Connected to {'SQLite' if isinstance(db, PooledSqliteDatabase) else 'PostgreSQL'} successfully!")
+        return True
+    except Exception as e:
+        print("Connection failed:")
+        print(e)
+        return False
+
+def connected(fn):
+    """Run fn with a connection, opening (and closing) one if needed"""
+    def wrapper(*args, **kwargs):
+        connection_was_open = not db.is_closed()
+        if not connection_was_open:
+            db.connect()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if not connection_was_open and not db.is_closed():
+                db.close()
+    return wrapper
+
+def write_transaction():
+    """Transaction that takes the write lock up front.
+
+    On SQLite, BEGIN IMMEDIATE makes writers queue on the database lock
+    (busy_timeout) instead of failing later when upgrading a read lock.
+    Postgres uses a normal transaction; row locks come from the statements.
+    """
+    if isinstance(db, PooledSqliteDatabase) and not db.in_transaction():
+        return db.atomic('IMMEDIATE')
+    return db.atomic()
 
-except Exception as e:
-    print("Connection failed:")
-    print(e)
 
 class BaseModel(Model):
     class Meta:
@@ -47,7 +203,7 @@ class BaseModel(Model):
 
 class User(BaseModel):
     user_id = AutoField(primary_key=True)
-    user_name = CharField(max_length=20)
+    user_name = CharField(max_length=20, index=True)
     password = CharField(max_length=100, null=True)
     email = CharField(max_length=50, unique=True)
     city = CharField(max_length=50)
@@ -59,9 +215,12 @@ class User(BaseModel):
 
 class Destination(BaseModel):
     dest_id = AutoField(primary_key=True)
-    city = CharField(max_length=20)
-    country = CharField(max_length=100)
+    city = CharField(max_length=20, index=True)
+    country = CharField(max_length=100, index=True)
     description = CharField(max_length=500)
+    latitude = FloatField(null=True)
+    longitude = FloatField(null=True)
+    external_ref = CharField(max_length=64, null=True, unique=True)  # supplier id, see database/importer.py
     
     class Meta:
         table_name = 'destinations'
@@ -77,6 +236,10 @@ class Trip(BaseModel):
 
     class Meta:
         table_name = 'trips'
+        indexes = (
+            # Date-overlap lookups (see planning.find_trip_conflicts)
+            (('user', 'endDate', 'startDate'), False),
+        )
 
 
 class Food(BaseModel):
@@ -85,6 +248,7 @@ class Food(BaseModel):
     location = CharField(max_length=200)
     rating = FloatField()
     destination = ForeignKeyField(Destination, backref='foods', on_delete='CASCADE')
+    external_ref = CharField(max_length=64, null=True, unique=True)  # supplier id, see database/importer.py
     class Meta:
         table_name = 'food'
 
@@ -94,7 +258,9 @@ class Accommodation(BaseModel):
     name = CharField(max_length=100)
     type = IntegerField()  # Could be enum: hotel, hostel, apartment, etc.
     rating = FloatField()
+    rooms = IntegerField(default=10)  # Rooms sold per night, see RoomInventory
     destination = ForeignKeyField(Destination, backref='foods', on_delete='CASCADE')
+    external_ref = CharField(max_length=64, null=True, unique=True)  # supplier id, see database/importer.py
     class Meta:
         table_name = 'accommodations'
 
@@ -108,9 +274,14 @@ class Transport(BaseModel):
     transportType = IntegerField()  # Could be enum: flight, train, bus, etc.
     cost = FloatField()
     time = TimeField()
+    external_ref = CharField(max_length=64, null=True, unique=True)  # supplier id, see database/importer.py
     
     class Meta:
         table_name = 'transport'
+        indexes = (
+            # Inbound transport per destination (destination_stats)
+            (('destCity', 'destCountry'), False),
+        )
 
 
 class Suggestion(BaseModel):
@@ -121,6 +292,7 @@ class Suggestion(BaseModel):
     transport = ForeignKeyField(Transport, backref='suggestions', on_delete='CASCADE')
     destination = ForeignKeyField(Destination, backref='suggestions', on_delete='CASCADE')
     accommodation = ForeignKeyField(Accommodation, backref='suggestions', on_delete='CASCADE')
+    trip_start = DateField(null=True)  # trip.startDate, the partition key (see database/partitions.py)
     class Meta:
         table_name = 'suggestions'
 
@@ -134,6 +306,7 @@ class FilteredSuggestion(BaseModel):
     transport = ForeignKeyField(Transport, backref='filtered_suggestions', on_delete='CASCADE')
     destination = ForeignKeyField(Destination, backref='filtered_suggestions', on_delete='CASCADE')
     accommodation = ForeignKeyField(Accommodation, backref='filtered_suggestions', on_delete='CASCADE')
+    trip_start = DateField(null=True)  # trip.startDate, the partition key (see database/partitions.py)
     class Meta:
         table_name = 'filtered_suggestions'
 
@@ -158,9 +331,158 @@ class FinalTrip(BaseModel):
     totalbudget = FloatField()
     startDate = DateField()
     endDate = DateField()
+    paid_at = DateTimeField(null=True)  # set once by payment.checkout
 
     class Meta:
         table_name = 'final_trips'
+        indexes = (
+            # Date-overlap lookups (see planning.find_trip_conflicts)
+            (('user_id', 'endDate', 'startDate'), False),
+            # A user's trips in date order
+            (('user_id', 'startDate'), False),
+        )
+
+
+class DestinationStats(BaseModel):
+    # Summary row per destination, kept current by destination_stats.py
+    destination = ForeignKeyField(Destination, primary_key=True, backref='stats', on_delete='CASCADE')
+    food_count = IntegerField(default=0)
+    food_rating_sum = FloatField(default=0)
+    acco_count = IntegerField(default=0)
+    acco_rating_sum = FloatField(default=0)
+    min_transport_cost = FloatField(null=True)
+
+    class Meta:
+        table_name = 'destination_stats'
+
+
+class DestinationMonthRollup(BaseModel):
+    # Bookings and revenue per destination per travel month, kept by rollups.py
+    destination = ForeignKeyField(Destination, backref='monthly_rollups', on_delete='CASCADE')
+    month = DateField()  # first day of the month of startDate
+    bookings = IntegerField(default=0)
+    booked_revenue = FloatField(default=0)
+    paid_bookings = IntegerField(default=0)
+    paid_revenue = FloatField(default=0)
+
+    class Meta:
+        table_name = 'destination_month_rollup'
+        primary_key = CompositeKey('destination', 'month')
+        indexes = (
+            (('month',), False),
+        )
+
+
+class CountryWeekRollup(BaseModel):
+    # Bookings and revenue per destination country per travel week, kept by rollups.py
+    country = CharField(max_length=100)
+    week = DateField()  # Monday of the week of startDate
+    bookings = IntegerField(default=0)
+    booked_revenue = FloatField(default=0)
+    paid_bookings = IntegerField(default=0)
+    paid_revenue = FloatField(default=0)
+
+    class Meta:
+        table_name = 'country_week_rollup'
+        primary_key = CompositeKey('country', 'week')
+        indexes = (
+            (('week',), False),
+        )
+
+
+class RoomInventory(BaseModel):
+    # Rooms of one accommodation on one night; rows are created on first booking
+    inventory_id = AutoField(primary_key=True)
+    accommodation = ForeignKeyField(Accommodation, backref='inventory', on_delete='CASCADE')
+    night = DateField()
+    total_rooms = IntegerField()
+    booked_rooms = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'room_inventory'
+        indexes = (
+            (('accommodation', 'night'), True),
+        )
+
+
+class Job(BaseModel):
+    # Background work queued by jobs.enqueue and run by jobs.JobWorker
+    job_id = AutoField(primary_key=True)
+    name = CharField(max_length=100)
+    payload = TextField(default='{}')  # JSON
+    status = CharField(max_length=20, default='queued')  # queued, running, done, failed
+    attempts = IntegerField(default=0)
+    max_attempts = IntegerField(default=5)
+    run_at = DateTimeField(default=datetime.utcnow)
+    locked_until = DateTimeField(null=True)  # visibility timeout of a running job
+    locked_by = CharField(max_length=100, null=True)
+    result = TextField(null=True)  # JSON
+    last_error = TextField(null=True)
+    created_at = DateTimeField(default=datetime.utcnow)
+    finished_at = DateTimeField(null=True)
+
+    class Meta:
+        table_name = 'jobs'
+        indexes = (
+            (('status', 'run_at'), False),
+        )
+
+
+class Itinerary(BaseModel):
+    # Day-by-day plan of a FinalTrip, see itinerary.py; reused while inputs_hash matches
+    final_trip = ForeignKeyField(FinalTrip, primary_key=True, backref='itinerary', on_delete='CASCADE')
+    inputs_hash = CharField(max_length=40)
+    plan = TextField()  # JSON
+    generated_at = DateTimeField(default=datetime.utcnow)
+
+    class Meta:
+        table_name = 'itineraries'
+
+class TripStop(BaseModel):
+    # One destination of a multi-city Trip, in visiting order (see tours.py);
+    # Trip.destination is the first stop
+    stop_id = AutoField(primary_key=True)
+    trip = ForeignKeyField(Trip, backref='stops', on_delete='CASCADE')
+    position = IntegerField()
+    destination = ForeignKeyField(Destination, backref='trip_stops', on_delete='CASCADE')
+    arriveDate = DateField()
+    nights = IntegerField()
+    transport = ForeignKeyField(Transport, null=True, backref='trip_stops', on_delete='SET NULL')  # leg in; NULL if estimated
+    leg_cost = FloatField(default=0)
+
+    class Meta:
+        table_name = 'trip_stops'
+        indexes = (
+            (('trip', 'position'), True),
+        )
+
+
+class ArchiveSegment(BaseModel):
+    # One month of a partitioned table moved to a cold storage file by archive.py
+    segment_id = AutoField(primary_key=True)
+    table = CharField(max_length=50)
+    period = DateField()  # first day of the month
+    path = CharField(max_length=500)
+    rows = IntegerField()
+    bytes = IntegerField()
+    created_at = DateTimeField(default=datetime.utcnow)
+
+    class Meta:
+        table_name = 'archive_segments'
+        indexes = (
+            (('table', 'period'), True),
+        )
+
+
+class ArchiveSegmentUser(BaseModel):
+    # Users with rows in a segment, so reading one user's history opens only their files
+    segment = ForeignKeyField(ArchiveSegment, backref='users', on_delete='CASCADE')
+    user_id = IntegerField()
+
+    class Meta:
+        table_name = 'archive_segment_users'
+        primary_key = CompositeKey('user_id', 'segment')
+
 
 if __name__ == "__main__":
     # Create tables
@@ -174,7 +496,16 @@ if __name__ == "__main__":
         Suggestion, 
         FilteredSuggestion, 
         Admin,
-        FinalTrip
+        FinalTrip,
+        DestinationStats,
+        DestinationMonthRollup,
+        CountryWeekRollup,
+        RoomInventory,
+        Job,
+        Itinerary,
+        TripStop,
+        ArchiveSegment,
+        ArchiveSegmentUser
     ], safe=True)  
     print("All tables created successfully!")
     db.close()
\ No newline at end of file
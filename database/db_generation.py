@@ -37,7 +37,9 @@ def generate_destinations(n=500):
         destination = Destination.create(
             city=fake.city()[:20],
             country=fake.country()[:100],
-            description=fake.text(max_nb_chars=500)
+            description=fake.text(max_nb_chars=500),
+            latitude=float(fake.latitude()),
+            longitude=float(fake.longitude())
         )
         destinations.append(destination)
     print(f"✅ Created {n} destinations")
@@ -137,13 +139,15 @@ def generate_suggestions(trips, foods, transports, destinations, accommodations,
     for i in range(n):
         if i % 100 == 0:
             print(f"  Progress: {i}/{n} suggestions created")
+        trip = random.choice(trips)
         suggestion = Suggestion.create(
-            trip=random.choice(trips),
+            trip=trip,
             dailybudget=round(random.uniform(50, 500), 2),
             food=random.choice(foods),
             transport=random.choice(transports),
             destination=random.choice(destinations),
-            accommodation=random.choice(accommodations)
+            accommodation=random.choice(accommodations),
+            trip_start=trip.startDate
         )
         suggestions.append(suggestion)
     print(f"✅ Created {n} suggestions")
@@ -160,14 +164,16 @@ def generate_filtered_suggestions(trips, foods, transports, destinations, accomm
         daily = round(random.uniform(50, 500), 2)
         duration = random.randint(3, 14)
         
+        trip = random.choice(trips)
         filtered_suggestion = FilteredSuggestion.create(
-            trip=random.choice(trips),
+            trip=trip,
             totalbudget=round(daily * duration, 2),
             dailybudget=daily,
             food=random.choice(foods),
             transport=random.choice(transports),
             destination=random.choice(destinations),
-            accommodation=random.choice(accommodations)
+            accommodation=random.choice(accommodations),
+            trip_start=trip.startDate
         )
         filtered.append(filtered_suggestion)
     print(f"✅ Created {n} filtered suggestions")
@@ -0,0 +1,53 @@
+# database/deadlines.py - Per-request time budgets enforced by the database layer
+#
+# The API sets a Deadline for each request (see admission.py); code that
+# runs under it has its pool checkout wait, every Postgres statement_timeout
+# and a SQLite progress-handler interrupt capped at the time that is left.
+# Once it has passed, no further query is started.
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# SQLite VM instructions between deadline checks
+SQLITE_PROGRESS_STEPS = 10000
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before or during a query"""
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.hit = False  # set once the deadline has stopped some work
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        if time.monotonic() >= self.expires_at:
+            self.hit = True
+            return True
+        return False
+
+    def check(self):
+        """Seconds left; raises DeadlineExceeded if there are none"""
+        left = self.remaining()
+        if left <= 0:
+            self.hit = True
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded")
+        return left
+
+
+current_deadline = ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """Run the block under a deadline (None: no deadline)"""
+    token = current_deadline.set(Deadline(seconds) if seconds is not None else None)
+    try:
+        yield current_deadline.get()
+    finally:
+        current_deadline.reset(token)
@@ -0,0 +1,396 @@
+# database/importer.py - Streaming bulk import of supplier catalogs
+#
+#   python -m database.importer destinations destinations.csv
+#   python -m database.importer food restaurants.jsonl.gz --workers 4 --rejects bad.jsonl
+#
+# Files are read in chunks, validated in a process pool and upserted in
+# batches keyed on external_ref, so memory stays flat however large the
+# file is and re-importing the same file updates rows instead of
+# duplicating them. Import destinations before the files that point at them.
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from peewee import chunked
+from playhouse.pool import PooledSqliteDatabase
+from database.database import db, Destination, Food, Accommodation, Transport, write_transaction
+
+BATCH_SIZE = 5000
+# Bound parameters per statement (SQLITE_MAX_VARIABLE_NUMBER)
+SQLITE_MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+REQUIRED = object()
+
+
+class Reject(ValueError):
+    """A row that cannot be imported; the message is reported to the user"""
+
+
+# --- Field parsers (run in worker processes) ---
+
+def _text(max_length):
+    def parse(value):
+        value = str(value).strip()
+        if len(value) > max_length:
+            raise Reject(f"longer than {max_length} characters")
+        return value
+    return parse
+
+
+def _number(cast, low=None, high=None):
+    def parse(value):
+        try:
+            value = cast(value)
+        except (TypeError, ValueError):
+            raise Reject(f"not a valid {cast.__name__}: {value!r}")
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise Reject(f"{value} outside [{low}, {high}]")
+        return value
+    return parse
+
+
+def _clock(value):
+    parts = str(value).strip().split(":")
+    try:
+        h, m, s = (int(p) for p in (parts + ["0"])[:3])
+        if len(parts) not in (2, 3) or not (0 <= h < 24 and 0 <= m < 60 and 0 <= s < 60):
+            raise ValueError
+    except ValueError:
+        raise Reject(f"not a time of day: {value!r}")
+    return f"{h:02d}:{m:02d}:{s:02d}"
+
+
+# kind -> (model, [(field, parser, default)], natural key, has destination FK).
+# The natural key derives external_ref for rows that carry no `ref` column.
+KINDS = {
+    "destinations": (Destination, [
+        ("city", _text(20), REQUIRED),
+        ("country", _text(100), REQUIRED),
+        ("description", _text(500), ""),
+        ("latitude", _number(float, -90, 90), None),
+        ("longitude", _number(float, -180, 180), None),
+    ], ("city", "country"), False),
+    "food": (Food, [
+        ("name", _text(100), REQUIRED),
+        ("location", _text(200), REQUIRED),
+        ("rating", _number(float, 0, 5), REQUIRED),
+    ], ("name", "location"), True),
+    "accommodations": (Accommodation, [
+        ("name", _text(100), REQUIRED),
+        ("type", _number(int, 1, 5), REQUIRED),
+        ("rating", _number(float, 0, 5), REQUIRED),
+        ("rooms", _number(int, 0), 10),
+    ], ("name",), True),
+    "transport": (Transport, [
+        ("originCity", _text(100), REQUIRED),
+        ("originCountry", _text(100), REQUIRED),
+        ("destCity", _text(100), REQUIRED),
+        ("destCountry", _text(100), REQUIRED),
+        ("transportType", _number(int, 1, 5), REQUIRED),
+        ("cost", _number(float, 0), REQUIRED),
+        ("time", _clock, REQUIRED),
+    ], ("originCity", "originCountry", "destCity", "destCountry", "transportType", "time"), False),
+}
+
+
+def _derived_ref(kind, parts):
+    digest = hashlib.sha1("\x1f".join(str(p).lower() for p in parts).encode()).hexdigest()
+    return f"{kind}:{digest[:40]}"
+
+
+def _validate(kind, raw):
+    _, fields, natural_key, has_fk = KINDS[kind]
+    if not isinstance(raw, dict):
+        raise Reject("row is not an object")
+    row = {}
+    for name, parse, default in fields:
+        value = raw.get(name)
+        if value is None or value == "":
+            if default is REQUIRED:
+                raise Reject(f"missing {name}")
+            row[name] = default
+            continue
+        try:
+            row[name] = parse(value)
+        except Reject as e:
+            raise Reject(f"{name}: {e}")
+
+    identity = [row[name] for name in natural_key]
+    if has_fk:
+        # Resolved to a dest_id in the parent process (see DestinationCache)
+        if raw.get("destination_ref"):
+            row["destination"] = ("ref", str(raw["destination_ref"]).strip())
+        elif raw.get("destination_city") and raw.get("destination_country"):
+            row["destination"] = ("place", (str(raw["destination_city"]).strip(),
+                                            str(raw["destination_country"]).strip()))
+        else:
+            raise Reject("missing destination_ref or destination_city/destination_country")
+        identity.append(row["destination"][1])
+    ref = str(raw.get("ref") or raw.get("external_ref") or "").strip()
+    if len(ref) > 64:
+        raise Reject("ref: longer than 64 characters")
+    row["external_ref"] = ref or _derived_ref(kind, identity)
+    return row
+
+
+def validate_chunk(kind, chunk):
+    """Validate [(line, raw)] in a worker; returns (rows, rejects).
+
+    JSONL lines arrive as text so that decoding also happens off the main
+    process.
+    """
+    rows, rejects = [], []
+    for line, raw in chunk:
+        try:
+            if isinstance(raw, str):
+                try:
+                    raw = json.loads(raw)
+                except ValueError as e:
+                    raise Reject(f"invalid JSON: {e}")
+            rows.append((line, _validate(kind, raw)))
+        except Reject as e:
+            rejects.append({"line": line, "reason": str(e), "row": raw})
+    return rows, rejects
+
+
+# --- Reading ---
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="", encoding="utf-8")
+    return open(path, newline="", encoding="utf-8")
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "jsonl"
+
+
+def read_chunks(path, fmt=None, size=BATCH_SIZE):
+    """Yield lists of (line number, raw row) without loading the whole file"""
+    fmt = fmt or detect_format(path)
+    chunk = []
+    with _open(path) as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            rows = ((reader.line_num, raw) for raw in reader)
+        else:
+            rows = ((line, text) for line, text in enumerate(f, 1) if text.strip())
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- Writing (main process) ---
+
+class DestinationCache:
+    """Maps destination refs and (city, country) to dest_id.
+
+    Unknown keys of a whole batch are fetched with one IN query; misses are
+    cached too so a bad key costs one lookup per import, not one per row.
+    Places must match a destination's city and country exactly; duplicate
+    (city, country) rows resolve to the oldest destination.
+    """
+
+    def __init__(self):
+        self._by_ref = {}
+        self._by_place = {}
+        self.queries = 0
+
+    def resolve(self, keys):
+        refs = {value for kind, value in keys if kind == "ref" and value not in self._by_ref}
+        places = {value for kind, value in keys if kind == "place" and value not in self._by_place}
+        for batch in chunked(sorted(refs), 500):
+            for ref in batch:
+                self._by_ref[ref] = None
+            query = (Destination
+                     .select(Destination.dest_id, Destination.external_ref)
+                     .where(Destination.external_ref.in_(batch)))
+            self._by_ref.update({ref: dest_id for dest_id, ref in query.tuples()})
+            self.queries += 1
+        for batch in chunked(sorted(places), 500):
+            for place in batch:
+                self._by_place[place] = None
+            query = (Destination
+                     .select(Destination.dest_id, Destination.city, Destination.country)
+                     .where(Destination.city.in_(list({city for city, _ in batch})))
+                     .order_by(Destination.dest_id.desc()))
+            for dest_id, city, country in query.tuples():
+                if (city, country) in self._by_place:
+                    self._by_place[(city, country)] = dest_id
+            self.queries += 1
+
+    def get(self, key):
+        kind, value = key
+        return (self._by_ref if kind == "ref" else self._by_place).get(value)
+
+
+def _upsert_sqlite(model, names, rows):
+    preserve = [model._meta.fields[name] for name in names if name != "external_ref"]
+    per_statement = max(1, SQLITE_MAX_VARIABLES // len(names))
+    with write_transaction():
+        for batch in chunked(rows, per_statement):
+            (model
+             .insert_many(batch, fields=[model._meta.fields[name] for name in names])
+             .on_conflict(conflict_target=[model.external_ref], preserve=preserve)
+             .execute())
+
+
+def _upsert_copy(model, names, rows):
+    # COPY the batch into a temporary staging table, then merge it with one
+    # INSERT ... SELECT ... ON CONFLICT; far fewer round trips than VALUES lists.
+    table = model._meta.table_name
+    columns = [model._meta.fields[name].column_name for name in names]
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c != "external_ref")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["\\N" if value is None else value for value in row])
+    buffer.seek(0)
+    with db.atomic():
+        cursor = db.cursor()
+        cursor.execute(f'CREATE TEMP TABLE "staging_{table}" (LIKE "{table}" INCLUDING DEFAULTS) '
+                       f'ON COMMIT DROP')
+        cursor.copy_expert(f'COPY "staging_{table}" ({column_list}) FROM STDIN '
+                           f'WITH (FORMAT csv, NULL \'\\N\')', buffer)
+        cursor.execute(f'INSERT INTO "{table}" ({column_list}) '
+                       f'SELECT {column_list} FROM "staging_{table}" '
+                       f'ON CONFLICT ("external_ref") DO UPDATE SET {updates}')
+
+
+def _write(kind, rows, rejects, cache):
+    """Resolve FKs and upsert one validated batch; returns rows written"""
+    model, fields, _, has_fk = KINDS[kind]
+    if has_fk:
+        cache.resolve({row["destination"] for _, row in rows})
+        resolved = []
+        for line, row in rows:
+            dest_id = cache.get(row["destination"])
+            if dest_id is None:
+                rejects.append({"line": line, "reason": f"unknown destination {row['destination'][1]!r}",
+                                "row": {k: v for k, v in row.items() if k != "destination"}})
+                continue
+            row["destination"] = dest_id
+            resolved.append((line, row))
+        rows = resolved
+    if not rows:
+        return 0
+
+    # Later rows win when a file repeats a ref; Postgres refuses to update
+    # the same row twice in one statement.
+    latest = {row["external_ref"]: row for _, row in rows}
+    names = [name for name, _, _ in fields] + (["destination"] if has_fk else []) + ["external_ref"]
+    values = [tuple(row[name] for name in names) for row in latest.values()]
+    if isinstance(db, PooledSqliteDatabase):
+        _upsert_sqlite(model, names, values)
+    else:
+        _upsert_copy(model, names, values)
+    return len(values)
+
+
+def import_file(kind, path, fmt=None, batch_size=BATCH_SIZE, workers=None, rejects_path=None):
+    """Stream `path` into the `kind` table; returns a summary dict"""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind {kind!r}; expected one of {', '.join(KINDS)}")
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    summary = {"read": 0, "imported": 0, "rejected": 0}
+    cache = DestinationCache()
+    rejects_file = open(rejects_path, "w") if rejects_path else None
+    started = time.perf_counter()
+    next_report = 100_000
+
+    def handle(result):
+        nonlocal next_report
+        rows, rejects = result
+        summary["read"] += len(rows) + len(rejects)
+        summary["imported"] += _write(kind, rows, rejects, cache)
+        summary["rejected"] += len(rejects)
+        if rejects_file:
+            for reject in rejects:
+                rejects_file.write(json.dumps(reject, default=str) + "\n")
+        if summary["read"] >= next_report:
+            rate = summary["read"] / (time.perf_counter() - started)
+            print(f"  Progress: {summary['read']:,} rows read ({rate:,.0f} rows/s), "
+                  f"{summary['rejected']:,} rejected")
+            next_report += 100_000
+
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    try:
+        pending = deque()
+        for chunk in read_chunks(path, fmt, batch_size):
+            if pool is None:
+                handle(validate_chunk(kind, chunk))
+                continue
+            # A couple of chunks per worker in flight keeps them busy while
+            # bounding memory; results are written in file order.
+            pending.append(pool.submit(validate_chunk, kind, chunk))
+            if len(pending) >= 2 * workers:
+                handle(pending.popleft().result())
+        while pending:
+            handle(pending.popleft().result())
+
+        if kind != "destinations" and summary["imported"]:
+            # insert_many bypasses the save signals that keep these current
+            import destination_stats
+            destination_stats.reconcile()
+        if summary["imported"]:
+            # Bulk upserts skip the save signals; tell other processes' caches
+            from cache_bus import bus
+            bus.publish(KINDS[kind][0]._meta.table_name)
+        if kind == "destinations" and summary["imported"]:
+            # Upserts may have changed rows the mapped snapshot already holds
+            import catalog_snapshot
+            if catalog_snapshot.snapshot_path():
+                from planning import simulated_attributes
+                from ranking import CATEGORIES
+                catalog_snapshot.build(catalog_snapshot.snapshot_path(), simulated_attributes, CATEGORIES)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if rejects_file:
+            rejects_file.close()
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    summary["rows_per_second"] = round(summary["read"] / summary["seconds"]) if summary["seconds"] else None
+    summary["destination_lookups"] = cache.queries
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import supplier catalogs")
+    parser.add_argument("kind", choices=list(KINDS))
+    parser.add_argument("path", help=".csv or .jsonl file, optionally .gz")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="validation processes (default: CPU count, 0 = inline)")
+    parser.add_argument("--rejects", default=None, help="write rejected rows here as JSONL")
+    args = parser.parse_args(argv)
+
+    print(f"Importing {args.kind} from {args.path}...")
+    summary = import_file(args.kind, args.path, args.format, args.batch_size, args.workers, args.rejects)
+    print(f"✅ Imported {summary['imported']:,} of {summary['read']:,} rows in {summary['seconds']}s "
+          f"({summary['rows_per_second'] or 0:,} rows/s)")
+    if summary["rejected"]:
+        where = f", see {args.rejects}" if args.rejects else " (use --rejects to keep them)"
+        print(f"⚠️  Rejected {summary['rejected']:,} rows{where}")
+
+
+if __name__ == "__main__":
+    main()
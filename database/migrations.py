@@ -0,0 +1,432 @@
+# database/migrations.py - Versioned schema migrations and an index advisor
+#
+#   python -m database.migrations status
+#   python -m database.migrations upgrade
+#   python -m database.migrations advise --workload queries.jsonl
+#
+# The workload file is written by the API when QUERY_LOG=<path> is set
+# (see database/workload.py).
+import argparse
+import json
+import re
+from datetime import datetime
+from peewee import IntegerField, CharField, DateTimeField, FloatField, DateField
+from playhouse.migrate import migrate, PostgresqlMigrator, SqliteMigrator
+from playhouse.pool import PooledSqliteDatabase
+from database.database import (
+    db, BaseModel, User, Destination, Trip, Food, Accommodation, Transport,
+    Suggestion, FilteredSuggestion, Admin, FinalTrip, DestinationStats,
+    DestinationMonthRollup, CountryWeekRollup, RoomInventory, Job, Itinerary, TripStop,
+    ArchiveSegment, ArchiveSegmentUser
+)
+from database.workload import load_workload
+
+
+class SchemaVersion(BaseModel):
+    # One row per applied migration
+    version = IntegerField(primary_key=True)
+    name = CharField(max_length=100)
+    applied_at = DateTimeField(default=datetime.utcnow)
+
+    class Meta:
+        table_name = 'schema_version'
+
+
+MODELS = [User, Destination, Trip, Food, Accommodation, Transport, Suggestion,
+          FilteredSuggestion, Admin, FinalTrip, DestinationStats, RoomInventory, Job]
+
+# (version, name, function); applied in version order, each in its own transaction
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def is_sqlite():
+    return isinstance(db, PooledSqliteDatabase)
+
+
+def _migrator():
+    return SqliteMigrator(db) if is_sqlite() else PostgresqlMigrator(db)
+
+
+def _columns(table):
+    return {column.name for column in db.get_columns(table)}
+
+
+def _has_index(table, columns):
+    """True if some index on `table` starts with exactly these columns"""
+    columns = list(columns)
+    return any(list(index.columns)[:len(columns)] == columns for index in db.get_indexes(table))
+
+
+def _add_missing_columns(table, fields):
+    present = _columns(table)
+    operations = [_migrator().add_column(table, name, field)
+                  for name, field in fields if name not in present]
+    if operations:
+        migrate(*operations)
+
+
+def _add_missing_indexes(indexes):
+    operations = [_migrator().add_index(table, columns, unique)
+                  for table, columns, unique in indexes if not _has_index(table, columns)]
+    if operations:
+        migrate(*operations)
+
+
+# --- Migrations ---
+# Never edit a migration that has shipped; add a new one instead.
+
+@migration(1, "create_missing_tables")
+def _create_missing_tables():
+    # Fresh databases get every table with its current columns and indexes;
+    # the later migrations then find nothing to do.
+    db.create_tables([model for model in MODELS if not model.table_exists()])
+
+
+@migration(2, "destination_coordinates")
+def _destination_coordinates():
+    _add_missing_columns('destinations', [
+        ('latitude', FloatField(null=True)),
+        ('longitude', FloatField(null=True)),
+    ])
+
+
+@migration(3, "accommodation_rooms")
+def _accommodation_rooms():
+    _add_missing_columns('accommodations', [('rooms', IntegerField(default=10))])
+
+
+@migration(4, "hot_query_indexes")
+def _hot_query_indexes():
+    _add_missing_indexes([
+        ('destinations', ['city'], False),
+        ('destinations', ['country'], False),
+        ('users', ['user_name'], False),
+        ('final_trips', ['user_id', 'startDate'], False),
+        ('final_trips', ['user_id', 'endDate', 'startDate'], False),
+        ('trips', ['user_id', 'endDate', 'startDate'], False),
+        ('transport', ['destCity', 'destCountry'], False),
+    ])
+
+
+@migration(5, "catalog_external_refs")
+def _catalog_external_refs():
+    # Supplier ids that database/importer.py upserts on (NULL for Faker rows)
+    for table in ('destinations', 'food', 'accommodations', 'transport'):
+        _add_missing_columns(table, [('external_ref', CharField(max_length=64, null=True, unique=True))])
+
+
+@migration(6, "booking_rollups")
+def _booking_rollups():
+    _add_missing_columns('final_trips', [('paid_at', DateTimeField(null=True))])
+    db.create_tables([model for model in (DestinationMonthRollup, CountryWeekRollup)
+                      if not model.table_exists()])
+    # Fill them from existing bookings
+    import rollups
+    rollups.rebuild()
+
+
+@migration(7, "itineraries")
+def _itineraries():
+    # Filled on demand and by the build_itineraries job
+    Itinerary.create_table(safe=True)
+
+
+@migration(8, "trip_stops")
+def _trip_stops():
+    # Destinations of multi-city trips, see tours.py
+    TripStop.create_table(safe=True)
+
+
+@migration(9, "time_partitions")
+def _time_partitions():
+    # Suggestions get their trip's start date to be partitioned on, see
+    # database/partitions.py
+    for model in (Suggestion, FilteredSuggestion):
+        _add_missing_columns(model._meta.table_name, [('trip_start', DateField(null=True))])
+        (model
+         .update(trip_start=Trip.select(Trip.startDate).where(Trip.trip_id == model.trip))
+         .where(model.trip_start.is_null())
+         .execute())
+    _add_missing_indexes([
+        ('final_trips', ['startDate'], False),
+        ('filtered_suggestions', ['trip_start'], False),
+        ('suggestions', ['trip_start'], False),
+    ])
+    db.create_tables([model for model in (ArchiveSegment, ArchiveSegmentUser)
+                      if not model.table_exists()])
+    from database import partitions
+    if not is_sqlite():
+        for model, key in partitions.POLICIES:
+            partitions.convert_postgres(model, key)
+        partitions.ensure_partitions()
+
+
+@migration(10, "sqlite_autoincrement")
+def _sqlite_autoincrement():
+    # roll() can move a table's newest rows out (bookings may start in the
+    # past), and SQLite would then hand their ids out again. AUTOINCREMENT
+    # never reuses one; its counter starts after every id moved out so far.
+    if not is_sqlite():
+        return
+    from database import partitions
+    import archive
+    for model, _ in partitions.POLICIES:
+        table, pk = model._meta.table_name, model._meta.primary_key.column_name
+        used = [db.execute_sql(f'SELECT MAX("{pk}") FROM "{name}"').fetchone()[0]
+                for name in [table] + [name for _, name in partitions.partitions(table)]]
+        for segment in ArchiveSegment.select().where(ArchiveSegment.table == table):
+            used += [row[pk] for row in archive.read_segment(segment.path)]
+        _rebuild_autoincrement(table, pk)
+        db.execute_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        db.execute_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                       (table, max([row_id for row_id in used if row_id is not None], default=0)))
+
+
+def _rebuild_autoincrement(table, pk):
+    """SQLite: recreate `table` with an AUTOINCREMENT primary key, keeping rows and indexes"""
+    definition, = db.execute_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                 (table,)).fetchone()
+    if "AUTOINCREMENT" in definition.upper():
+        return
+    column = f'"{pk}" INTEGER NOT NULL PRIMARY KEY'
+    if column not in definition:
+        raise RuntimeError(f"Unexpected primary key on {table}: {definition}")
+    indexes = [sql for sql, in db.execute_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+    rebuilt = f"{table}_rebuilt"
+    db.execute_sql(definition.replace(f'"{table}"', f'"{rebuilt}"', 1)
+                   .replace(column, column + " AUTOINCREMENT", 1))
+    db.execute_sql(f'INSERT INTO "{rebuilt}" SELECT * FROM "{table}"')
+    db.execute_sql(f'DROP TABLE "{table}"')
+    db.execute_sql(f'ALTER TABLE "{rebuilt}" RENAME TO "{table}"')
+    for sql in indexes:
+        db.execute_sql(sql)
+
+
+def _applied():
+    SchemaVersion.create_table(safe=True)
+    return {row.version: row for row in SchemaVersion.select()}
+
+
+def upgrade(target=None):
+    """Apply pending migrations up to `target` (default: all); returns versions applied"""
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        if is_sqlite():
+            # A table rebuilt by a migration is dropped first, which must not
+            # cascade to the rows pointing at it; set outside any transaction
+            db.pragma('foreign_keys', 0)
+        applied = _applied()
+        done = []
+        for version, name, fn in MIGRATIONS:
+            if version in applied or (target is not None and version > target):
+                continue
+            with db.atomic():
+                fn()
+                SchemaVersion.create(version=version, name=name)
+            print(f"✅ Applied migration {version:03d} {name}")
+            done.append(version)
+        if not done:
+            print("✅ Schema is up to date")
+        return done
+    finally:
+        if is_sqlite() and not db.is_closed():
+            db.pragma('foreign_keys', 1)
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def status():
+    """[(version, name, applied_at or None)] for every known migration"""
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        applied = _applied()
+        return [(version, name, applied[version].applied_at if version in applied else None)
+                for version, name, _ in MIGRATIONS]
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+# --- Index advisor ---
+
+_ALIAS = re.compile(r'(?:FROM|JOIN|UPDATE)\s+"(\w+)"(?:\s+AS\s+"(\w+)")?', re.I)
+_PREDICATE = re.compile(
+    r'"(\w+)"\."(\w+)"\s*(=|!=|<>|<=|>=|<|>|NOT IN|IN|ILIKE|LIKE|BETWEEN|IS)\s', re.I)
+_CLAUSE_END = re.compile(r'\s(?:GROUP BY|ORDER BY|LIMIT|OFFSET|FOR UPDATE)\s', re.I)
+_EQUALITY = {'=', 'IN', 'IS'}
+_RANGE = {'<', '>', '<=', '>=', 'BETWEEN'}
+
+
+def _filter_columns(sql):
+    """{table: [(column, operator), ...]} for the predicates in WHERE/ON.
+
+    Relies on peewee's SQL shape: every column is written "alias"."column",
+    and tables are introduced as "table" AS "alias".
+    """
+    aliases = {}
+    for table, alias in _ALIAS.findall(sql):
+        aliases[alias or table] = table
+    start = re.search(r'\s(?:FROM|WHERE)\s', sql, re.I)
+    body = sql[start.start():] if start else sql
+    end = _CLAUSE_END.search(body)
+    if end:
+        body = body[:end.start()]
+    columns = {}
+    for qualifier, column, op in _PREDICATE.findall(body):
+        table = aliases.get(qualifier, qualifier)
+        entry = (column, op.upper())
+        if entry not in columns.setdefault(table, []):
+            columns[table].append(entry)
+    return columns, aliases
+
+
+def _to_db_params(sql):
+    # Logs captured on one backend can be replayed on the other
+    if is_sqlite():
+        return sql.replace('%s', '?')
+    return sql.replace('?', '%s')
+
+
+def _seq_scans(sql, params, aliases):
+    """[(table, cost)] for every full table scan in the plan.
+
+    Postgres reports the planner's cost for the scan node; SQLite has no
+    costs, so the table's row count stands in for it.
+    """
+    if is_sqlite():
+        rows = db.execute_sql('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        scans = []
+        for row in rows:
+            match = re.match(r'SCAN (?:TABLE )?(\w+)(.*)$', row[-1])
+            # "SCAN t1 USING INDEX ..." walks an index, not the table
+            if match and 'USING' not in match.group(2):
+                table = aliases.get(match.group(1), match.group(1))
+                count = db.execute_sql(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                scans.append((table, count))
+        return scans
+
+    plan = db.execute_sql('EXPLAIN (FORMAT JSON) ' + sql, params).fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append((node['Relation Name'], node.get('Total Cost', 0)))
+        nodes.extend(node.get('Plans', []))
+    return scans
+
+
+def _suggest(table, predicates):
+    """Index columns for one scanned table, or None.
+
+    Equality columns go first so a single range column can follow them;
+    btree indexes stop being selective after the first range column.
+    """
+    equality = [column for column, op in predicates if op in _EQUALITY]
+    ranges = [column for column, op in predicates if op in _RANGE and column not in equality]
+    columns = equality + ranges[:1]
+    return columns or None
+
+
+def advise(workload_path, top=10):
+    """EXPLAIN every captured query template and rank missing indexes.
+
+    Benefit is estimated as executions x scan cost (planner cost units on
+    Postgres, rows scanned on SQLite): how much full-scan work per workload
+    an index on the suggested columns would remove.
+    """
+    counts, samples = load_workload(workload_path)
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    suggestions = {}
+    notes = []
+    try:
+        for sql, executions in counts.items():
+            predicates, aliases = _filter_columns(sql)
+            try:
+                scans = _seq_scans(_to_db_params(sql), samples[sql], aliases)
+            except Exception as e:
+                notes.append(f"Could not EXPLAIN ({e}): {sql[:120]}")
+                continue
+            for table, cost in scans:
+                table_predicates = predicates.get(table, [])
+                if any(op in ('LIKE', 'ILIKE') for _, op in table_predicates):
+                    notes.append(f"{table}: LIKE/ILIKE with a leading % cannot use a btree; "
+                                 f"consider a pg_trgm GIN index")
+                columns = _suggest(table, table_predicates)
+                if columns is None:
+                    continue
+                key = (table, tuple(columns))
+                entry = suggestions.setdefault(key, {
+                    "table": table, "columns": columns, "benefit": 0, "executions": 0,
+                    "exists": _has_index(table, columns), "example": sql,
+                })
+                entry["benefit"] += executions * cost
+                entry["executions"] += executions
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+    ranked = sorted((s for s in suggestions.values() if s["benefit"] > 0),
+                    key=lambda s: s["benefit"], reverse=True)[:top]
+    return ranked, sorted(set(notes))
+
+
+def _index_ddl(table, columns):
+    name = f"{table}_{'_'.join(columns)}"
+    cols = ', '.join(f'"{c}"' for c in columns)
+    return f'CREATE INDEX "{name}" ON "{table}" ({cols});'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schema migrations and index advisor")
+    commands = parser.add_subparsers(dest="command", required=True)
+    up = commands.add_parser("upgrade", help="apply pending migrations")
+    up.add_argument("--to", type=int, default=None, help="stop at this version")
+    commands.add_parser("status", help="list applied and pending migrations")
+    adv = commands.add_parser("advise", help="suggest indexes for a captured workload")
+    adv.add_argument("--workload", required=True, help="JSONL file written with QUERY_LOG")
+    adv.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        upgrade(args.to)
+    elif args.command == "status":
+        for version, name, applied_at in status():
+            state = f"applied {applied_at:%Y-%m-%d %H:%M}" if applied_at else "pending"
+            print(f"{version:03d} {name:<28} {state}")
+    else:
+        ranked, notes = advise(args.workload, args.top)
+        if not ranked:
+            print("✅ No sequential scans with indexable filters in this workload")
+        for i, s in enumerate(ranked, 1):
+            print(f"\n{i}. {s['table']} ({', '.join(s['columns'])}) — "
+                  f"benefit ≈ {s['benefit']:,.0f} over {s['executions']} executions")
+            if s["exists"]:
+                print("   An index with these columns exists but was not used "
+                      "(small table or stale statistics; try ANALYZE)")
+            else:
+                print(f"   {_index_ddl(s['table'], s['columns'])}")
+            print(f"   e.g. {s['example'][:160]}")
+        for note in notes:
+            print(f"⚠️  {note}")
+
+
+if __name__ == "__main__":
+    main()
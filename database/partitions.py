@@ -0,0 +1,235 @@
+# database/partitions.py - Monthly partitions of the tables that only grow
+#
+# final_trips, filtered_suggestions and suggestions are split by the month
+# their trip starts (final_trips.startDate; trip_start, copied from the
+# trip, on the other two):
+#
+#   Postgres  native declarative partitions, one per month plus a default
+#             one for rows with no month yet. Migration 9 converts the
+#             tables; ensure_partitions() keeps MONTHS_AHEAD months ready.
+#   SQLite    no partitions: the table keeps the hot months, and roll()
+#             moves rows older than HOT_MONTHS into one archive table per
+#             month (final_trips_p202401), a chunk per transaction.
+#             Migration 10 gives the tables AUTOINCREMENT ids, so the id
+#             of a row moved out is never handed out again.
+#
+# partitions(table) lists the months that can be moved out on their own,
+# which archive.py does once they are ARCHIVE_AFTER_MONTHS old.
+#
+# A partitioned Postgres table can't be the target of a foreign key on its
+# id alone, so the conversion drops the keys pointing at these tables
+# (final_trips.f_suggest, itineraries.final_trip); archive.py deletes the
+# itineraries of archived trips itself.
+import os
+import re
+from datetime import date
+from playhouse.pool import PooledSqliteDatabase
+from database.database import (
+    db, write_transaction, Suggestion, FilteredSuggestion, FinalTrip, ArchiveSegment
+)
+
+# (model, partition key field), in the order rows move out: final_trips
+# before the filtered_suggestions they point at
+POLICIES = [
+    (FinalTrip, FinalTrip.startDate),
+    (FilteredSuggestion, FilteredSuggestion.trip_start),
+    (Suggestion, Suggestion.trip_start),
+]
+HOT_MONTHS = int(os.getenv("PARTITION_HOT_MONTHS", 6))  # SQLite: months kept in the main table
+MONTHS_AHEAD = 3                                        # Postgres: future partitions kept ready
+CHUNK_SIZE = 2000
+
+
+def is_sqlite():
+    return isinstance(db, PooledSqliteDatabase)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, period):
+    return f"{table}_p{period:%Y%m}"
+
+
+def _period_of(table, name):
+    match = re.fullmatch(re.escape(table) + r"_p(\d{4})(\d{2})", name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def policy(table):
+    for model, key in POLICIES:
+        if model._meta.table_name == table:
+            return model, key
+    raise KeyError(table)
+
+
+def partitions(table):
+    """[(first day of month, table name)] of the table's monthly partitions, oldest first"""
+    if is_sqlite():
+        names = [name for name, in db.execute_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f"{table}_p%",))]
+    else:
+        names = [name for name, in db.execute_sql(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = %s", (table,))]
+    found = [(_period_of(table, name), name) for name in names]
+    return sorted((period, name) for period, name in found if period is not None)
+
+
+def frozen_before(table):
+    """Rows of months before this are out of the main table (SQLite) or archived; None if none are"""
+    periods = []
+    if ArchiveSegment.table_exists():  # before migration 9
+        periods += [period for period, in (ArchiveSegment
+                                           .select(ArchiveSegment.period)
+                                           .where(ArchiveSegment.table == table)
+                                           .tuples())]
+    if is_sqlite():
+        periods += [period for period, _ in partitions(table)]
+    return add_months(max(periods), 1) if periods else None
+
+
+def drop_partition(table, name):
+    if not is_sqlite():
+        db.execute_sql(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    db.execute_sql(f'DROP TABLE "{name}"')
+
+
+# --- Postgres ---
+
+def is_partitioned(table):
+    return bool(db.execute_sql("SELECT 1 FROM pg_class WHERE relname = %s AND relkind = 'p'",
+                               (table,)).fetchone())
+
+
+def convert_postgres(model, key):
+    """Turn model's table into one partitioned by month of key, keeping its rows"""
+    table, pk = model._meta.table_name, model._meta.primary_key.column_name
+    if is_partitioned(table):
+        return
+    legacy = f"{table}_unpartitioned"
+    # Secondary indexes, to rebuild on the new table
+    indexes = [definition for definition, in db.execute_sql(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+        "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)", (table, table))]
+    sequence, = db.execute_sql("SELECT pg_get_serial_sequence(%s, %s)", (table, pk)).fetchone()
+    db.execute_sql(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+    db.execute_sql(f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+                   f'PARTITION BY RANGE ("{key.column_name}")')
+    # Unique keys of a partitioned table must contain the partition key
+    db.execute_sql(f'CREATE UNIQUE INDEX "{table}_{pk}_key" ON "{table}" ("{pk}", "{key.column_name}")')
+    db.execute_sql(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+    first, = db.execute_sql(f'SELECT MIN("{key.column_name}") FROM "{legacy}"').fetchone()
+    period = month_start(first or date.today())
+    while period <= add_months(month_start(date.today()), MONTHS_AHEAD):
+        _create_partition(table, period)
+        period = add_months(period, 1)
+    db.execute_sql(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+    if sequence:
+        db.execute_sql(f'ALTER SEQUENCE {sequence} OWNED BY "{table}"."{pk}"')
+    # CASCADE drops the foreign keys that pointed at the old table
+    db.execute_sql(f'DROP TABLE "{legacy}" CASCADE')
+    for definition in indexes:
+        # Read before the rename, so they already name the new table
+        db.execute_sql(definition)
+    # Keys from this table to the others still hold
+    for field in model._meta.refs:
+        if field.rel_model._meta.table_name not in {m._meta.table_name for m, _ in POLICIES}:
+            model._schema.create_foreign_key(field)
+
+
+def _create_partition(table, period):
+    """Create one month's partition, taking over its rows from the default partition"""
+    _, key = policy(table)
+    name, until = partition_name(table, period), add_months(period, 1)
+    if db.execute_sql("SELECT 1 FROM pg_class WHERE relname = %s", (name,)).fetchone():
+        return
+    column = key.column_name
+    db.execute_sql(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)')
+    db.execute_sql(f'WITH moved AS (DELETE FROM "{table}_default" '
+                   f'WHERE "{column}" >= %s AND "{column}" < %s RETURNING *) '
+                   f'INSERT INTO "{name}" SELECT * FROM moved', (period, until))
+    db.execute_sql(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+                   (period, until))
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    """Postgres: create the coming months' partitions before rows need them"""
+    if is_sqlite():
+        return 0
+    created = 0
+    with db.atomic():
+        for model, _ in POLICIES:
+            table = model._meta.table_name
+            existing = {period for period, _ in partitions(table)}
+            period = month_start(date.today())
+            for _ in range(months_ahead + 1):
+                if period not in existing:
+                    _create_partition(table, period)
+                    created += 1
+                period = add_months(period, 1)
+    return created
+
+
+# --- SQLite ---
+
+def _ensure_archive_table(table, name):
+    db.execute_sql(f'CREATE TABLE IF NOT EXISTS "{name}" AS SELECT * FROM "{table}" WHERE 0')
+    model, _ = policy(table)
+    pk = model._meta.primary_key.column_name
+    db.execute_sql(f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}_{pk}" ON "{name}" ("{pk}")')
+    if model is FinalTrip:
+        column = FinalTrip.user_id.column_name
+        db.execute_sql(f'CREATE INDEX IF NOT EXISTS "{name}_{column}" ON "{name}" ("{column}")')
+
+
+def _still_referenced(model):
+    """SQL condition true for rows a hot final_trips row still points at"""
+    if model is FilteredSuggestion:
+        return (f'EXISTS (SELECT 1 FROM "final_trips" '
+                f'WHERE "final_trips"."{FinalTrip.f_suggest.column_name}" = "filtered_suggestions"."f_suggest_id")')
+    return None
+
+
+def roll(hot_months=HOT_MONTHS, chunk_size=CHUNK_SIZE):
+    """SQLite: move rows of months before the hot window to their month's archive table"""
+    if not is_sqlite():
+        return {}
+    cutoff = add_months(month_start(date.today()), -hot_months)
+    moved = {}
+    for model, key in POLICIES:
+        table, pk = model._meta.table_name, model._meta.primary_key.column_name
+        condition = f'"{key.column_name}" < ?'
+        referenced = _still_referenced(model)
+        if referenced:
+            condition += f" AND NOT {referenced}"
+        moved[table] = 0
+        last = 0
+        while True:
+            with write_transaction():
+                rows = db.execute_sql(
+                    f'SELECT "{pk}", "{key.column_name}" FROM "{table}" WHERE {condition} AND "{pk}" > ? '
+                    f'ORDER BY "{pk}" LIMIT ?', (str(cutoff), last, chunk_size)).fetchall()
+                if not rows:
+                    break
+                by_period = {}
+                for row_id, day in rows:
+                    by_period.setdefault(month_start(date.fromisoformat(str(day)[:10])), []).append(row_id)
+                for period, ids in by_period.items():
+                    name = partition_name(table, period)
+                    _ensure_archive_table(table, name)
+                    marks = ", ".join("?" * len(ids))
+                    db.execute_sql(f'INSERT INTO "{name}" SELECT * FROM "{table}" '
+                                   f'WHERE "{pk}" IN ({marks})', ids)
+                    db.execute_sql(f'DELETE FROM "{table}" WHERE "{pk}" IN ({marks})', ids)
+                moved[table] += len(rows)
+                last = rows[-1][0]
+    return moved
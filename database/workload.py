@@ -0,0 +1,79 @@
+# database/workload.py - Capture the SQL the app runs, for the index advisor
+import json
+import logging
+import threading
+from collections import Counter
+
+# Only statements that can use an index are worth replaying
+CAPTURED = ("SELECT", "UPDATE", "DELETE")
+
+
+class QueryLogHandler(logging.Handler):
+    """Appends every query peewee logs to a JSONL file as {"sql", "params"}"""
+
+    def __init__(self, path):
+        super().__init__(logging.DEBUG)
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+
+    def emit(self, record):
+        # peewee logs each statement as a (sql, params) tuple at DEBUG
+        if not isinstance(record.msg, tuple) or len(record.msg) != 2:
+            return
+        sql, params = record.msg
+        if not sql.lstrip().upper().startswith(CAPTURED):
+            return
+        try:
+            self._file.write(json.dumps({"sql": sql, "params": list(params or ())}, default=str) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+_handler = None
+_lock = threading.Lock()
+
+
+def start_capture(path):
+    """Start logging queries to `path` (idempotent); returns the handler"""
+    global _handler
+    with _lock:
+        if _handler is None:
+            _handler = QueryLogHandler(path)
+            logger = logging.getLogger("peewee")
+            logger.addHandler(_handler)
+            logger.setLevel(logging.DEBUG)
+            print(f"📝 Capturing query workload to {path}")
+        return _handler
+
+
+def stop_capture():
+    global _handler
+    with _lock:
+        if _handler is not None:
+            logging.getLogger("peewee").removeHandler(_handler)
+            _handler.close()
+            _handler = None
+
+
+def load_workload(path):
+    """Group a captured log by statement text.
+
+    peewee always parameterizes values, so the SQL string is already the
+    query template. Returns (Counter of sql -> executions, {sql: params of
+    one execution}) so the advisor can EXPLAIN each template once.
+    """
+    counts = Counter()
+    samples = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            counts[entry["sql"]] += 1
+            samples.setdefault(entry["sql"], entry["params"])
+    return counts, samples
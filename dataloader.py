@@ -0,0 +1,94 @@
+# dataloader.py - Request-scoped batching of primary-key lookups
+
+# Keep IN (...) lists well under driver parameter limits
+MAX_BATCH = 1000
+
+
+class BatchLoader:
+    """Collects keys for one model and fetches them in a single IN query.
+
+    Callers `queue()` every key they are going to need, then `load()` /
+    `load_many()` them; the first load dispatches everything queued so far
+    as one query, and later loads are served from the per-request cache.
+    """
+
+    def __init__(self, model, key_field=None):
+        self.model = model
+        self.key_field = key_field or model._meta.primary_key
+        self._cache = {}
+        self._pending = set()
+        self.queries = 0
+
+    def queue(self, key):
+        if key is not None and key not in self._cache:
+            self._pending.add(key)
+
+    def queue_many(self, keys):
+        for key in keys:
+            self.queue(key)
+
+    def prime(self, obj):
+        """Seed the cache with a row the caller already has"""
+        key = getattr(obj, self.key_field.name)
+        self._cache[key] = obj
+        self._pending.discard(key)
+
+    def dispatch(self):
+        """Fetch every pending key; misses are cached as None"""
+        pending = list(self._pending)
+        self._pending.clear()
+        for i in range(0, len(pending), MAX_BATCH):
+            chunk = pending[i:i + MAX_BATCH]
+            for key in chunk:
+                self._cache[key] = None
+            for obj in self.model.select().where(self.key_field.in_(chunk)):
+                self._cache[getattr(obj, self.key_field.name)] = obj
+            self.queries += 1
+
+    def load(self, key):
+        self.queue(key)
+        if self._pending:
+            self.dispatch()
+        return self._cache.get(key)
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.queue_many(keys)
+        if self._pending:
+            self.dispatch()
+        return [self._cache.get(key) for key in keys]
+
+
+class Loaders:
+    """One BatchLoader per model, created on first use; build one per request"""
+
+    def __init__(self):
+        self._loaders = {}
+
+    def __getitem__(self, model):
+        loader = self._loaders.get(model)
+        if loader is None:
+            loader = self._loaders[model] = BatchLoader(model)
+        return loader
+
+    @property
+    def queries(self):
+        return sum(loader.queries for loader in self._loaders.values())
+
+
+def parse_ids(raw, limit=500):
+    """Turn '1,2,3' into [1, 2, 3] (deduplicated, order kept)"""
+    ids = []
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError(f"Invalid id: {part!r}")
+        value = int(part)
+        if value not in ids:
+            ids.append(value)
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids per request")
+    return ids
+
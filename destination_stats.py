@@ -0,0 +1,230 @@
+# destination_stats.py - Incrementally maintained per-destination aggregates
+import threading
+from peewee import fn
+from playhouse.signals import pre_save, post_save, post_delete
+from database.database import (
+    db, Destination, Food, Accommodation, Transport, DestinationStats
+)
+
+# Food/Accommodation hold a rating and an FK to their destination; both feed
+# a (count, rating_sum) pair on the summary row.
+RATED_MODELS = {
+    Food: (DestinationStats.food_count, DestinationStats.food_rating_sum),
+    Accommodation: (DestinationStats.acco_count, DestinationStats.acco_rating_sum),
+}
+
+
+def stats_to_dict(stats: DestinationStats):
+    """Shape a summary row for API responses"""
+    return {
+        "food_count": stats.food_count,
+        "avg_food_rating": round(stats.food_rating_sum / stats.food_count, 2) if stats.food_count else None,
+        "accommodation_count": stats.acco_count,
+        "avg_accommodation_rating": round(stats.acco_rating_sum / stats.acco_count, 2) if stats.acco_count else None,
+        "min_transport_cost": stats.min_transport_cost,
+    }
+
+
+def get_stats(dest_id):
+    """Primary-key lookup of one destination's aggregates (None if unknown)"""
+    stats = DestinationStats.get_or_none(DestinationStats.destination == dest_id)
+    return stats_to_dict(stats) if stats else None
+
+
+def get_stats_many(dest_ids):
+    """Aggregates for several destinations in one query, keyed by dest_id"""
+    if not dest_ids:
+        return {}
+    rows = DestinationStats.select().where(DestinationStats.destination.in_(list(dest_ids)))
+    return {row.destination_id: stats_to_dict(row) for row in rows}
+
+
+# --- Full recompute ---
+
+def _compute(dest_ids=None):
+    """Aggregate Food/Accommodation/Transport from scratch into row dicts"""
+    rows = {}
+    dests = Destination.select(Destination.dest_id, Destination.city, Destination.country)
+    if dest_ids is not None:
+        dests = dests.where(Destination.dest_id.in_(list(dest_ids)))
+    places = {}
+    for dest_id, city, country in dests.tuples():
+        rows[dest_id] = {
+            "destination": dest_id,
+            "food_count": 0, "food_rating_sum": 0.0,
+            "acco_count": 0, "acco_rating_sum": 0.0,
+            "min_transport_cost": None,
+        }
+        places.setdefault((city, country), []).append(dest_id)
+    if not rows:
+        return []
+
+    for model, (count_field, sum_field) in RATED_MODELS.items():
+        query = (model
+                 .select(model.destination, fn.COUNT(model._meta.primary_key), fn.SUM(model.rating))
+                 .group_by(model.destination))
+        if dest_ids is not None:
+            query = query.where(model.destination.in_(list(rows)))
+        for dest_id, count, total in query.tuples():
+            if dest_id in rows:
+                rows[dest_id][count_field.name] = count
+                rows[dest_id][sum_field.name] = float(total or 0)
+
+    inbound = (Transport
+               .select(Transport.destCity, Transport.destCountry, fn.MIN(Transport.cost))
+               .group_by(Transport.destCity, Transport.destCountry))
+    if dest_ids is not None:
+        inbound = inbound.where(Transport.destCity.in_([city for city, _ in places]))
+    for city, country, cost in inbound.tuples():
+        for dest_id in places.get((city, country), ()):
+            rows[dest_id]["min_transport_cost"] = cost
+
+    return list(rows.values())
+
+
+def _upsert(rows, batch_size=500):
+    fields = [f for f in DestinationStats._meta.sorted_fields if f is not DestinationStats.destination]
+    for i in range(0, len(rows), batch_size):
+        (DestinationStats
+         .insert_many(rows[i:i + batch_size])
+         .on_conflict(conflict_target=[DestinationStats.destination], preserve=fields)
+         .execute())
+
+
+def refresh_destinations(dest_ids):
+    """Recompute the summary rows of a few destinations"""
+    dest_ids = [d for d in set(dest_ids) if d is not None]
+    if dest_ids:
+        _upsert(_compute(dest_ids))
+
+
+def reconcile():
+    """Rebuild every summary row and drop rows for deleted destinations"""
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        with db.atomic():
+            rows = _compute()
+            _upsert(rows)
+            (DestinationStats
+             .delete()
+             .where(DestinationStats.destination.not_in(Destination.select(Destination.dest_id)))
+             .execute())
+        print(f"📊 Reconciled stats for {len(rows)} destinations")
+        return len(rows)
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def start_reconciler(interval_seconds=3600):
+    """Run reconcile() on a daemon thread now and every interval; returns a stop event"""
+    stop = threading.Event()
+
+    def loop():
+        # Right away too: rows added without the signals have no stats yet
+        while True:
+            try:
+                reconcile()
+            except Exception as e:
+                print(f"❌ Stats reconcile failed: {e}")
+            if stop.wait(interval_seconds):
+                return
+
+    threading.Thread(target=loop, name="stats-reconciler", daemon=True).start()
+    return stop
+
+
+# --- Incremental maintenance ---
+
+def _apply_rating(model, dest_id, count_delta, rating_delta):
+    """Add the deltas to dest_id's row; True if the row had to be recounted instead"""
+    count_field, sum_field = RATED_MODELS[model]
+    updated = (DestinationStats
+               .update({count_field: count_field + count_delta, sum_field: sum_field + rating_delta})
+               .where(DestinationStats.destination == dest_id)
+               .execute())
+    if not updated:
+        # First time we see this destination: build its row from scratch
+        refresh_destinations([dest_id])
+        return True
+    return False
+
+
+def _inbound_destinations(city, country):
+    return [d for (d,) in Destination
+            .select(Destination.dest_id)
+            .where((Destination.city == city) & (Destination.country == country))
+            .tuples()]
+
+
+def _lower_transport_min(city, country, cost):
+    dest_ids = _inbound_destinations(city, country)
+    if not dest_ids:
+        return
+    (DestinationStats
+     .update(min_transport_cost=cost)
+     .where(DestinationStats.destination.in_(dest_ids) &
+            (DestinationStats.min_transport_cost.is_null() |
+             (DestinationStats.min_transport_cost > cost)))
+     .execute())
+    known = DestinationStats.select().where(DestinationStats.destination.in_(dest_ids)).count()
+    if known < len(dest_ids):
+        refresh_destinations(dest_ids)
+
+
+def _drop_transport(city, country, cost):
+    # A minimum can't be un-applied; recompute only if this row was the min
+    dest_ids = _inbound_destinations(city, country)
+    at_min = (DestinationStats
+              .select(DestinationStats.destination)
+              .where(DestinationStats.destination.in_(dest_ids) &
+                     (DestinationStats.min_transport_cost >= cost))
+              .tuples()) if dest_ids else []
+    refresh_destinations([d for (d,) in at_min])
+
+
+@pre_save(sender=Food)
+@pre_save(sender=Accommodation)
+@pre_save(sender=Transport)
+def _remember_old_row(model, instance, created):
+    # Updates need the previous values to undo their contribution
+    instance._stats_old = None if created else model.get_or_none(
+        model._meta.primary_key == instance._pk)
+
+
+def _on_rated_save(model, instance, created):
+    old = getattr(instance, "_stats_old", None)
+    if old is not None and _apply_rating(model, old.destination_id, -1, -float(old.rating)) \
+            and old.destination_id == instance.destination_id:
+        # The recount already includes the saved row
+        return
+    _apply_rating(model, instance.destination_id, 1, float(instance.rating))
+
+
+def _on_rated_delete(model, instance):
+    _apply_rating(model, instance.destination_id, -1, -float(instance.rating))
+
+
+def _on_transport_save(model, instance, created):
+    old = getattr(instance, "_stats_old", None)
+    if old is not None:
+        _drop_transport(old.destCity, old.destCountry, old.cost)
+    _lower_transport_min(instance.destCity, instance.destCountry, instance.cost)
+
+
+def _on_transport_delete(model, instance):
+    _drop_transport(instance.destCity, instance.destCountry, instance.cost)
+
+
+post_save.connect(_on_rated_save, name="stats_food_save", sender=Food)
+post_save.connect(_on_rated_save, name="stats_acco_save", sender=Accommodation)
+post_delete.connect(_on_rated_delete, name="stats_food_delete", sender=Food)
+post_delete.connect(_on_rated_delete, name="stats_acco_delete", sender=Accommodation)
+post_save.connect(_on_transport_save, name="stats_transport_save", sender=Transport)
+post_delete.connect(_on_transport_delete, name="stats_transport_delete", sender=Transport)
+
+
+if __name__ == "__main__":
+    reconcile()
@@ -0,0 +1,228 @@
+# events.py - Per-user booking and payment events for server-sent event streams
+#
+# Job handlers publish events through the cache bus (cache_bus.py), so an
+# event reaches the process holding the user's /events connection whichever
+# worker ran the job. Every process keeps the last few events of each user
+# it has heard about; a client that reconnects with Last-Event-ID gets what
+# it missed from there, or a "resync" event telling it to reload its state
+# when they are no longer all there.
+#
+# Event ids are "<hub>-<n>": n counts the events this process's hub has
+# received, in the order it received them. Clocks of different publishers
+# can't order events, but this count can. An id from another process (or
+# from before a restart) can't be resumed from, so that client is told to
+# resync.
+import asyncio
+import itertools
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict, deque
+from cache_bus import bus
+
+TABLE = "user_events"
+KINDS = ("booking.finalized", "booking.failed", "payment.settled", "payment.failed")
+HEARTBEAT_SECONDS = 15
+REPLAY_PER_USER = 50    # events kept per user for Last-Event-ID resume
+REPLAY_USERS = 10000    # users whose events are kept
+QUEUE_SIZE = 100        # events a slow client may fall behind before it is told to resync
+HEARTBEAT = object()    # queued by the hub's ticker; the stream writes a comment line
+
+
+def publish(user_id, kind, **data):
+    """Announce `kind` to user_id's open event streams, in every process"""
+    bus.publish(TABLE, kind, user_id, data)
+
+
+def _deliver_all(subscribers, item):
+    for subscriber in subscribers:
+        subscriber.deliver(item)
+
+
+class Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    # Both run on the subscriber's event loop
+
+    def deliver(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # The stream finds the flag on its next get, which won't wait
+            self.overflowed = True
+
+    def resync(self):
+        self.overflowed = True
+        try:
+            self.queue.put_nowait(None)  # wake the stream if it is idle
+        except asyncio.QueueFull:
+            pass
+
+
+class EventHub:
+    """Fans bus events out to the event streams open in this process.
+
+    Streams just wait on their queue: one ticker task per event loop feeds
+    every queue a heartbeat now and then, instead of each idle stream
+    keeping a timer of its own.
+    """
+
+    def __init__(self, heartbeat_seconds=HEARTBEAT_SECONDS):
+        self.heartbeat_seconds = heartbeat_seconds
+        self._tickers = {}            # loop -> heartbeat task
+        self._subscribers = {}        # user_id -> set of Subscriber
+        self._recent = OrderedDict()  # user_id -> deque of (n, kind, data), least recent user first
+        self._horizon = {}            # user_id -> newest event number no longer kept
+        self._forgotten = 0           # newest event number of any user no longer kept
+        self.hub_id = uuid.uuid4().hex[:8]
+        self._numbers = itertools.count(1)
+        self.last = 0                 # number of the newest event received
+        self._lock = threading.Lock()
+        self.delivered = 0
+
+    def event_id(self, n):
+        return f"{self.hub_id}-{n}"
+
+    def parse_id(self, event_id):
+        """The event number of one of this hub's ids, else None"""
+        hub_id, _, n = (event_id or "").partition("-")
+        return int(n) if hub_id == self.hub_id and n.isdigit() else None
+
+    def on_event(self, event):
+        """Cache bus callback (listener thread)"""
+        if event.table == "*":
+            # The bus may have lost events: everyone starts over
+            with self._lock:
+                self._recent.clear()
+                self._horizon.clear()
+                self._forgotten = self.last
+                subscribers = [s for subs in self._subscribers.values() for s in subs]
+            for subscriber in subscribers:
+                subscriber.loop.call_soon_threadsafe(subscriber.resync)
+            return
+        if event.user is None:
+            return
+        user_id = int(event.user)
+        with self._lock:
+            self.last = next(self._numbers)
+            item = (self.last, event.key, event.data or {})
+            recent = self._recent.get(user_id)
+            if recent is None:
+                if len(self._recent) >= REPLAY_USERS:
+                    dropped_user, dropped = self._recent.popitem(last=False)
+                    self._horizon.pop(dropped_user, None)
+                    if dropped:
+                        self._forgotten = max(self._forgotten, dropped[-1][0])
+                recent = self._recent[user_id] = deque(maxlen=REPLAY_PER_USER)
+            else:
+                self._recent.move_to_end(user_id)
+            if len(recent) == recent.maxlen:
+                self._horizon[user_id] = recent[0][0]
+            recent.append(item)
+            subscribers = list(self._subscribers.get(user_id, ()))
+        # One wake-up per event loop, not one per stream
+        by_loop = {}
+        for subscriber in subscribers:
+            by_loop.setdefault(subscriber.loop, []).append(subscriber)
+        for loop, group in by_loop.items():
+            loop.call_soon_threadsafe(_deliver_all, group, item)
+        self.delivered += len(subscribers)
+
+    def subscribe(self, user_id, last_event_id=None):
+        """(subscriber, events to replay, whether the client must resync)
+
+        last_event_id is the client's Last-Event-ID header, if any.
+        """
+        loop = asyncio.get_running_loop()
+        subscriber = Subscriber(loop)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            if loop not in self._tickers:
+                self._tickers[loop] = loop.create_task(self._heartbeats(loop))
+            recent = list(self._recent.get(user_id, ()))
+            horizon = max(self._forgotten, self._horizon.get(user_id, 0))
+        if last_event_id is None:
+            return subscriber, [], False
+        since = self.parse_id(last_event_id)
+        if since is None:
+            # Another process's (or a previous run's) id: nothing to resume from
+            return subscriber, [], True
+        replay = [item for item in recent if item[0] > since]
+        return subscriber, replay, since < horizon
+
+    async def _heartbeats(self, loop):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            with self._lock:
+                subscribers = [s for subs in self._subscribers.values() for s in subs if s.loop is loop]
+                if not subscribers:
+                    del self._tickers[loop]
+                    return
+            for subscriber in subscribers:
+                subscriber.deliver(HEARTBEAT)
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subs = self._subscribers.get(user_id)
+            if subs is not None:
+                subs.discard(subscriber)
+                if not subs:
+                    del self._subscribers[user_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "streams": sum(len(subs) for subs in self._subscribers.values()),
+                "users_streaming": len(self._subscribers),
+                "users_replayable": len(self._recent),
+                "delivered": self.delivered,
+            }
+
+
+hub = EventHub()
+bus.subscribe(TABLE, hub.on_event)
+
+
+def _after_fork():
+    # A forked worker hears events in its own order: new hub id, new count
+    hub.__init__(hub.heartbeat_seconds)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def format_event(n, kind, data):
+    return f"id: {hub.event_id(n)}\nevent: {kind}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def stream(user_id, last_event_id=None):
+    """Server-sent event stream of user_id's events, as bytes chunks"""
+    subscriber, replay, resync = hub.subscribe(user_id, last_event_id)
+    try:
+        # Tell EventSource how long to wait before reconnecting
+        yield b"retry: 3000\n\n"
+        if resync:
+            yield format_event(hub.last, "resync", {})
+        for item in replay:
+            yield format_event(*item)
+        while True:
+            item = await subscriber.queue.get()
+            if subscriber.overflowed:
+                # Missed events: drop what is queued and have the client reload
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.overflowed = False
+                yield format_event(hub.last, "resync", {})
+            elif item is HEARTBEAT:
+                # Comment line: keeps proxies from closing an idle connection
+                yield b": heartbeat\n\n"
+            elif item is not None:
+                yield format_event(*item)
+    finally:
+        hub.unsubscribe(user_id, subscriber)
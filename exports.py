@@ -0,0 +1,263 @@
+# exports.py - Streaming export of finalized trips for analytics
+#
+#   python exports.py --format csv --out final_trips.csv
+#   python exports.py --format arrow --out final_trips.arrow
+#
+# One joined query is read through a server-side cursor in fixed-size
+# chunks and encoded chunk by chunk, so memory stays flat no matter how many
+# bookings there are. Bookings moved out of final_trips (SQLite month
+# tables and cold files, see archive.py) follow, joined a chunk at a time,
+# in the same transaction.
+import argparse
+import csv
+import importlib.util
+import io
+import queue
+import sys
+import threading
+import time
+from datetime import date
+from peewee import chunked
+from playhouse.pool import PooledSqliteDatabase
+from database.database import db, FinalTrip, User, Destination, Transport, Accommodation
+import archive
+
+CHUNK_SIZE = 10000
+
+# (column name, field, arrow type name)
+COLUMNS = [
+    ("trip_id", FinalTrip.f_trip_id, "int64"),
+    ("user_id", User.user_id, "int64"),
+    ("user_name", User.user_name, "string"),
+    ("user_email", User.email, "string"),
+    ("destination_id", Destination.dest_id, "int64"),
+    ("destination_city", Destination.city, "string"),
+    ("destination_country", Destination.country, "string"),
+    ("start_date", FinalTrip.startDate, "date32"),
+    ("end_date", FinalTrip.endDate, "date32"),
+    ("total_budget", FinalTrip.totalbudget, "float64"),
+    ("transport_id", Transport.transport_id, "int64"),
+    ("transport_type", Transport.transportType, "int64"),
+    ("transport_cost", Transport.cost, "float64"),
+    ("origin_city", Transport.originCity, "string"),
+    ("origin_country", Transport.originCountry, "string"),
+    ("accommodation_id", Accommodation.acco_id, "int64"),
+    ("accommodation_name", Accommodation.name, "string"),
+    ("accommodation_type", Accommodation.type, "int64"),
+    ("accommodation_rating", Accommodation.rating, "float64"),
+]
+
+# Models joined to a FinalTrip, and the final_trips column pointing at each
+JOINED = [
+    (User, FinalTrip.user_id.column_name),
+    (Destination, FinalTrip.destination.column_name),
+    (Transport, FinalTrip.transport.column_name),
+    (Accommodation, FinalTrip.accommodation.column_name),
+]
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+def export_query():
+    """Every FinalTrip joined to its user, destination, transport and accommodation"""
+    return (FinalTrip
+            .select(*[field for _, field, _ in COLUMNS])
+            .join_from(FinalTrip, User, on=(FinalTrip.user_id == User.user_id))
+            .join_from(FinalTrip, Destination)
+            .join_from(FinalTrip, Transport)
+            .join_from(FinalTrip, Accommodation)
+            .order_by(FinalTrip.f_trip_id))
+
+
+def _joined(rows):
+    """Archived final_trips rows as export_query() tuples; rows whose joins are gone drop out like there"""
+    related = {}
+    for model, column in JOINED:
+        fields = [field for _, field, _ in COLUMNS if field.model is model]
+        pk = model._meta.primary_key
+        query = model.select(pk, *fields).where(pk.in_({row[column] for row in rows}))
+        # Raw values, as the main query's cursor returns them
+        related[model] = {values[0]: dict(zip([field.name for field in fields], values[1:]))
+                          for values in db.execute(query).fetchall()}
+    joined = []
+    for row in rows:
+        found = {model: related[model].get(row[column]) for model, column in JOINED}
+        if None not in found.values():
+            joined.append(tuple(row[field.column_name] if field.model is FinalTrip else found[field.model][field.name]
+                                for _, field, _ in COLUMNS))
+    return joined
+
+
+def iter_chunks(chunk_size=CHUNK_SIZE):
+    """Yield lists of up to chunk_size row tuples from one cursor, then the archived rows.
+
+    Postgres uses a named (server-side) cursor inside a transaction, so only
+    one chunk at a time crosses the wire; SQLite cursors already step through
+    the result lazily. Must be consumed on a single thread.
+    """
+    sql, params = export_query().sql()
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        with db.atomic():
+            if isinstance(db, PooledSqliteDatabase):
+                cursor = db.cursor()
+            else:
+                cursor = db.connection().cursor(name="final_trips_export")
+                cursor.itersize = chunk_size
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+            for rows in chunked(archive.archived_final_trips(), chunk_size):
+                rows = _joined(rows)
+                if rows:
+                    yield rows
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def csv_encoder(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _, _ in COLUMNS])
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def arrow_encoder(chunks):
+    """Arrow IPC stream: the schema, then one record batch per chunk"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Arrow export needs pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, _, type_name in COLUMNS])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def column(values, field):
+        if field.type == pa.date32():
+            # SQLite hands dates back as ISO strings
+            values = [date.fromisoformat(v) if isinstance(v, str) else v for v in values]
+        return pa.array(values, type=field.type)
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    for rows in chunks:
+        arrays = [column(values, field) for values, field in zip(zip(*rows), schema)]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+        yield drain()
+    writer.close()
+    yield drain()
+
+
+ENCODERS = {"csv": csv_encoder, "arrow": arrow_encoder}
+
+
+def arrow_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def stream(fmt="csv", chunk_size=CHUNK_SIZE):
+    """Encoded export as an iterator of bytes, produced on the calling thread"""
+    return ENCODERS[fmt](iter_chunks(chunk_size))
+
+
+def stream_in_thread(fmt="csv", chunk_size=CHUNK_SIZE, max_buffered=4):
+    """Run stream() on its own thread and hand its output over a bounded queue.
+
+    Starlette may advance a sync iterator from different worker threads, but
+    a peewee connection and its cursor belong to one thread. The queue also
+    applies backpressure: a slow client pauses the cursor instead of letting
+    chunks pile up in memory.
+    """
+    out = queue.Queue(maxsize=max_buffered)
+    cancelled = threading.Event()
+    done = object()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        chunks = stream(fmt, chunk_size)
+        try:
+            for data in chunks:
+                if not put(data):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            # Closes the cursor and connection on this thread
+            chunks.close()
+
+    threading.Thread(target=produce, name="final-trips-export", daemon=True).start()
+    try:
+        while True:
+            item = out.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Client went away or the export finished; stop the producer either way
+        cancelled.set()
+
+
+def export(out, fmt="csv", chunk_size=CHUNK_SIZE):
+    """Write the export to a binary file object; returns (rows, seconds)"""
+    rows = 0
+    started = time.perf_counter()
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    for data in ENCODERS[fmt](counted(iter_chunks(chunk_size))):
+        out.write(data)
+    return rows, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export finalized trips for analytics")
+    parser.add_argument("--format", choices=list(ENCODERS), default="csv")
+    parser.add_argument("--out", default=None, help="output file (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.out:
+        with open(args.out, "wb") as f:
+            rows, seconds = export(f, args.format, args.chunk_size)
+    else:
+        rows, seconds = export(sys.stdout.buffer, args.format, args.chunk_size)
+    print(f"✅ Exported {rows:,} trips in {seconds:.1f}s ({rows / seconds if seconds else 0:,.0f} rows/s)",
+          file=sys.stderr)
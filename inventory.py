@@ -0,0 +1,97 @@
+# inventory.py - Per-night room inventory with overbooking-safe reservations
+import time
+from datetime import date, timedelta
+from peewee import OperationalError, IntegrityError
+from database.database import Accommodation, RoomInventory, write_transaction
+
+# Deadlock / serialization failures are retried this many times
+MAX_ATTEMPTS = 5
+
+
+class NoAvailability(Exception):
+    """Raised when at least one night of the stay is sold out"""
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def stay_nights(start, end):
+    """Nights covered by a stay: check-in day up to (not including) check-out"""
+    start, end = _as_date(start), _as_date(end)
+    nights = max(1, (end - start).days)
+    return [start + timedelta(days=i) for i in range(nights)]
+
+
+def _ensure_nights(accommodation_id, nights):
+    """Create missing inventory rows with the accommodation's room count"""
+    total = (Accommodation
+             .select(Accommodation.rooms)
+             .where(Accommodation.acco_id == accommodation_id)
+             .scalar())
+    if total is None:
+        raise Accommodation.DoesNotExist(f"Accommodation {accommodation_id} not found")
+    (RoomInventory
+     .insert_many([{"accommodation": accommodation_id, "night": night, "total_rooms": total}
+                   for night in nights])
+     .on_conflict_ignore()
+     .execute())
+
+
+def _reserve_once(accommodation_id, nights, rooms):
+    with write_transaction():
+        _ensure_nights(accommodation_id, nights)
+        # One guarded UPDATE covers every night: a night is only touched if
+        # it still has room, so fewer updated rows than nights means sold out.
+        # Postgres re-checks the WHERE clause after waiting on a row lock, so
+        # concurrent bookings can never push booked_rooms past total_rooms.
+        updated = (RoomInventory
+                   .update(booked_rooms=RoomInventory.booked_rooms + rooms)
+                   .where((RoomInventory.accommodation == accommodation_id) &
+                          (RoomInventory.night >= nights[0]) &
+                          (RoomInventory.night <= nights[-1]) &
+                          (RoomInventory.booked_rooms + rooms <= RoomInventory.total_rooms))
+                   .execute())
+        if updated != len(nights):
+            raise NoAvailability(f"Accommodation {accommodation_id} is full for part of the stay")
+
+
+def reserve(accommodation_id, start, end, rooms=1):
+    """Book `rooms` rooms for every night of [start, end); raises NoAvailability"""
+    nights = stay_nights(start, end)
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return _reserve_once(accommodation_id, nights, rooms)
+        except (OperationalError, IntegrityError):
+            # Deadlock, lock timeout or a racing insert of the same night
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * 2 ** attempt)
+
+
+def release(accommodation_id, start, end, rooms=1):
+    """Give rooms back, e.g. when a booking is cancelled"""
+    nights = stay_nights(start, end)
+    with write_transaction():
+        (RoomInventory
+         .update(booked_rooms=RoomInventory.booked_rooms - rooms)
+         .where((RoomInventory.accommodation == accommodation_id) &
+                (RoomInventory.night >= nights[0]) &
+                (RoomInventory.night <= nights[-1]) &
+                (RoomInventory.booked_rooms >= rooms))
+         .execute())
+
+
+def availability(accommodation_id, start, end):
+    """Rooms still free on the tightest night of the stay"""
+    nights = stay_nights(start, end)
+    acco = Accommodation.get_or_none(Accommodation.acco_id == accommodation_id)
+    if acco is None:
+        return 0
+    free = {night: total - booked for night, total, booked in RoomInventory
+            .select(RoomInventory.night, RoomInventory.total_rooms, RoomInventory.booked_rooms)
+            .where((RoomInventory.accommodation == accommodation_id) &
+                   (RoomInventory.night >= nights[0]) &
+                   (RoomInventory.night <= nights[-1]))
+            .tuples()}
+    return min(free.get(night, acco.rooms) for night in nights)
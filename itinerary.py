@@ -0,0 +1,312 @@
+# itinerary.py - Day-by-day plans for booked trips
+#
+# Each day of a FinalTrip (startDate to endDate, both included) gets one
+# activity and a lunch and a dinner, picked to maximise rating while the
+# day stays within FilteredSuggestion.dailybudget:
+#   meals       the destination's best-rated Food places (the booked one first)
+#   activities  exploring the city itself (free) or a day trip to a nearby
+#               destination from the spatial index
+# Places already used earlier in the trip score less, so days vary.
+#
+# The solver works on plain data (a "problem" dict), so batches can be
+# spread over a process pool. Plans are stored in the itineraries table
+# with a hash of the problem they were solved from; a plan is reused until
+# its trip, budget, restaurants or nearby destinations change.
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from peewee import chunked
+from database.database import db, connected, Destination, Food, FilteredSuggestion, FinalTrip, Itinerary
+from spatial_index import destination_index
+import planning
+
+SOLVER_VERSION = 1      # bump to re-solve every stored plan
+MEAL_SLOTS = ("lunch", "dinner")
+MEAL_CANDIDATES = 30    # best-rated Food places considered per destination
+DAY_TRIPS = 8           # nearby destinations offered as day trips
+DAY_TRIP_KM = 150
+EXPLORE_RATING = 3.0    # a free day in the city itself
+REPEAT_PENALTY = 1.0    # rating lost each time a place is used again
+BOOKED_BONUS = 0.5      # the booked restaurant is worth one visit
+BATCH_PAGE = 5000       # trips loaded at a time by build_batch
+CHUNK_SIZE = 100        # trips per process pool task
+
+
+def meal_cost(cuisine_id: int) -> float:
+    """Price of a meal placeholder, stable per Food place"""
+    return round(random.Random(f"food:{cuisine_id}").uniform(8, 40), 2)
+
+
+def day_trip_cost(dest_id: int) -> float:
+    """Transport and tickets placeholder for a day trip, stable per destination"""
+    return round(planning.simulated_attributes(dest_id)["cost"] * 0.3, 2)
+
+
+# --- Solver (plain data in and out, runs in pool workers) ---
+
+def _best_meals(meals, scores, order, money):
+    """(score, meal indexes) of the best distinct pair costing at most money"""
+    if len(meals) < 2:
+        # One place (or none) to eat at: it serves both meals
+        picks = tuple(order[:1]) * 2
+        cost = sum(meals[i][3] for i in picks)
+        return (sum(scores[i] for i in picks), picks) if cost <= money else None
+    best = None
+    for a_pos, a in enumerate(order[:-1]):
+        # order is by score, so nothing later can beat the best found
+        if best is not None and scores[a] + scores[order[a_pos + 1]] <= best[0]:
+            break
+        for b in order[a_pos + 1:]:
+            if meals[a][3] + meals[b][3] <= money:
+                if best is None or scores[a] + scores[b] > best[0]:
+                    best = (scores[a] + scores[b], (a, b))
+                break
+    return best
+
+
+def solve(problem):
+    """Fill each day of problem with an activity and meals; returns the plan"""
+    meals = problem["meals"]            # [cuisine_id, name, rating, cost]
+    activities = problem["activities"]  # [key, title, rating, cost]
+    budget = problem["daily_budget"]
+    start = date.fromisoformat(problem["start"])
+    meal_uses = [0] * len(meals)
+    activity_uses = [0] * len(activities)
+    days = []
+    for offset in range(problem["days"]):
+        scores = [rating - REPEAT_PENALTY * meal_uses[i] +
+                  (BOOKED_BONUS if food_id == problem["booked_food"] and not meal_uses[i] else 0)
+                  for i, (food_id, _, rating, _) in enumerate(meals)]
+        order = sorted(range(len(meals)), key=lambda i: -scores[i])
+        best = None  # (score, activity index, meal indexes)
+        for a, (_, _, rating, cost) in enumerate(activities):
+            if cost > budget:
+                continue
+            pair = _best_meals(meals, scores, order, budget - cost)
+            if pair is None:
+                continue
+            score = rating - REPEAT_PENALTY * activity_uses[a] + pair[0]
+            if best is None or score > best[0]:
+                best = (score, a, pair[1])
+        over_budget = best is None
+        if over_budget:
+            # Nothing fits: the cheapest day there is
+            cheapest = sorted(range(len(meals)), key=lambda i: meals[i][3])
+            a = min(range(len(activities)), key=lambda i: activities[i][3])
+            picks = tuple(cheapest[:2]) if len(meals) >= 2 else tuple(cheapest[:1]) * 2
+            best = (0, a, picks)
+        _, a, picks = best
+        activity_uses[a] += 1
+        for i in picks:
+            meal_uses[i] += 1
+        # The better-rated place for dinner
+        picks = sorted(picks, key=lambda i: meals[i][2])
+        key, title, rating, cost = activities[a]
+        day = {
+            "date": str(start + timedelta(days=offset)),
+            "activity": {"key": key, "title": title, "rating": rating, "cost": cost},
+            "meals": [{"slot": slot, "food_id": meals[i][0], "name": meals[i][1],
+                       "rating": meals[i][2], "cost": meals[i][3]}
+                      for slot, i in zip(MEAL_SLOTS, picks)],
+        }
+        day["cost"] = round(cost + sum(meal["cost"] for meal in day["meals"]), 2)
+        day["over_budget"] = over_budget
+        days.append(day)
+    ratings = [day["activity"]["rating"] for day in days] + \
+              [meal["rating"] for day in days for meal in day["meals"]]
+    return {
+        "final_trip_id": problem["final_trip_id"],
+        "daily_budget": budget,
+        "total_cost": round(sum(day["cost"] for day in days), 2),
+        "average_rating": round(sum(ratings) / len(ratings), 2) if ratings else None,
+        "days": days,
+    }
+
+
+def solve_many(problems):
+    """Pool task: solve a chunk of problems"""
+    return [solve(problem) for problem in problems]
+
+
+def inputs_hash(problem):
+    """Changes whenever anything the plan was solved from changes"""
+    inputs = {k: v for k, v in problem.items() if k != "final_trip_id"}
+    blob = json.dumps([SOLVER_VERSION, inputs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+# --- Loading problems ---
+
+def _meal_candidates(dest_ids, booked_food_ids):
+    """dest_id -> [cuisine_id, name, rating, cost], best-rated first"""
+    by_dest = {dest_id: [] for dest_id in dest_ids}
+    for batch in chunked(list(dest_ids), 500):
+        rows = (Food
+                .select(Food.cuisine_id, Food.name, Food.rating, Food.destination)
+                .where(Food.destination.in_(batch))
+                .order_by(Food.rating.desc(), Food.cuisine_id)
+                .tuples())
+        for cuisine_id, name, rating, dest_id in rows:
+            candidates = by_dest[dest_id]
+            if len(candidates) < MEAL_CANDIDATES or cuisine_id in booked_food_ids:
+                candidates.append([cuisine_id, name, rating, meal_cost(cuisine_id)])
+    return by_dest
+
+
+def _activity_candidates(destinations):
+    """dest_id -> [key, title, rating, cost]: the city itself, then day trips"""
+    destination_index.refresh()
+    nearby = {}
+    for dest_id, (city, lat, lon) in destinations.items():
+        if lat is None or lon is None:
+            nearby[dest_id] = []
+            continue
+        hits = destination_index.nearest(lat, lon, k=DAY_TRIPS + 1, radius_km=DAY_TRIP_KM)
+        nearby[dest_id] = [(other, km) for other, km in hits if other != dest_id][:DAY_TRIPS]
+    wanted = {other for hits in nearby.values() for other, _ in hits}
+    cities = {}
+    for batch in chunked(list(wanted), 500):
+        cities.update(Destination
+                      .select(Destination.dest_id, Destination.city)
+                      .where(Destination.dest_id.in_(batch))
+                      .tuples())
+    activities = {}
+    for dest_id, (city, _, _) in destinations.items():
+        activities[dest_id] = [[f"explore:{dest_id}", f"Explore {city}", EXPLORE_RATING, 0.0]] + [
+            [f"day_trip:{other}", f"Day trip to {cities[other]} ({km:.0f} km)",
+             planning.simulated_attributes(other)["rating"], day_trip_cost(other)]
+            for other, km in nearby[dest_id] if other in cities
+        ]
+    return activities
+
+
+def load_problems(trips):
+    """Solver inputs for FinalTrips selected with their dailybudget, in order"""
+    dest_ids = {trip.destination_id for trip in trips}
+    destinations = {}
+    for batch in chunked(list(dest_ids), 500):
+        for dest_id, city, lat, lon in (Destination
+                                        .select(Destination.dest_id, Destination.city,
+                                                Destination.latitude, Destination.longitude)
+                                        .where(Destination.dest_id.in_(batch))
+                                        .tuples()):
+            destinations[dest_id] = (city, lat, lon)
+    meals = _meal_candidates(destinations, {trip.food_id for trip in trips})
+    activities = _activity_candidates(destinations)
+    problems = []
+    for trip in trips:
+        if trip.destination_id not in destinations:
+            continue
+        problems.append({
+            "final_trip_id": trip.f_trip_id,
+            "start": str(trip.startDate),
+            "days": max(1, (trip.endDate - trip.startDate).days + 1),
+            "daily_budget": round(float(trip.dailybudget), 2),
+            "booked_food": trip.food_id,
+            "meals": meals[trip.destination_id],
+            "activities": activities[trip.destination_id],
+        })
+    return problems
+
+
+def _trips_query():
+    return (FinalTrip
+            .select(FinalTrip, FilteredSuggestion.dailybudget)
+            .join(FilteredSuggestion, on=(FinalTrip.f_suggest == FilteredSuggestion.f_suggest_id))
+            .objects())
+
+
+# --- Cache ---
+
+def _store(plans_and_hashes):
+    now = datetime.utcnow()
+    rows = [{"final_trip": plan["final_trip_id"], "inputs_hash": digest,
+             "plan": json.dumps(plan), "generated_at": now}
+            for plan, digest in plans_and_hashes]
+    with db.atomic():
+        for batch in chunked(rows, 200):
+            (Itinerary
+             .insert_many(batch)
+             .on_conflict(conflict_target=[Itinerary.final_trip],
+                          preserve=[Itinerary.inputs_hash, Itinerary.plan, Itinerary.generated_at])
+             .execute())
+
+
+@connected
+def get_itinerary(final_trip_id: int):
+    """The trip's day-by-day plan, solved now if its inputs changed since last time"""
+    trips = list(_trips_query().where(FinalTrip.f_trip_id == final_trip_id))
+    problems = load_problems(trips)
+    if not problems:
+        return {"error": f"Trip {final_trip_id} not found."}
+    problem = problems[0]
+    digest = inputs_hash(problem)
+    stored = Itinerary.get_or_none(Itinerary.final_trip == final_trip_id)
+    if stored is not None and stored.inputs_hash == digest:
+        return dict(json.loads(stored.plan), cached=True)
+    plan = solve(problem)
+    _store([(plan, digest)])
+    return dict(plan, cached=False)
+
+
+def _pool(workers):
+    # Job workers and the cache bus run threads; don't fork under them
+    context = multiprocessing.get_context("forkserver" if os.name == "posix" else "spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+@connected
+def build_batch(final_trip_ids=None, workers=None):
+    """Solve every trip (or the given ones) whose stored plan is missing or stale.
+
+    Trips are loaded BATCH_PAGE at a time; the stale ones are solved in
+    chunks across a process pool of `workers` (ITINERARY_WORKERS, default
+    one per CPU) and written back before the next page is loaded.
+    """
+    workers = workers or int(os.getenv("ITINERARY_WORKERS", 0)) or os.cpu_count() or 1
+    started = time.perf_counter()
+    counts = {"trips": 0, "solved": 0, "cached": 0}
+    pool = None
+    try:
+        last_id = 0
+        while True:
+            query = _trips_query().where(FinalTrip.f_trip_id > last_id)
+            if final_trip_ids is not None:
+                query = query.where(FinalTrip.f_trip_id.in_(final_trip_ids))
+            trips = list(query.order_by(FinalTrip.f_trip_id).limit(BATCH_PAGE))
+            if not trips:
+                break
+            last_id = trips[-1].f_trip_id
+            problems = load_problems(trips)
+            stored = dict(Itinerary
+                          .select(Itinerary.final_trip, Itinerary.inputs_hash)
+                          .where(Itinerary.final_trip.in_([p["final_trip_id"] for p in problems]))
+                          .tuples())
+            stale = []
+            for problem in problems:
+                digest = inputs_hash(problem)
+                if stored.get(problem["final_trip_id"]) != digest:
+                    stale.append((problem, digest))
+            counts["trips"] += len(problems)
+            counts["cached"] += len(problems) - len(stale)
+            if not stale:
+                continue
+            chunks = list(chunked([problem for problem, _ in stale], CHUNK_SIZE))
+            if workers > 1 and len(chunks) > 1:
+                if pool is None:
+                    pool = _pool(workers)
+                plans = [plan for chunk in pool.map(solve_many, chunks) for plan in chunk]
+            else:
+                plans = solve_many([problem for problem, _ in stale])
+            _store(zip(plans, [digest for _, digest in stale]))
+            counts["solved"] += len(plans)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
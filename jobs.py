@@ -0,0 +1,257 @@
+# jobs.py - Durable background jobs backed by the jobs table
+import json
+import os
+import random
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from database.database import db, Job, write_transaction
+
+HANDLERS = {}
+
+
+class PermanentFailure(Exception):
+    """Raise from a handler to fail the job without further retries"""
+
+
+def handler(name):
+    """Register a function as the handler for jobs called `name`"""
+    def decorator(fn):
+        HANDLERS[name] = fn
+        return fn
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=5):
+    """Queue a job and return its id; a single INSERT, safe inside handlers"""
+    job = Job.create(
+        name=name,
+        payload=json.dumps(payload or {}),
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    return job.job_id
+
+
+def enqueue_unique(name, payload=None, delay=0, max_attempts=5):
+    """Queue a job unless one with this name is already waiting or running.
+
+    For periodic maintenance jobs (see run_job); two processes starting at
+    once may still both enqueue, so handlers must be idempotent.
+    """
+    pending = (Job
+               .select(Job.job_id)
+               .where((Job.name == name) & Job.status.in_(['queued', 'running']))
+               .first())
+    if pending is not None:
+        return pending.job_id
+    return enqueue(name, payload, delay, max_attempts)
+
+
+def get_job(job_id):
+    """Status of one job for the API, or None"""
+    job = Job.get_or_none(Job.job_id == job_id)
+    if job is None:
+        return None
+    return {
+        "job_id": job.job_id,
+        "name": job.name,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.last_error,
+    }
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter: ~2s, 4s, 8s ... capped at 5 minutes"""
+    return min(300, 2 ** attempts) * random.uniform(0.8, 1.2)
+
+
+def claim(worker_id, limit, visibility_timeout):
+    """Atomically take up to `limit` runnable jobs for this worker.
+
+    Runnable means queued and due, or running but past its visibility
+    timeout (the worker that had it died or stalled). Postgres skips rows
+    other workers are claiming (FOR UPDATE SKIP LOCKED); SQLite gets the
+    same effect by taking the write lock for the whole claim.
+    """
+    now = datetime.utcnow()
+    with write_transaction():
+        query = (Job
+                 .select(Job.job_id)
+                 .where(((Job.status == 'queued') & (Job.run_at <= now)) |
+                        ((Job.status == 'running') & (Job.locked_until < now)))
+                 .order_by(Job.run_at)
+                 .limit(limit))
+        if db.for_update:
+            query = query.for_update('FOR UPDATE SKIP LOCKED')
+        ids = [job_id for (job_id,) in query.tuples()]
+        if not ids:
+            return []
+        (Job
+         .update(status='running',
+                 attempts=Job.attempts + 1,
+                 locked_by=worker_id,
+                 locked_until=now + timedelta(seconds=visibility_timeout))
+         .where(Job.job_id.in_(ids))
+         .execute())
+    return list(Job.select().where(Job.job_id.in_(ids)))
+
+
+def _finish(job, worker_id, **fields):
+    # Only the current owner may settle a job; if the visibility timeout
+    # expired and someone else re-claimed it, this update is a no-op.
+    return (Job
+            .update(locked_by=None, locked_until=None, **fields)
+            .where((Job.job_id == job.job_id) & (Job.locked_by == worker_id))
+            .execute())
+
+
+def _extend(job, worker_id, visibility_timeout):
+    # False once another worker has taken the job over
+    return bool(Job
+                .update(locked_until=datetime.utcnow() + timedelta(seconds=visibility_timeout))
+                .where((Job.job_id == job.job_id) & (Job.locked_by == worker_id))
+                .execute())
+
+
+def _keep_lease(job, worker_id, visibility_timeout):
+    """Extend the job's lease every third of the timeout until the returned event is set"""
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(visibility_timeout / 3):
+            try:
+                with db.connection_context():
+                    if not _extend(job, worker_id, visibility_timeout):
+                        return
+            except Exception as e:
+                print(f"❌ Could not extend job {job.job_id}: {e}")
+
+    threading.Thread(target=beat, name=f"job-{job.job_id}-lease", daemon=True).start()
+    return done
+
+
+def run_job(job, worker_id, visibility_timeout=None):
+    """Execute one claimed job and record the outcome.
+
+    With visibility_timeout, the lease is kept alive while the handler
+    runs, so a slow job isn't claimed again by another worker. A job whose
+    payload has interval_seconds is periodic: once it is done or has failed
+    for good, the next run is queued (unless one already is), so the chain
+    neither stops on a failure nor forks when a run is retried.
+    """
+    fn = HANDLERS.get(job.name)
+    settled = 0
+    lease = _keep_lease(job, worker_id, visibility_timeout) if visibility_timeout else None
+    try:
+        if fn is None:
+            raise PermanentFailure(f"No handler registered for '{job.name}'")
+        result = fn(**json.loads(job.payload or '{}'))
+    except PermanentFailure as e:
+        settled = _finish(job, worker_id, status='failed', last_error=str(e), finished_at=datetime.utcnow())
+        print(f"❌ Job {job.job_id} ({job.name}) failed: {e}")
+    except Exception as e:
+        error = f"{e}\n{traceback.format_exc(limit=5)}"
+        if job.attempts >= job.max_attempts:
+            settled = _finish(job, worker_id, status='failed', last_error=error, finished_at=datetime.utcnow())
+            print(f"❌ Job {job.job_id} ({job.name}) gave up after {job.attempts} attempts: {e}")
+        else:
+            retry_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(job.attempts))
+            _finish(job, worker_id, status='queued', last_error=error, run_at=retry_at)
+    else:
+        settled = _finish(job, worker_id, status='done', result=json.dumps(result),
+                          last_error=None, finished_at=datetime.utcnow())
+    finally:
+        if lease is not None:
+            lease.set()
+    payload = json.loads(job.payload or '{}')
+    if settled and payload.get("interval_seconds"):
+        enqueue_unique(job.name, payload, delay=payload["interval_seconds"], max_attempts=job.max_attempts)
+
+
+class JobWorker:
+    """Polls the jobs table and runs handlers on a bounded thread pool.
+
+    Several API processes can each run a worker against the same table;
+    claiming is atomic, so every job is handed to one worker at a time.
+    """
+
+    def __init__(self, concurrency=4, poll_interval=0.5, visibility_timeout=60):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._slots = threading.Semaphore(concurrency)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._pool = None
+        self._thread = None
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job")
+        self._thread = threading.Thread(target=self._poll, name="job-poller", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        if self._pool:
+            self._pool.shutdown(wait=wait)
+
+    def wake(self):
+        """Skip the rest of the current poll sleep (e.g. right after enqueue)"""
+        self._wake.set()
+
+    def _free_slots(self):
+        taken = 0
+        while taken < self.concurrency and self._slots.acquire(blocking=False):
+            taken += 1
+        return taken
+
+    def _poll(self):
+        while not self._stop.is_set():
+            free = self._free_slots()
+            claimed = []
+            if free:
+                try:
+                    with db.connection_context():
+                        claimed = claim(self.worker_id, free, self.visibility_timeout)
+                except Exception as e:
+                    print(f"❌ Job poll failed: {e}")
+            # Hand back the slots we could not fill
+            for _ in range(free - len(claimed)):
+                self._slots.release()
+            for job in claimed:
+                self._pool.submit(self._run, job)
+            if len(claimed) < free or not free:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _run(self, job):
+        try:
+            with db.connection_context():
+                run_job(job, self.worker_id, self.visibility_timeout)
+        except Exception as e:
+            print(f"❌ Job {job.job_id} could not be recorded: {e}")
+        finally:
+            self._slots.release()
+            self._wake.set()
+
+
+def run_pending(limit=100, worker_id="inline"):
+    """Claim and run due jobs on the calling thread (scripts, debugging)"""
+    done = 0
+    while done < limit:
+        claimed = claim(worker_id, 1, visibility_timeout=300)
+        if not claimed:
+            break
+        run_job(claimed[0], worker_id, visibility_timeout=300)
+        done += 1
+    return done
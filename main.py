@@ -10,10 +10,15 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Import all modules
 from auth.signup import signup
 from auth.login import login
-from database.database import db, User, Destination, Trip, Food, Accommodation, Transport, Suggestion, FilteredSuggestion, FinalTrip
+from database.database import db, check_connection, User, Destination, Trip, Food, Accommodation, Transport, Suggestion, FilteredSuggestion, FinalTrip
 import planning
 import booking
 import payment
+import catalog
+from dataloader import Loaders
+from autocomplete import destination_autocomplete, normalize
+import price_calendar
+import archive
 
 class TravelPlannerSystem:
     def __init__(self):
@@ -45,6 +50,43 @@ class TravelPlannerSystem:
         if not db.is_closed():
             db.close()
     
+    def prompt_place(self, prompt, kind):
+        """Ask for a city or country with Tab completion and "did you mean" hints"""
+        def complete(text, state):
+            matches = [s[kind] for s in destination_autocomplete.suggest(text, kind)]
+            return matches[state] if state < len(matches) else None
+
+        try:
+            import readline
+        except ImportError:
+            readline = None  # no line editing on this platform; hints only
+        if readline is not None:
+            old_completer, old_delims = readline.get_completer(), readline.get_completer_delims()
+            readline.set_completer(complete)
+            readline.set_completer_delims("")  # complete the whole line, spaces included
+            readline.parse_and_bind("tab: complete")
+        try:
+            value = input(prompt).strip()
+        finally:
+            if readline is not None:
+                readline.set_completer(old_completer)
+                readline.set_completer_delims(old_delims)
+        if not value:
+            return value
+
+        suggestions = destination_autocomplete.suggest(value, kind, limit=5)
+        if any(normalize(s[kind]) == normalize(value) for s in suggestions):
+            return value
+        if suggestions:
+            print(f"💡 No exact match for '{value}'. Did you mean:")
+            for i, s in enumerate(suggestions, 1):
+                where = f", {s['country']}" if kind == "city" else ""
+                print(f"   {i}. {s[kind]}{where}")
+            choice = input(f"Pick a number or press Enter to keep '{value}': ").strip()
+            if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+                return suggestions[int(choice) - 1][kind]
+        return value
+
     def authenticate_user(self):
         """Handle user authentication (login/signup)"""
         self.clear_screen()
@@ -159,35 +201,33 @@ class TravelPlannerSystem:
             self.ensure_db_connection()
             
             max_budget = float(input("\nEnter your maximum budget ($): ").strip())
-            destination_city = input("Preferred destination city (or leave blank for any): ").strip()
-            destination_country = input("Preferred destination country (or leave blank for any): ").strip()
+            destination_city = self.prompt_place("Preferred destination city (or leave blank for any, Tab completes): ", "city")
+            destination_country = self.prompt_place("Preferred destination country (or leave blank for any, Tab completes): ", "country")
             
+            self.show_cheapest_dates(destination_city, destination_country)
+
             # For demo, we'll use simple date inputs
             start_date = input("Start date (YYYY-MM-DD): ").strip()
             end_date = input("End date (YYYY-MM-DD): ").strip()
             
-            # Find or create destination
-            dest_query = Destination.select()
-            if destination_city:
-                dest_query = dest_query.where(Destination.city.contains(destination_city))
-            if destination_country:
-                dest_query = dest_query.where(Destination.country.contains(destination_country))
-            
-            destination = dest_query.first()
-            if not destination:
-                # Use a random destination if none matches
-                destination = Destination.select().first()
-                print(f"⚠️  Using available destination: {destination.city}, {destination.country}")
-            
-            # Create trip
-            trip = Trip.create(
-                maxBudget=max_budget,
-                destination=destination,
-                startDate=start_date,
-                endDate=end_date,
-                user_id=self.current_user["user_id"]
+            result = planning.create_trip(
+                user_id=self.current_user["user_id"],
+                max_budget=max_budget,
+                start_date=start_date,
+                end_date=end_date,
+                destination_city=destination_city or None,
+                destination_country=destination_country or None
             )
             
+            if "error" in result:
+                print(f"❌ {result['error']}")
+                for conflict in result.get("conflicts", []):
+                    print(f"   📅 {conflict['type']} #{conflict['id']}: {conflict['startDate']} to {conflict['endDate']}")
+                self.wait_for_enter()
+                return
+            
+            trip = result["trip"]
+            print(f"📍 Destination: {result['destination']['city']}, {result['destination']['country']}")
             self.current_trip = trip
             print(f"✅ Trip created! Trip ID: {trip.trip_id}")
             
@@ -203,6 +243,22 @@ class TravelPlannerSystem:
         
         self.wait_for_enter()
 
+    def show_cheapest_dates(self, city, country):
+        """Hint at the cheapest week-long trips to the chosen place before asking for dates"""
+        if not city:
+            return
+        query = Destination.select().where(Destination.city == city)
+        if country:
+            query = query.where(Destination.country == country)
+        destination = query.first()
+        if not destination:
+            return
+        result = price_calendar.cheapest_windows(destination.dest_id, limit=3)
+        if result.get("windows"):
+            print(f"\n💡 Cheapest {result['nights']}-night trips to {destination.city} in the next 90 days:")
+            for window in result["windows"]:
+                print(f"   📅 {window['startDate']} to {window['endDate']}: about ${window['total']:.2f}")
+
     def start_suggestion_flow(self):
         """Start the suggestion and filtering flow"""
         while True:
@@ -369,22 +425,7 @@ class TravelPlannerSystem:
                 selected_dest = destinations[int(choice) - 1]
                 print(f"\n🎉 Selected: {selected_dest['name']}, {selected_dest['country']}")
                 
-                # Get related entities (simplified for demo)
-                destination_obj = Destination.get(Destination.dest_id == selected_dest["id"])
-                food_obj = Food.select().first()  # Get first available food
-                transport_obj = Transport.select().first()  # Get first available transport
-                accommodation_obj = Accommodation.select().first()  # Get first available accommodation
-                
-                # Create filtered suggestion
-                filtered_suggestion = FilteredSuggestion.create(
-                    trip=self.current_trip,
-                    totalbudget=selected_dest["cost"],
-                    dailybudget=selected_dest["cost"] / 7,  # Simple calculation
-                    food=food_obj,
-                    transport=transport_obj,
-                    destination=destination_obj,
-                    accommodation=accommodation_obj
-                )
+                filtered_suggestion = booking.create_filtered_suggestion(self.current_trip, selected_dest)
                 
                 print(f"✅ Created filtered suggestion ID: {filtered_suggestion.f_suggest_id}")
                 
@@ -488,13 +529,16 @@ class TravelPlannerSystem:
         try:
             self.ensure_db_connection()
             
-            trips = FinalTrip.select().where(FinalTrip.user_id == self.current_user["user_id"])
+            trips = list(FinalTrip.select().where(FinalTrip.user_id == self.current_user["user_id"]))
+            trips += archive.older_final_trips(self.current_user["user_id"])
+            destinations = catalog.resolve_components(trips, Loaders(), [Destination])[Destination]
             
-            if trips.count() > 0:
+            if len(trips) > 0:
                 print("Your confirmed trips:\n")
                 for trip in trips:
+                    dest = destinations.get(trip.destination_id)
                     print(f"📍 Trip ID: {trip.f_trip_id}")
-                    print(f"🏁 Destination: {trip.destination.city}, {trip.destination.country}")
+                    print(f"🏁 Destination: {f'{dest.city}, {dest.country}' if dest else 'Unknown'}")
                     print(f"💰 Total Budget: ${trip.totalbudget:.2f}")
                     print(f"📅 Dates: {trip.startDate} to {trip.endDate}")
                     print("-" * 40)
@@ -534,6 +578,7 @@ class TravelPlannerSystem:
     def run(self):
         """Main system loop"""
         print("Starting Travel Planner System...")
+        check_connection()
         
         try:
             while True:
@@ -554,5 +599,10 @@ class TravelPlannerSystem:
 
 # Run the system
 if __name__ == "__main__":
-    system = TravelPlannerSystem()
-    system.run()
\ No newline at end of file
+    if "--batch" in sys.argv:
+        # Non-interactive: run a scenario file, see batch.py
+        import batch
+        batch.main()
+    else:
+        system = TravelPlannerSystem()
+        system.run()
\ No newline at end of file
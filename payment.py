@@ -1,5 +1,14 @@
 # payment.py
-from database.database import FinalTrip, db
+from database.database import FinalTrip, db, write_transaction
+import rollups
+
+def settle(ftripid):
+    """Mark a trip paid: (final trip, newly paid). Raises FinalTrip.DoesNotExist"""
+    ft = FinalTrip.get(FinalTrip.f_trip_id == ftripid)
+    # Flag the trip paid and count it in the revenue rollups together
+    with write_transaction():
+        newly_paid = rollups.record_payment(ft.f_trip_id)
+    return ft, newly_paid
 
 def checkout(ftripid):
     """Process payment for final trip"""
@@ -13,6 +22,9 @@ def checkout(ftripid):
         print(f"👤 User: {ft.user_id.user_name}")
         print(f"📍 Destination: {ft.destination.city}, {ft.destination.country}")
         print(f"💰 Amount: ${ft.totalbudget:.2f}")
+        _, newly_paid = settle(ft.f_trip_id)
+        if not newly_paid:
+            print("ℹ️  This trip was already paid")
         print("✅ Payment processed successfully!")
         print("🎉 Your booking is confirmed! Have a great trip! 🌟")
         
@@ -20,7 +32,4 @@ def checkout(ftripid):
 
     except FinalTrip.DoesNotExist:
         print(f"❌ Error: FinalTrip with ID {ftripid} not found")
-        return False
-    except Exception as e:
-        print(f"❌ Payment processing error: {e}")
         return False
\ No newline at end of file
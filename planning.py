@@ -1,30 +1,95 @@
 # planning.py
-from fastapi import HTTPException
-from database.database import Destination, db
+from peewee import JOIN
+from database.database import Destination, User, Trip, FilteredSuggestion, FinalTrip, db, write_transaction
+from spatial_index import destination_index
+from ranking import CATEGORIES, DestinationRanker
+from destination_stats import get_stats, get_stats_many
+import catalog_snapshot
+from cache_bus import bus
+from singleflight import SingleFlight
 from typing import Optional, Dict, Any
+from datetime import date, timedelta
 import random
+import numpy as np
 
 # --- Helper to structure the destination data ---
 
-def format_destination(dest: Destination) -> Dict[str, Any]:
-    """Extracts required destination attributes for the API response"""
+def simulated_attributes(dest_id: int) -> Dict[str, Any]:
+    """Cost/rating/category placeholders, stable per destination"""
+    rng = random.Random(dest_id)
     return {
-        "id": dest.dest_id,
-        "name": dest.city,  # Using city as the primary name
-        "country": dest.country,
-        "city": dest.city,
-        "description": dest.description,
+        "cost": rng.uniform(50, 200),
+        "rating": round(rng.uniform(3.5, 5.0), 1),
+        "category": rng.choice(CATEGORIES),
+    }
+
+
+def _format(dest_id, city, country, description, attrs, stats=None):
+    formatted = {
+        "id": dest_id,
+        "name": city,  # Using city as the primary name
+        "country": country,
+        "city": city,
+        "description": description,
         # SIMULATED ATTRIBUTES
-        "cost": random.uniform(50, 200),
-        "rating": round(random.uniform(3.5, 5.0), 1),
-        "category": random.choice(["Beach", "Mountain", "City", "Adventure"]),
+        "cost": attrs["cost"],
+        "rating": attrs["rating"],
+        "category": attrs["category"],
         "image": "placeholder_url",
     }
+    if stats is not None:
+        formatted["stats"] = stats
+    return formatted
+
+
+def format_destination(dest: Destination, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Extracts required destination attributes for the API response"""
+    return _format(dest.dest_id, dest.city, dest.country, dest.description,
+                   simulated_attributes(dest.dest_id), stats)
+
+
+def format_snapshot_row(row: Dict[str, Any], stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Same shape as format_destination, from a catalog_snapshot row"""
+    return _format(row["id"], row["city"], row["country"], row["description"], row, stats)
+
+
+def format_destination_ids(ids, stats: Optional[Dict[int, Any]] = None) -> Dict[int, Dict[str, Any]]:
+    """{dest_id: formatted} from the catalog snapshot, falling back to one query for the rest"""
+    stats = stats or {}
+    formatted = {}
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        for i in snapshot.rows_for(ids):
+            row = snapshot.row(i)
+            formatted[row["id"]] = format_snapshot_row(row, stats.get(row["id"]))
+    missing = [i for i in ids if i not in formatted]
+    if missing:
+        for dest in Destination.select().where(Destination.dest_id.in_(missing)):
+            formatted[dest.dest_id] = format_destination(dest, stats.get(dest.dest_id))
+    return formatted
+
+
+# Shared per-process ranker; booking.finalizeTrip feeds it new trips
+ranker = DestinationRanker(simulated_attributes)
+
+
+def _forget_ranked_user(event):
+    # This process already folded its own bookings in via record_final_trip
+    if event.origin == bus.origin and event.table == "final_trips":
+        return
+    ranker.forget_user(event.user if event.table != "users" else event.key)
+
+
+# Other workers' bookings (and profile edits) change a user's vector
+bus.subscribe("final_trips", _forget_ranked_user)
+bus.subscribe("users", _forget_ranked_user)
+# Edited and deleted destinations are rewritten or tombstoned on the next refresh
+bus.subscribe("destinations", lambda event: ranker.invalidate(event.key))
 
 # --- Main Logic Functions ---
 
-def show_random_suggestions(user_id: int):
-    """Queries DB, randomly picks 5 destinations, and returns them"""
+def show_random_suggestions(user_id: int, k: int = 5):
+    """Ranks destinations for the user and returns the top k"""
     
     # Check if connection is already open
     connection_was_open = not db.is_closed()
@@ -33,22 +98,23 @@ def show_random_suggestions(user_id: int):
         db.connect()
         
     try:
-        # 1. Queries database to get all destinations
-        all_dests = list(Destination.select())
+        # 1. Pick up destinations added since the last call
+        ranker.refresh()
 
-        if not all_dests:
+        if not len(ranker):
             return {"error": "No destinations exist in the database."}
 
-        # 2. Randomly picks 5 destinations
-        num_suggestions = min(5, len(all_dests))
-        random_suggestions = random.sample(all_dests, num_suggestions)
+        # 2. Score every destination against the user's profile
+        ranked = ranker.top_k(user_id, k)
 
-        # 3. Extracts details and returns list
-        suggestions_list = [format_destination(dest) for dest in random_suggestions]
+        # 3. Load just the winners and keep the ranking order
+        ids = [i for i, _ in ranked]
+        dests = format_destination_ids(ids, get_stats_many(ids))
+        suggestions_list = [dests[i] for i in ids if i in dests]
 
         return {
             "suggestions": suggestions_list,
-            "message": f"Showing {num_suggestions} random suggestions."
+            "message": f"Showing {len(suggestions_list)} suggestions picked for you."
         }
     finally:
         # Only close connection if we opened it
@@ -56,9 +122,45 @@ def show_random_suggestions(user_id: int):
             db.close()
 
 
-def filter_suggestions(user_id: int, budget: Optional[float] = None, destination: Optional[str] = None, 
+# Identical filter requests arriving together share one query and format loop
+filter_flight = SingleFlight("planning.filter")
+
+
+def _filter_args(budget, destination, category):
+    # The answer does not depend on who asks, so these are the only inputs
+    # that can change it. The destination is echoed back in filters_applied
+    # as sent, so its case stays part of the key.
+    return (None if budget is None else float(budget),
+            destination or None,
+            category.lower() if category else None)
+
+
+def filter_suggestions(user_id: int, budget: Optional[float] = None, destination: Optional[str] = None,
                        category: Optional[str] = None):
-    """Receives filter parameters and returns destinations matching ALL filters"""
+    """Receives filter parameters and returns destinations matching ALL filters.
+
+    Concurrent identical calls are coalesced; the result is shared, so
+    don't mutate it.
+    """
+    args = _filter_args(budget, destination, category)
+    return filter_flight.do(args, _filter_suggestions, *args)
+
+
+async def filter_suggestions_async(user_id: int, budget: Optional[float] = None,
+                                   destination: Optional[str] = None, category: Optional[str] = None,
+                                   encode=None):
+    """filter_suggestions for async handlers; waiting doesn't hold a worker thread.
+
+    `encode`, if given, is applied once to the shared result (e.g. JSON
+    rendering) so coalesced callers skip that work too.
+    """
+    args = _filter_args(budget, destination, category)
+    if encode is None:
+        return await filter_flight.do_async(args, _filter_suggestions, *args)
+    return await filter_flight.do_async(args + (encode,), lambda: encode(_filter_suggestions(*args)))
+
+
+def _filter_suggestions(budget: Optional[float], destination: Optional[str], category: Optional[str]):
     
     # Check if connection is already open
     connection_was_open = not db.is_closed()
@@ -70,6 +172,14 @@ def filter_suggestions(user_id: int, budget: Optional[float] = None, destination
         # Start with a base query
         query = Destination.select() 
         applied_filters = {}
+        final_list = []
+
+        # With a catalog snapshot, filter its columns in place; only
+        # destinations added since it was built still come from the table
+        snapshot = catalog_snapshot.current()
+        if snapshot is not None and len(snapshot):
+            final_list = _filter_snapshot(snapshot, budget, destination, category)
+            query = query.where(Destination.dest_id > int(snapshot.ids[-1]))
 
         # 1. Apply filters one by one
         
@@ -85,7 +195,6 @@ def filter_suggestions(user_id: int, budget: Optional[float] = None, destination
         filtered_results = list(query)
         
         # 3. Apply simulated cost/category filters in Python
-        final_list = []
         for dest in filtered_results:
             formatted = format_destination(dest)
             
@@ -99,6 +208,12 @@ def filter_suggestions(user_id: int, budget: Optional[float] = None, destination
             
             final_list.append(formatted)
 
+        # Attach aggregates for the survivors in one query
+        stats = get_stats_many([d["id"] for d in final_list])
+        for formatted in final_list:
+            if formatted["id"] in stats:
+                formatted["stats"] = stats[formatted["id"]]
+
         # 4. Returns list of destinations matching ALL filters
         if not final_list:
             message = "No destinations match the applied filters."
@@ -113,4 +228,238 @@ def filter_suggestions(user_id: int, budget: Optional[float] = None, destination
     finally:
         # Only close connection if we opened it
         if not connection_was_open and not db.is_closed():
-            db.close()
\ No newline at end of file
+            db.close()
+
+
+def _filter_snapshot(snapshot, budget, destination, category):
+    """filter_suggestions over the snapshot's columns, in catalog order"""
+    rows = snapshot.matching(destination) if destination else np.arange(len(snapshot))
+    keep = np.ones(len(rows), dtype=bool)
+    if budget is not None:
+        keep &= snapshot.cost[rows] <= budget
+    if category:
+        codes = [i for i, name in enumerate(snapshot.categories) if name.lower() == category.lower()]
+        keep &= np.isin(snapshot.category[rows], codes)
+    return [format_snapshot_row(snapshot.row(i)) for i in rows[keep]]
+
+
+def nearby_destinations(user_id: Optional[int] = None, lat: Optional[float] = None,
+                        lon: Optional[float] = None, k: int = 10,
+                        radius_km: Optional[float] = None):
+    """Returns the k destinations closest to a point or to the user's home city"""
+
+    # Check if connection is already open
+    connection_was_open = not db.is_closed()
+
+    if not connection_was_open:
+        db.connect()
+
+    try:
+        # 1. Work out the origin: explicit point, else the user's home city
+        if lat is None or lon is None:
+            if user_id is None:
+                return {"error": "Provide lat/lon or a user_id."}
+            user = User.get_or_none(User.user_id == user_id)
+            if not user:
+                return {"error": f"User {user_id} not found."}
+            home = (Destination
+                    .select()
+                    .where((Destination.city == user.city) &
+                           (Destination.country == user.country) &
+                           Destination.latitude.is_null(False))
+                    .first())
+            if not home:
+                return {"error": f"No coordinates known for {user.city}, {user.country}."}
+            lat, lon = home.latitude, home.longitude
+
+        # 2. Pick up destinations added since the last call, then search
+        destination_index.refresh()
+        hits = destination_index.nearest(lat, lon, k=k, radius_km=radius_km)
+
+        # 3. Load the matching rows in one query and keep the distance order
+        dests = format_destination_ids([i for i, _ in hits])
+        results = []
+        for dest_id, distance in hits:
+            if dest_id in dests:
+                formatted = dests[dest_id]
+                formatted["distance_km"] = distance
+                results.append(formatted)
+
+        return {
+            "origin": {"lat": lat, "lon": lon},
+            "destinations": results,
+            "message": f"Found {len(results)} destinations nearby."
+        }
+    finally:
+        # Only close connection if we opened it
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def destination_stats(dest_id: int):
+    """Returns the precomputed food/accommodation/transport aggregates of a destination"""
+
+    # Check if connection is already open
+    connection_was_open = not db.is_closed()
+
+    if not connection_was_open:
+        db.connect()
+
+    try:
+        stats = get_stats(dest_id)
+        if stats is None:
+            return {"error": f"No stats for destination {dest_id}."}
+        return {"destination_id": dest_id, "stats": stats}
+    finally:
+        # Only close connection if we opened it
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def lock_user(user_id: int):
+    """Inside a write_transaction: make the user's other trip-creating requests wait for this one.
+
+    SQLite already holds the database write lock (BEGIN IMMEDIATE); Postgres
+    locks the user's row, so a conflict check and the insert it allows can't
+    interleave with another request's.
+    """
+    if db.for_update:
+        list(User.select(User.user_id).where(User.user_id == user_id).for_update())
+
+
+def find_trip_conflicts(user_id: int, start, end):
+    """Returns the user's Trips/FinalTrips whose dates overlap [start, end).
+
+    Trips are half-open, so one may start on the day another ends; a
+    same-day trip counts as one day. A booked Trip is listed once, as the
+    Trip. Both tables are indexed on (user, endDate, startDate): the index
+    range `endDate >= start` only covers trips that haven't finished
+    before the new one starts, so past history is never scanned, and
+    startDate is checked inside the index.
+    """
+    start, end = _as_date(start), _as_date(end)
+    end = max(end, start + timedelta(days=1))
+    conflicts = []
+    listed_trips = set()
+    for kind, model, user_field, id_field in (
+            ("trip", Trip, Trip.user, Trip.trip_id),
+            ("final_trip", FinalTrip, FinalTrip.user_id, FinalTrip.f_trip_id)):
+        trip_field = Trip.trip_id if model is Trip else FilteredSuggestion.trip
+        rows = (model
+                .select(id_field, model.destination, model.startDate, model.endDate, trip_field)
+                .where((user_field == user_id) &
+                       (model.endDate >= start) &
+                       # Ending on `start` only overlaps for a same-day trip
+                       ((model.endDate > start) | (model.startDate == model.endDate)) &
+                       (model.startDate < end))
+                .order_by(model.startDate))
+        if model is FinalTrip:
+            rows = rows.join(FilteredSuggestion, JOIN.LEFT_OUTER,
+                             on=(FinalTrip.f_suggest == FilteredSuggestion.f_suggest_id))
+        for row_id, dest_id, trip_start, trip_end, trip_id in rows.tuples():
+            if model is Trip:
+                listed_trips.add(trip_id)
+            elif trip_id in listed_trips:
+                continue
+            conflicts.append({
+                "type": kind,
+                "id": row_id,
+                "destination_id": dest_id,
+                "startDate": str(trip_start),
+                "endDate": str(trip_end),
+            })
+    return conflicts
+
+
+def create_trip(user_id: int, max_budget: float, start_date, end_date,
+                destination_city: Optional[str] = None, destination_country: Optional[str] = None):
+    """Validates dates, refuses overlapping trips and creates a Trip"""
+
+    # Check if connection is already open
+    connection_was_open = not db.is_closed()
+
+    if not connection_was_open:
+        db.connect()
+
+    try:
+        try:
+            start, end = _as_date(start_date), _as_date(end_date)
+        except ValueError:
+            return {"error": "Dates must be in YYYY-MM-DD format."}
+        if end < start:
+            return {"error": "End date must not be before start date."}
+
+        # Find or use first destination
+        dest_query = Destination.select()
+        if destination_city:
+            dest_query = dest_query.where(Destination.city.contains(destination_city))
+        if destination_country:
+            dest_query = dest_query.where(Destination.country.contains(destination_country))
+
+        destination = dest_query.first()
+        if not destination:
+            destination = Destination.select().first()
+        if not destination:
+            return {"error": "No destinations exist in the database."}
+
+        # Check and insert together, or two requests could both pass the check
+        with write_transaction():
+            lock_user(user_id)
+            conflicts = find_trip_conflicts(user_id, start, end)
+            if conflicts:
+                return {
+                    "error": "You already have a trip during these dates.",
+                    "conflicts": conflicts
+                }
+            trip = Trip.create(
+                maxBudget=max_budget,
+                destination=destination,
+                startDate=start,
+                endDate=end,
+                user_id=user_id
+            )
+
+        return {
+            "message": "Trip created successfully",
+            "trip_id": trip.trip_id,
+            "trip": trip,
+            "destination": {
+                "city": destination.city,
+                "country": destination.country
+            }
+        }
+    finally:
+        # Only close connection if we opened it
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def trip_conflicts(user_id: int, start_date, end_date):
+    """API wrapper around find_trip_conflicts with connection handling"""
+
+    # Check if connection is already open
+    connection_was_open = not db.is_closed()
+
+    if not connection_was_open:
+        db.connect()
+
+    try:
+        try:
+            start, end = _as_date(start_date), _as_date(end_date)
+        except ValueError:
+            return {"error": "Dates must be in YYYY-MM-DD format."}
+        if end < start:
+            return {"error": "End date must not be before start date."}
+        conflicts = find_trip_conflicts(user_id, start, end)
+        return {
+            "has_conflicts": bool(conflicts),
+            "conflicts": conflicts
+        }
+    finally:
+        # Only close connection if we opened it
+        if not connection_was_open and not db.is_closed():
+            db.close()
@@ -0,0 +1,208 @@
+# price_calendar.py - Estimated trip cost by start date and length, per destination
+#
+# For one destination, a grid of the estimated total cost of every trip
+# starting on each of the next HORIZON_DAYS days and lasting 1 to
+# MAX_NIGHTS nights:
+#   transport  cheapest Transport.cost into the destination, out and back
+#   stay       cheapest accommodation's nightly rate, every night
+#   food       two meals a day at a typical restaurant there
+# each scaled by day-of-year multipliers: the local summer season (by
+# latitude), year-end holidays, the destination's booking demand by month
+# (DestinationMonthRollup), weekend nights, and fares bought close to
+# departure.
+#
+# The grid is built with NumPy from cumulative sums of the per-day costs,
+# so any (start, nights) cell is a couple of lookups, and kept per
+# destination until the catalog changes or the day turns over.
+# Accommodation and Food carry no prices, so rates are placeholders stable
+# per row, like planning.simulated_attributes.
+import random
+from datetime import date, timedelta
+from statistics import median
+import numpy as np
+from database.database import connected, Destination, Food, Accommodation, Transport, DestinationMonthRollup
+from cache_bus import TableCache
+import itinerary
+import planning
+
+HORIZON_DAYS = 365
+MAX_NIGHTS = 21
+DEFAULT_NIGHTS = 7
+DEFAULT_RANGE_DAYS = 90
+FALLBACK_NIGHTLY = 60.0
+FALLBACK_MEAL = 20.0
+SEASON_AMPLITUDE = 0.20      # summer peak vs winter low, outside the tropics
+TROPICS_AMPLITUDE = 0.08
+HOLIDAY_MULTIPLIER = 1.25    # Dec 20 to Jan 5
+WEEKEND_MULTIPLIER = 1.15    # Friday and Saturday nights
+DEMAND_WEIGHT = 0.3          # how much a busy month moves prices
+LATE_FARES = ((14, 1.3), (30, 1.1))  # (days before departure, fare multiplier)
+
+# A catalog edit can change any destination's inputs; rebuilding is cheap
+calendars = TableCache(["destinations", "food", "accommodations", "transport"],
+                       key_of=lambda event: None, max_size=2000)
+
+
+def nightly_rate(acco_id: int, rating: float) -> float:
+    """Price of a night placeholder, stable per accommodation"""
+    return round(random.Random(f"acco:{acco_id}").uniform(35, 80) * (rating or 3.5) / 3.5, 2)
+
+
+class PriceCalendar:
+    """Cost grid of one destination from `start`: grid[s, n - 1] is s days later, n nights"""
+
+    def __init__(self, start, fare, nightly, daily_food, latitude=None, monthly_bookings=None):
+        days = HORIZON_DAYS + MAX_NIGHTS + 1
+        self.start = start
+        dates = np.arange(np.datetime64(start), np.datetime64(start) + days)
+        months = dates.astype("datetime64[M]").astype(int) % 12           # 0 = January
+        day_of_year = (dates - dates.astype("datetime64[Y]")).astype(int)  # 0 = Jan 1
+        weekday = (dates.astype(int) + 3) % 7                              # 0 = Monday
+
+        peak = 196 if (latitude or 0) >= 0 else 15  # mid-July or mid-January
+        amplitude = TROPICS_AMPLITUDE if latitude is not None and abs(latitude) < 23.5 else SEASON_AMPLITUDE
+        season = 1 + amplitude * np.cos(2 * np.pi * (day_of_year - peak) / 365.25)
+        holidays = np.where((day_of_year >= 353) | (day_of_year <= 4), HOLIDAY_MULTIPLIER, 1.0)
+        demand = np.ones(12)
+        if monthly_bookings is not None and monthly_bookings.sum() > 0:
+            mean = monthly_bookings.mean()
+            demand = 1 + DEMAND_WEIGHT * np.clip((monthly_bookings - mean) / mean, -0.5, 1.0)
+        busy = season * holidays * demand[months]
+
+        late = np.ones(days)
+        for within, multiplier in sorted(LATE_FARES, reverse=True):
+            late[:within] = multiplier
+        weekend = np.where((weekday == 4) | (weekday == 5), WEEKEND_MULTIPLIER, 1.0)
+
+        self.fare = fare * busy * late                # one way, by travel day
+        self.nightly = nightly * busy * weekend       # by night
+        self.food = daily_food * (1 + (busy - 1) / 2)  # by day; prices move less
+        stay_sums = np.concatenate(([0.0], np.cumsum(self.nightly)))
+        food_sums = np.concatenate(([0.0], np.cumsum(self.food)))
+
+        starts = np.arange(HORIZON_DAYS)[:, None]
+        ends = starts + np.arange(1, MAX_NIGHTS + 1)[None, :]
+        self._stay_sums, self._food_sums = stay_sums, food_sums
+        self.grid = (self.fare[starts] + self.fare[ends] +
+                     stay_sums[ends] - stay_sums[starts] +
+                     food_sums[ends + 1] - food_sums[starts]).astype(np.float32)
+
+    def window(self, s, nights):
+        """Cost breakdown of the trip starting s days after self.start"""
+        e = s + nights
+        start = self.start + timedelta(days=int(s))
+        return {
+            "startDate": str(start),
+            "endDate": str(start + timedelta(days=nights)),
+            "nights": nights,
+            "total": round(float(self.grid[s, nights - 1]), 2),
+            "transport": round(float(self.fare[s] + self.fare[e]), 2),
+            "stay": round(float(self._stay_sums[e] - self._stay_sums[s]), 2),
+            "food": round(float(self._food_sums[e + 1] - self._food_sums[s]), 2),
+        }
+
+    def starts_between(self, first, last, nights):
+        """Grid rows of trips starting on or after first and back by last"""
+        s0 = max(0, (first - self.start).days)
+        s1 = min(HORIZON_DAYS - 1, (last - self.start).days - nights)
+        return s0, s1
+
+    def cheapest(self, first, last, nights=DEFAULT_NIGHTS, limit=5):
+        """The `limit` cheapest windows of `nights` nights within [first, last]"""
+        s0, s1 = self.starts_between(first, last, nights)
+        if s1 < s0:
+            return []
+        column = self.grid[s0:s1 + 1, nights - 1]
+        k = min(limit, len(column))
+        picks = np.argpartition(column, k - 1)[:k]
+        picks = picks[np.argsort(column[picks], kind="stable")]
+        return [self.window(s0 + int(i), nights) for i in picks]
+
+    def totals(self, first, last, nights=DEFAULT_NIGHTS):
+        """(start date, total) of every window of `nights` nights within [first, last]"""
+        s0, s1 = self.starts_between(first, last, nights)
+        return [(str(self.start + timedelta(days=s)), round(float(total), 2))
+                for s, total in zip(range(s0, s1 + 1), self.grid[s0:s1 + 1, nights - 1])]
+
+
+def _load(dest_id, today):
+    destination = Destination.get_or_none(Destination.dest_id == dest_id)
+    if destination is None:
+        return None
+    fares = [cost for cost, in (Transport
+                                .select(Transport.cost)
+                                .where((Transport.destCity == destination.city) &
+                                       (Transport.destCountry == destination.country))
+                                .tuples())]
+    rates = [nightly_rate(acco_id, rating) for acco_id, rating in
+             (Accommodation
+              .select(Accommodation.acco_id, Accommodation.rating)
+              .where(Accommodation.destination == dest_id)
+              .tuples())]
+    meals = [itinerary.meal_cost(cuisine_id) for cuisine_id, in
+             Food.select(Food.cuisine_id).where(Food.destination == dest_id).tuples()]
+    monthly = np.zeros(12)
+    for month, bookings in (DestinationMonthRollup
+                            .select(DestinationMonthRollup.month, DestinationMonthRollup.bookings)
+                            .where(DestinationMonthRollup.destination == dest_id)
+                            .tuples()):
+        monthly[month.month - 1] += bookings
+    return PriceCalendar(
+        today,
+        fare=min(fares) if fares else planning.simulated_attributes(dest_id)["cost"],
+        nightly=min(rates) if rates else FALLBACK_NIGHTLY,
+        daily_food=2 * (median(meals) if meals else FALLBACK_MEAL),
+        latitude=destination.latitude,
+        monthly_bookings=monthly,
+    )
+
+
+@connected
+def get_calendar(dest_id: int):
+    """The destination's PriceCalendar from today, or None if it doesn't exist"""
+    today = date.today()
+    return calendars.get((dest_id, today), lambda: _load(dest_id, today))
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def cheapest_windows(dest_id: int, start=None, end=None, nights: int = DEFAULT_NIGHTS, limit: int = 5):
+    """Cheapest trips of `nights` nights between start and end, plus the total for every start date"""
+    try:
+        first = _as_date(start) if start else date.today()
+        last = _as_date(end) if end else first + timedelta(days=DEFAULT_RANGE_DAYS)
+    except ValueError:
+        return {"error": "Dates must be in YYYY-MM-DD format."}
+    if not 1 <= nights <= MAX_NIGHTS:
+        return {"error": f"nights must be between 1 and {MAX_NIGHTS}."}
+    if limit < 1:
+        return {"error": "limit must be at least 1."}
+    calendar = get_calendar(dest_id)
+    if calendar is None:
+        return {"error": f"Destination {dest_id} not found."}
+    if last <= first or first < calendar.start or first >= calendar.start + timedelta(days=HORIZON_DAYS):
+        return {"error": f"Pick a range starting within the next {HORIZON_DAYS} days."}
+    return {
+        "dest_id": dest_id,
+        "nights": nights,
+        "windows": calendar.cheapest(first, last, nights, limit),
+        "calendar": [{"startDate": day, "total": total}
+                     for day, total in calendar.totals(first, last, nights)],
+    }
+
+
+def quote(dest_id: int, start, end, around_days: int = 14, limit: int = 3):
+    """Estimated cost of start..end, and cheaper trips as long starting within around_days of it"""
+    calendar = get_calendar(dest_id)
+    start, end = _as_date(start), _as_date(end)
+    nights = (end - start).days
+    s = (start - calendar.start).days if calendar else -1
+    if calendar is None or not 1 <= nights <= MAX_NIGHTS or not 0 <= s < HORIZON_DAYS:
+        return None
+    chosen = calendar.window(s, nights)
+    around = calendar.cheapest(start - timedelta(days=around_days),
+                               end + timedelta(days=around_days), nights, limit)
+    return {"estimate": chosen,
+            "cheaper": [window for window in around if window["total"] < chosen["total"]]}
@@ -0,0 +1,348 @@
+# ranking.py - Personalized top-k destination ranking
+import math
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+from database.database import Destination, FinalTrip, User
+from peewee import fn
+
+CATEGORIES = ["Beach", "Mountain", "City", "Adventure"]
+
+# Dense feature layout shared by destination columns and user weights
+F_BIAS, F_CHEAP, F_RATING, F_POPULAR = 0, 1, 2, 3
+F_CATEGORY = 4  # one slot per entry in CATEGORIES
+DENSE_DIM = F_CATEGORY + len(CATEGORIES)
+
+# Top-k selection works on blocks of this many rows (buffer sizes are
+# powers of two, so they always divide evenly)
+BLOCK = 64
+
+# Sparse affinities: one-hot country/city features are kept as postings
+# lists instead of columns, so each user only pays for the few places
+# they actually have a preference about.
+HOME_COUNTRY_WEIGHT = 0.5
+HOME_CITY_WEIGHT = -1.0      # nobody needs a trip to their own city
+VISITED_COUNTRY_WEIGHT = 0.8
+VISITED_CITY_WEIGHT = -0.3   # nudge towards somewhere new
+
+# Cached user vectors, least recently used dropped first
+MAX_USERS = 10000
+
+
+def _norm(text):
+    return (text or "").strip().lower()
+
+
+class _UserState:
+    """Raw counters behind a user's vector, updated as trips are booked"""
+
+    def __init__(self, city, country):
+        self.home = (_norm(city), _norm(country))
+        self.trips = 0
+        self.budget_sum = 0.0
+        self.countries = Counter()
+        self.cities = Counter()
+        self.categories = Counter()
+        self.dense = None
+        self.sparse = None
+
+    def add_trip(self, city, country, category, budget):
+        self.trips += 1
+        self.budget_sum += float(budget or 0)
+        self.countries[_norm(country)] += 1
+        self.cities[(_norm(city), _norm(country))] += 1
+        self.categories[category] += 1
+        self.dense = None
+
+    def vector(self):
+        """Returns (dense weights, sparse {posting key: weight})"""
+        if self.dense is not None:
+            return self.dense, self.sparse
+
+        dense = np.zeros(DENSE_DIM, dtype=np.float32)
+        dense[F_RATING] = 1.0
+        dense[F_POPULAR] = 0.3
+        if self.trips:
+            avg_budget = self.budget_sum / self.trips
+            dense[F_CHEAP] = min(1.0, max(0.2, 1 - avg_budget / 10000))
+            for i, name in enumerate(CATEGORIES):
+                dense[F_CATEGORY + i] = self.categories[name] / self.trips
+        else:
+            dense[F_CHEAP] = 0.5
+
+        sparse = Counter()
+        home_city, home_country = self.home
+        sparse[("country", home_country)] += HOME_COUNTRY_WEIGHT
+        sparse[("city", self.home)] += HOME_CITY_WEIGHT
+        for country, n in self.countries.items():
+            sparse[("country", country)] += VISITED_COUNTRY_WEIGHT * n / self.trips
+        for city, n in self.cities.items():
+            sparse[("city", city)] += VISITED_CITY_WEIGHT
+
+        self.dense, self.sparse = dense, dict(sparse)
+        return self.dense, self.sparse
+
+
+class DestinationRanker:
+    """Scores every destination for a user and keeps the best k.
+
+    Destinations are stored column-major as a (DENSE_DIM, n) float32 block
+    so a user's score over the whole catalog is one matrix-vector product,
+    plus scatter-adds over the postings of the countries/cities that user
+    cares about. `attributes(dest_id)` supplies cost/rating/category.
+    """
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+        self._features = np.zeros((DENSE_DIM, 1024), dtype=np.float32)
+        self._ids = np.zeros(1024, dtype=np.int64)
+        self._live = np.zeros(1024, dtype=bool)  # False for padding and removed columns
+        self._size = 0
+        self._removed = 0
+        self._rows = {}         # dest_id -> row
+        self._places = {}       # dest_id -> (city, country, category)
+        self._postings = {}     # ("country", c) / ("city", (c, c)) -> [rows]
+        self._posting_arrays = {}
+        self._max_id = 0
+        self._stale = set()     # dest_ids changed elsewhere (None: all), reloaded on refresh
+        self._users = OrderedDict()  # user_id -> _UserState, least recently used first
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size - self._removed
+
+    # --- Destination side ---
+
+    @staticmethod
+    def _keys(city, country):
+        return ("country", _norm(country)), ("city", (_norm(city), _norm(country)))
+
+    def _write_column(self, row, dest_id, city, country, popularity):
+        attrs = self.attributes(dest_id)
+        col = self._features[:, row]
+        col[:] = 0
+        col[F_BIAS] = 1.0
+        col[F_CHEAP] = 1 - (attrs["cost"] - 50) / 150
+        col[F_RATING] = (attrs["rating"] - 3.5) / 1.5
+        col[F_POPULAR] = math.log1p(popularity)
+        col[F_CATEGORY + CATEGORIES.index(attrs["category"])] = 1.0
+        self._ids[row] = dest_id
+        self._live[row] = True
+        self._rows[dest_id] = row
+        self._places[dest_id] = (city, country, attrs["category"])
+        for key in self._keys(city, country):
+            self._postings.setdefault(key, []).append(row)
+            self._posting_arrays.pop(key, None)
+
+    def _drop_postings(self, dest_id, row):
+        city, country, _ = self._places.pop(dest_id)
+        for key in self._keys(city, country):
+            self._postings[key].remove(row)
+            self._posting_arrays.pop(key, None)
+
+    def add_destination(self, dest_id, city, country, popularity=0):
+        """Append one destination column"""
+        with self._lock:
+            if dest_id in self._rows:
+                return
+            if self._size == self._ids.shape[0]:
+                grow = self._ids.shape[0] * 2
+                features = np.zeros((DENSE_DIM, grow), dtype=np.float32)
+                features[:, :self._size] = self._features[:, :self._size]
+                ids = np.zeros(grow, dtype=np.int64)
+                ids[:self._size] = self._ids[:self._size]
+                live = np.zeros(grow, dtype=bool)
+                live[:self._size] = self._live[:self._size]
+                self._features, self._ids, self._live = features, ids, live
+            self._write_column(self._size, dest_id, city, country, popularity)
+            self._size += 1
+            self._max_id = max(self._max_id, dest_id)
+
+    def update_destination(self, dest_id, city, country):
+        """Rewrite a destination's column and postings in place, keeping its popularity"""
+        with self._lock:
+            row = self._rows.get(dest_id)
+            if row is None:
+                return
+            popularity = round(math.expm1(self._features[F_POPULAR, row]))
+            self._drop_postings(dest_id, row)
+            self._write_column(row, dest_id, city, country, popularity)
+
+    def remove_destination(self, dest_id):
+        """Tombstone a destination's column: it no longer scores or takes a top-k slot"""
+        with self._lock:
+            row = self._rows.pop(dest_id, None)
+            if row is None:
+                return
+            self._drop_postings(dest_id, row)
+            self._features[:, row] = 0
+            self._live[row] = False
+            self._removed += 1
+
+    def invalidate(self, dest_id=None):
+        """Mark one destination (None: all of them) for reloading on the next refresh"""
+        with self._lock:
+            if dest_id is None:
+                self._stale = None
+            elif self._stale is not None and dest_id <= self._max_id:
+                self._stale.add(dest_id)
+
+    def refresh(self):
+        """Pull destinations added since the last refresh, and reload invalidated ones"""
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        places = Destination.select(Destination.dest_id, Destination.city, Destination.country)
+        popularity = (FinalTrip
+                      .select(FinalTrip.destination, fn.COUNT(FinalTrip.f_trip_id))
+                      .group_by(FinalTrip.destination))
+        if stale is None:
+            # Everything: deleted destinations drop out, the rest are rewritten
+            current = list(places.tuples())
+            with self._lock:
+                stale = set(self._rows)
+        else:
+            current = list(places.where(Destination.dest_id > self._max_id).tuples())
+            if stale:
+                current.extend(places.where(Destination.dest_id.in_(list(stale))).tuples())
+            popularity = popularity.where(FinalTrip.destination > self._max_id)
+        if not current and not stale:
+            return
+        new = [row for row in current if row[0] not in self._rows]
+        counts = dict(popularity.tuples()) if new else {}
+        with self._lock:
+            for dest_id in stale - {row[0] for row in current}:
+                self.remove_destination(dest_id)
+            for dest_id, city, country in current:
+                if dest_id in self._rows:
+                    self.update_destination(dest_id, city, country)
+                else:
+                    self.add_destination(dest_id, city, country, counts.get(dest_id, 0))
+
+    # --- User side ---
+
+    def _user_state(self, user_id):
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._users.move_to_end(user_id)
+                return state
+        user = User.get_or_none(User.user_id == user_id)
+        if user is None:
+            # Unknown users get the neutral vector, and take no cache slot
+            return _UserState("", "")
+        state = _UserState(user.city, user.country)
+        trips = (FinalTrip
+                 .select(FinalTrip.totalbudget, Destination.dest_id, Destination.city, Destination.country)
+                 .join(Destination)
+                 .where(FinalTrip.user_id == user_id)
+                 .tuples())
+        for budget, dest_id, city, country in trips:
+            state.add_trip(city, country, self.attributes(dest_id)["category"], budget)
+        with self._lock:
+            state = self._users.setdefault(user_id, state)
+            while len(self._users) > MAX_USERS:
+                self._users.popitem(last=False)
+            return state
+
+    def record_final_trip(self, user_id, dest_id, totalbudget):
+        """Fold a newly booked trip into popularity and the cached user vector"""
+        with self._lock:
+            row = self._rows.get(dest_id)
+            if row is not None:
+                count = round(math.expm1(self._features[F_POPULAR, row])) + 1
+                self._features[F_POPULAR, row] = math.log1p(count)
+            state = self._users.get(user_id)
+            place = self._places.get(dest_id)
+            if state is not None and place is not None:
+                city, country, category = place
+                state.add_trip(city, country, category, totalbudget)
+            elif state is not None:
+                # Destination not indexed yet; rebuild this user on next use
+                del self._users[user_id]
+
+    def forget_user(self, user_id=None):
+        """Drop a cached user vector (None: all of them); rebuilt on next use"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    # --- Scoring ---
+
+    def _postings_array(self, key):
+        arr = self._posting_arrays.get(key)
+        if arr is None:
+            arr = np.asarray(self._postings.get(key, ()), dtype=np.int64)
+            self._posting_arrays[key] = arr
+        return arr
+
+    def top_k(self, user_id, k=5):
+        """Return up to k (dest_id, score) pairs, best first"""
+        state = self._user_state(user_id)
+        with self._lock:
+            n = len(self)
+            if n == 0 or k <= 0:
+                return []
+            dense, sparse = state.vector()
+            # Score the whole (block-padded) buffer; padding and removed columns are masked below
+            scores = dense @ self._features
+            for key, weight in sparse.items():
+                rows = self._postings_array(key)
+                if rows.size:
+                    scores[rows] += weight
+            ids, live = self._ids, self._live.copy()
+
+        k = min(k, n)
+        scores[~live] = -np.inf
+        candidates = self._candidates(scores, k)
+        best = candidates[np.argsort(scores[candidates])[::-1][:k]]
+        return [(int(ids[i]), float(scores[i])) for i in best]
+
+    @staticmethod
+    def _candidates(scores, k):
+        """Rows that can hold the top k, without sorting all n scores.
+
+        Rows are grouped into strided blocks (column c of a BLOCK-row
+        reshape). The k best scores live in at most k blocks, and each of
+        those has a maximum at least as large as the k-th best block
+        maximum, so only the top k blocks need an exact look.
+        """
+        size = scores.shape[0]
+        if size <= k * BLOCK:
+            return np.argpartition(scores, size - k)[-k:]
+        stride = size // BLOCK
+        block_max = scores.reshape(BLOCK, stride).max(axis=0)
+        blocks = np.argpartition(block_max, stride - k)[-k:]
+        rows = (blocks[:, None] + np.arange(BLOCK) * stride).ravel()
+        return rows[np.argpartition(scores[rows], rows.shape[0] - k)[-k:]]
+
+if __name__ == "__main__":
+    # Synthetic benchmark: 1M destinations, no database needed
+    import random
+    import time
+
+    def fake_attributes(dest_id):
+        rng = random.Random(dest_id)
+        return {"cost": rng.uniform(50, 200), "rating": round(rng.uniform(3.5, 5.0), 1),
+                "category": rng.choice(CATEGORIES)}
+
+    n = 1_000_000
+    ranker = DestinationRanker(fake_attributes)
+    countries = [f"country{i}" for i in range(200)]
+    start = time.perf_counter()
+    for dest_id in range(1, n + 1):
+        ranker.add_destination(dest_id, f"city{dest_id % 50000}", countries[dest_id % 200])
+    print(f"Built {n:,} destinations in {time.perf_counter() - start:.1f}s")
+
+    state = _UserState("city1", "country1")
+    for i in range(20):
+        state.add_trip(f"city{i}", countries[i], CATEGORIES[i % 4], 2500)
+    ranker._users[1] = state
+
+    ranker.top_k(1, 10)
+    runs = 50
+    start = time.perf_counter()
+    for _ in range(runs):
+        ranker.top_k(1, 10)
+    print(f"top_k(10): {(time.perf_counter() - start) / runs * 1000:.2f} ms per call")
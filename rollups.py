@@ -0,0 +1,301 @@
+# rollups.py - Pre-aggregated booking revenue and demand
+#
+#   python rollups.py rebuild   # recompute both rollups from final_trips
+#   python rollups.py check     # compare stored rollups with a fresh aggregate
+#
+# Every FinalTrip adds to two summary rows keyed by its travel dates:
+# destination x month (DestinationMonthRollup) and country x week
+# (CountryWeekRollup). Creation and deletion are tracked through model
+# signals like destination_stats; payment calls record_payment() itself.
+#
+# Months moved out of final_trips (database/partitions.py, archive.py) are
+# frozen: buckets before partitions.frozen_before() keep their stored
+# values through rebuild() and aren't compared by check().
+import sys
+from datetime import date, datetime, timedelta
+from peewee import fn, Case, chunked
+from playhouse.pool import PooledSqliteDatabase
+from playhouse.signals import post_save, pre_delete, post_delete
+from database.database import (
+    db, Destination, FinalTrip, DestinationMonthRollup, CountryWeekRollup, write_transaction
+)
+from database import partitions
+
+MEASURES = ("bookings", "booked_revenue", "paid_bookings", "paid_revenue")
+# Float sums picked up by increments may differ from a fresh SUM in the last digits
+TOLERANCE = 0.01
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def week_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+# --- Incremental maintenance ---
+
+def _bump(model, key, deltas):
+    """Add deltas to one rollup row, creating it if needed, in one statement"""
+    values = dict(key, **{name: deltas.get(name, 0) for name in MEASURES})
+    update = {getattr(model, name): getattr(model, name) + deltas[name] for name in deltas}
+    (model
+     .insert(values)
+     .on_conflict(conflict_target=[getattr(model, name) for name in key], update=update)
+     .execute())
+
+
+def _apply(trip, deltas):
+    start = _as_date(trip.startDate)
+    country = (Destination
+               .select(Destination.country)
+               .where(Destination.dest_id == trip.destination_id)
+               .scalar())
+    _bump(DestinationMonthRollup, {"destination": trip.destination_id, "month": month_of(start)}, deltas)
+    if country is not None:
+        _bump(CountryWeekRollup, {"country": country, "week": week_of(start)}, deltas)
+
+
+def _on_final_trip_save(model, instance, created):
+    if created:
+        amount = float(instance.totalbudget)
+        deltas = {"bookings": 1, "booked_revenue": amount}
+        if instance.paid_at is not None:
+            deltas.update(paid_bookings=1, paid_revenue=amount)
+        _apply(instance, deltas)
+
+
+def _remember_stored_trip(model, instance):
+    # The caller's copy may predate a payment or a bulk update; undo what
+    # the database actually counted
+    instance._rollup_row = model.get_or_none(model.f_trip_id == instance.f_trip_id)
+
+
+def _on_final_trip_delete(model, instance):
+    trip = getattr(instance, "_rollup_row", None)
+    if trip is None:
+        return
+    amount = float(trip.totalbudget)
+    deltas = {"bookings": -1, "booked_revenue": -amount}
+    if trip.paid_at is not None:
+        deltas.update(paid_bookings=-1, paid_revenue=-amount)
+    _apply(trip, deltas)
+
+
+post_save.connect(_on_final_trip_save, name="rollups_final_trip_save", sender=FinalTrip)
+pre_delete.connect(_remember_stored_trip, name="rollups_final_trip_pre_delete", sender=FinalTrip)
+post_delete.connect(_on_final_trip_delete, name="rollups_final_trip_delete", sender=FinalTrip)
+
+
+def record_payment(final_trip_id):
+    """Mark a trip paid and count it in the rollups; False if it already was.
+
+    The conditional UPDATE makes a repeated or concurrent checkout count
+    once. Call inside the caller's transaction so the flag and the rollups
+    commit together.
+    """
+    paid_at = datetime.utcnow()
+    updated = (FinalTrip
+               .update(paid_at=paid_at)
+               .where((FinalTrip.f_trip_id == final_trip_id) & FinalTrip.paid_at.is_null())
+               .execute())
+    if not updated:
+        return False
+    trip = FinalTrip.get(FinalTrip.f_trip_id == final_trip_id)
+    _apply(trip, {"paid_bookings": 1, "paid_revenue": float(trip.totalbudget)})
+    return True
+
+
+# --- Full recompute ---
+
+def _buckets():
+    """SQL expressions for the month and the week of FinalTrip.startDate"""
+    if isinstance(db, PooledSqliteDatabase):
+        return (fn.strftime('%Y-%m-01', FinalTrip.startDate),
+                # Step back to the Monday on or before the date
+                fn.date(FinalTrip.startDate, '-6 days', 'weekday 1'))
+    return (fn.date_trunc('month', FinalTrip.startDate).cast('date'),
+            fn.date_trunc('week', FinalTrip.startDate).cast('date'))
+
+
+def _measures():
+    paid = FinalTrip.paid_at.is_null(False)
+    return [fn.COUNT(FinalTrip.f_trip_id),
+            fn.SUM(FinalTrip.totalbudget),
+            fn.SUM(Case(None, [(paid, 1)], 0)),
+            fn.SUM(Case(None, [(paid, FinalTrip.totalbudget)], 0))]
+
+
+def _measure_dict(values):
+    count, revenue, paid_count, paid_revenue = values
+    return {"bookings": count or 0, "booked_revenue": float(revenue or 0),
+            "paid_bookings": int(paid_count or 0), "paid_revenue": float(paid_revenue or 0)}
+
+
+def compute(since=None):
+    """Aggregate final_trips from scratch: ({(dest_id, month): measures}, {(country, week): measures})
+
+    With `since`, only buckets starting on or after it (earlier ones may
+    have rows archived).
+    """
+    month, week = _buckets()
+    monthly = {}
+    query = (FinalTrip
+             .select(FinalTrip.destination, month, *_measures())
+             .group_by(FinalTrip.destination, month))
+    if since:
+        query = query.where(FinalTrip.startDate >= since)
+    for dest_id, bucket, *values in query.tuples():
+        monthly[(dest_id, _as_date(bucket))] = _measure_dict(values)
+    weekly = {}
+    query = (FinalTrip
+             .select(Destination.country, week, *_measures())
+             .join(Destination)
+             .group_by(Destination.country, week))
+    if since:
+        query = query.where(FinalTrip.startDate >= since)
+    for country, bucket, *values in query.tuples():
+        bucket = _as_date(bucket)
+        # The week across the watermark is partly archived
+        if not since or bucket >= since:
+            weekly[(country, bucket)] = _measure_dict(values)
+    return monthly, weekly
+
+
+def _replace(model, key_names, aggregates, since=None):
+    query = model.delete()
+    if since:
+        query = query.where(getattr(model, key_names[1]) >= since)
+    query.execute()
+    rows = [dict(zip(key_names, key), **measures) for key, measures in aggregates.items()]
+    for batch in chunked(rows, 500):
+        model.insert_many(batch).execute()
+
+
+def rebuild():
+    """Compaction: recompute both rollups and swap them in atomically"""
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        with write_transaction():
+            if not isinstance(db, PooledSqliteDatabase):
+                # Bookings committing during the rebuild wait on this lock and
+                # apply their increment afterwards; committed ones are in the scan.
+                db.execute_sql('LOCK TABLE destination_month_rollup, country_week_rollup '
+                               'IN EXCLUSIVE MODE')
+            since = partitions.frozen_before("final_trips")
+            monthly, weekly = compute(since)
+            _replace(DestinationMonthRollup, ("destination", "month"), monthly, since)
+            _replace(CountryWeekRollup, ("country", "week"), weekly, since)
+        print(f"📊 Rebuilt rollups: {len(monthly)} destination-months, {len(weekly)} country-weeks")
+        return len(monthly), len(weekly)
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+
+def check():
+    """Compare stored rollups with a fresh aggregate; returns the mismatches"""
+    connection_was_open = not db.is_closed()
+    if not connection_was_open:
+        db.connect()
+    try:
+        with db.atomic():
+            if not isinstance(db, PooledSqliteDatabase):
+                # Both reads must see the same snapshot (SQLite's WAL read
+                # transactions already do)
+                db.execute_sql('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            since = partitions.frozen_before("final_trips")
+            monthly, weekly = compute(since)
+            months, weeks = DestinationMonthRollup.select(), CountryWeekRollup.select()
+            if since:
+                months = months.where(DestinationMonthRollup.month >= since)
+                weeks = weeks.where(CountryWeekRollup.week >= since)
+            stored = {
+                DestinationMonthRollup: {(row.destination_id, _as_date(row.month)): row for row in months},
+                CountryWeekRollup: {(row.country, _as_date(row.week)): row for row in weeks},
+            }
+    finally:
+        if not connection_was_open and not db.is_closed():
+            db.close()
+
+    empty = dict.fromkeys(MEASURES, 0)
+    mismatches = []
+    for model, expected in ((DestinationMonthRollup, monthly), (CountryWeekRollup, weekly)):
+        rows = stored[model]
+        for key in expected.keys() | rows.keys():
+            want = expected.get(key, empty)
+            have = {name: getattr(rows[key], name) for name in MEASURES} if key in rows else empty
+            if any(abs(want[name] - have[name]) > TOLERANCE for name in MEASURES):
+                mismatches.append({"table": model._meta.table_name,
+                                   "key": [str(part) for part in key],
+                                   "expected": want, "stored": have})
+    return mismatches
+
+
+# --- Reads (single index range scans on the rollup keys) ---
+
+def _shape(row, bucket):
+    return {
+        bucket: str(getattr(row, bucket)),
+        "bookings": row.bookings,
+        "booked_revenue": round(row.booked_revenue, 2),
+        "paid_bookings": row.paid_bookings,
+        "paid_revenue": round(row.paid_revenue, 2),
+    }
+
+
+def destination_monthly(dest_id, start=None, end=None):
+    """Monthly rows for one destination, months in [start, end]"""
+    query = DestinationMonthRollup.select().where(DestinationMonthRollup.destination == dest_id)
+    if start:
+        query = query.where(DestinationMonthRollup.month >= month_of(_as_date(start)))
+    if end:
+        query = query.where(DestinationMonthRollup.month <= month_of(_as_date(end)))
+    return [_shape(row, "month") for row in query.order_by(DestinationMonthRollup.month)]
+
+
+def country_weekly(country, start=None, end=None):
+    """Weekly rows for one country, weeks in [start, end]"""
+    query = CountryWeekRollup.select().where(CountryWeekRollup.country == country)
+    if start:
+        query = query.where(CountryWeekRollup.week >= week_of(_as_date(start)))
+    if end:
+        query = query.where(CountryWeekRollup.week <= week_of(_as_date(end)))
+    return [_shape(row, "week") for row in query.order_by(CountryWeekRollup.week)]
+
+
+def top_destinations(month, limit=10, by="booked_revenue"):
+    """Best destinations of one month by a measure"""
+    measure = getattr(DestinationMonthRollup, by)
+    query = (DestinationMonthRollup
+             .select(DestinationMonthRollup, Destination.dest_id, Destination.city, Destination.country)
+             .join(Destination)
+             .where(DestinationMonthRollup.month == month_of(_as_date(month)))
+             .order_by(measure.desc())
+             .limit(limit))
+    return [dict(_shape(row, "month"), destination_id=row.destination_id,
+                 destination=f"{row.destination.city}, {row.destination.country}")
+            for row in query]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "rebuild":
+        rebuild()
+    elif command == "check":
+        problems = check()
+        for problem in problems:
+            print(f"❌ {problem['table']} {problem['key']}: expected {problem['expected']}, "
+                  f"stored {problem['stored']}")
+        print("✅ Rollups are consistent" if not problems else f"❌ {len(problems)} inconsistent rows")
+        sys.exit(1 if problems else 0)
+    else:
+        print("usage: python rollups.py [rebuild|check]")
+        sys.exit(2)
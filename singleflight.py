@@ -0,0 +1,123 @@
+# singleflight.py - Share one in-flight computation between identical concurrent calls
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from database.deadlines import Deadline, DeadlineExceeded, current_deadline
+
+
+def _copy(deadline):
+    """A Deadline for the group that can be pushed back without touching the caller's"""
+    if deadline is None:
+        return None
+    group = Deadline(deadline.seconds)
+    group.expires_at = deadline.expires_at
+    return group
+
+
+def _deadline_hit():
+    # The group's deadline is past, so every caller's is too; let each
+    # request report its own 504
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.hit = True
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that have the same key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for the leader's result instead of
+    repeating the work. Nothing is cached: once the leader finishes, the
+    next call computes afresh. Every caller gets the same result object,
+    so callers must not mutate it.
+
+    The leader runs under the request deadline of whichever caller in the
+    group has the latest one, extended as followers join.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._waiters = {}  # key -> callers waiting on the leader
+        self._deadlines = {}  # key -> Deadline the leader runs under, or None
+
+    def _join(self, key):
+        """(future, is_leader) for key"""
+        deadline = current_deadline.get()
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                # A cancelled waiter (see do_async) must not cancel it for everyone
+                future.set_running_or_notify_cancel()
+                self._waiters[key] = 0
+                self._deadlines[key] = _copy(deadline)
+                self.leaders += 1
+                return future, True
+            group = self._deadlines[key]
+            if group is not None and deadline is not None:
+                group.expires_at = max(group.expires_at, deadline.expires_at)
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+            return future, False
+
+    def _run(self, key, future, fn, args, kwargs):
+        deadline_token = current_deadline.set(self._deadlines[key])
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            current_deadline.reset(deadline_token)
+            with self._lock:
+                del self._calls[key]
+                del self._waiters[key]
+                del self._deadlines[key]
+            if not future.done():
+                # The leader was cancelled or is exiting: followers must not wait forever
+                future.set_exception(RuntimeError(f"{self.name}: leader stopped without a result"))
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once per concurrent key, from a thread"""
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn, args, kwargs)
+        try:
+            return future.result()
+        except DeadlineExceeded:
+            _deadline_hit()
+            raise
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Same as do() for async callers. The blocking fn runs in the default
+        executor and every caller, the leader included, awaits it without
+        holding a thread; a caller that is cancelled leaves the rest waiting."""
+        future, leader = self._join(key)
+        if leader:
+            # run_in_executor doesn't carry contextvars over by itself
+            asyncio.get_running_loop().run_in_executor(
+                None, contextvars.copy_context().run, self._run, key, future, fn, args, kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except DeadlineExceeded:
+            _deadline_hit()
+            raise
+
+    def stats(self):
+        total = self.leaders + self.coalesced
+        return {
+            "calls": total,
+            "executed": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 3) if total else 0.0,
+            "in_flight": len(self._calls),
+            "max_waiters": self.max_waiters,
+        }
@@ -0,0 +1,183 @@
+# spatial_index.py - In-memory nearest-destination index
+import bisect
+import math
+import threading
+from database.database import Destination
+from cache_bus import bus
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class DestinationIndex:
+    """Fixed-size lat/lon grid over destinations.
+
+    Points are bucketed into `cell_deg` x `cell_deg` cells. A query walks
+    rings of cells outward from the query cell and stops as soon as no
+    unvisited cell can hold anything closer than what was already found,
+    so lookups only touch the neighbourhood of the query point. When the
+    points are too sparse for that to pay off, it scans them all instead.
+    """
+
+    def __init__(self, cell_deg=0.5):
+        self.cell_deg = cell_deg
+        self.lat_cells = int(math.ceil(180 / cell_deg))
+        self.lon_cells = int(math.ceil(360 / cell_deg))
+        self._cells = {}    # (row, col) -> {dest_id: (lat, lon)}
+        self._points = {}   # dest_id -> (row, col)
+        self._max_id = 0
+        self._stale = set()  # dest_ids changed elsewhere, reloaded on refresh
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lon):
+        row = min(int((lat + 90) / self.cell_deg), self.lat_cells - 1)
+        col = int(((lon + 180) % 360) / self.cell_deg) % self.lon_cells
+        return row, col
+
+    # --- Maintenance ---
+
+    def upsert(self, dest_id, lat, lon):
+        """Add a destination or move it to new coordinates"""
+        with self._lock:
+            self.remove(dest_id)
+            if lat is None or lon is None:
+                return
+            cell = self._cell(lat, lon)
+            self._cells.setdefault(cell, {})[dest_id] = (lat, lon)
+            self._points[dest_id] = cell
+            self._max_id = max(self._max_id, dest_id)
+
+    def remove(self, dest_id):
+        """Drop a destination from the index if present"""
+        with self._lock:
+            cell = self._points.pop(dest_id, None)
+            if cell is not None:
+                bucket = self._cells[cell]
+                bucket.pop(dest_id, None)
+                if not bucket:
+                    del self._cells[cell]
+
+    def invalidate(self, dest_id=None):
+        """Mark one destination (None: all of them) for reloading on the next refresh"""
+        with self._lock:
+            if dest_id is None:
+                self._max_id = 0
+                self._stale.clear()
+            elif dest_id <= self._max_id:
+                self._stale.add(dest_id)
+
+    def refresh(self):
+        """Pull destinations added since the last refresh, and reload invalidated ones"""
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        if stale:
+            moved = dict((dest_id, (lat, lon)) for dest_id, lat, lon in
+                         Destination
+                         .select(Destination.dest_id, Destination.latitude, Destination.longitude)
+                         .where(Destination.dest_id.in_(list(stale)))
+                         .tuples())
+            with self._lock:
+                for dest_id in stale:
+                    # Deleted rows and rows that lost their coordinates drop out
+                    self.upsert(dest_id, *moved.get(dest_id, (None, None)))
+        rows = (Destination
+                .select(Destination.dest_id, Destination.latitude, Destination.longitude)
+                .where((Destination.dest_id > self._max_id) &
+                       Destination.latitude.is_null(False) &
+                       Destination.longitude.is_null(False))
+                .tuples())
+        with self._lock:
+            for dest_id, lat, lon in rows:
+                self.upsert(dest_id, lat, lon)
+
+    def rebuild(self):
+        """Drop everything and reload from the database"""
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+            self._max_id = 0
+            self.refresh()
+
+    # --- Queries ---
+
+    def nearest(self, lat, lon, k=10, radius_km=None):
+        """Return up to k (dest_id, distance_km) pairs, closest first"""
+        if k <= 0:
+            return []
+        row0, col0 = self._cell(lat, lon)
+        found = []  # sorted list of (distance, dest_id), at most k long
+        with self._lock:
+            if not self._points:
+                return []
+            visited = 0
+            # Columns wrap around, so lon_cells // 2 rings reach the far
+            # side; the last rings only add the rows towards the poles
+            for ring in range(max(self.lat_cells, self.lon_cells // 2 + 1)):
+                # Anything outside the rings already scanned is at least
+                # `ring - 1` whole cells away (lon cells shrink towards the poles)
+                if ring:
+                    edge_lat = min(90.0, abs(lat) + ring * self.cell_deg)
+                    min_gap = (ring - 1) * self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+                    if radius_km is not None and min_gap > radius_km:
+                        break
+                    if len(found) == k and min_gap > found[-1][0]:
+                        break
+                for cell in self._ring_cells(row0, col0, ring):
+                    visited += 1
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        self._offer(found, k, lat, lon, radius_km, bucket)
+                if visited > len(self._points):
+                    # Sparse data: looking at every point is cheaper than more empty cells
+                    found = []
+                    for bucket in self._cells.values():
+                        self._offer(found, k, lat, lon, radius_km, bucket)
+                    break
+        return [(dest_id, round(d, 3)) for d, dest_id in found]
+
+    @staticmethod
+    def _offer(found, k, lat, lon, radius_km, bucket):
+        """Keep the bucket's points that belong in the k closest to (lat, lon)"""
+        for dest_id, (plat, plon) in bucket.items():
+            d = haversine_km(lat, lon, plat, plon)
+            if radius_km is not None and d > radius_km:
+                continue
+            if len(found) < k:
+                bisect.insort(found, (d, dest_id))
+            elif d < found[-1][0]:
+                found.pop()
+                bisect.insort(found, (d, dest_id))
+
+    def _ring_cells(self, row0, col0, ring):
+        """Cells exactly `ring` cells away from (row0, col0), columns counted around the globe"""
+        if ring == 0:
+            yield row0, col0
+            return
+        half = self.lon_cells // 2
+        # Columns `ring` away on either side, once each, and every column up to `ring` away
+        edge = sorted({(col0 - ring) % self.lon_cells, (col0 + ring) % self.lon_cells}) if ring <= half else []
+        within = ([(col0 + dc) % self.lon_cells for dc in range(-ring, ring + 1)] if 2 * ring < self.lon_cells
+                  else range(self.lon_cells))
+        for dr in range(-ring, ring + 1):
+            row = row0 + dr
+            if row < 0 or row >= self.lat_cells:
+                continue
+            for col in (within if abs(dr) == ring else edge):
+                yield row, col
+
+
+# Shared per-process index, filled lazily by planning.nearby_destinations
+destination_index = DestinationIndex()
+bus.subscribe("destinations", lambda event: destination_index.invalidate(event.key))
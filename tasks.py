@@ -0,0 +1,91 @@
+# tasks.py - Job handlers for work moved off the request path
+import jobs
+from jobs import handler, PermanentFailure
+import booking
+import payment
+import rollups
+import catalog_snapshot
+import planning
+import events
+import itinerary
+import archive
+from database import partitions
+from database.database import User, FilteredSuggestion, FinalTrip
+import inventory
+from ranking import CATEGORIES
+
+
+@handler("finalize_trip")
+def finalize_trip(user_id, filtered_suggestion_id):
+    """Background version of booking.finalizeTrip; running it twice books once.
+
+    Only missing rows and full hotels fail for good; anything else (lost
+    connection, lock timeout) raises and is retried.
+    """
+    try:
+        ftrip, created = booking.book(user_id, filtered_suggestion_id)
+    except (User.DoesNotExist, FilteredSuggestion.DoesNotExist, inventory.NoAvailability) as e:
+        events.publish(user_id, "booking.failed", filtered_suggestion_id=filtered_suggestion_id)
+        raise PermanentFailure(f"Could not finalize trip: {type(e).__name__}")
+    if created:
+        jobs.enqueue("send_confirmation", {"kind": "booking", "final_trip_id": ftrip.f_trip_id})
+        events.publish(user_id, "booking.finalized", filtered_suggestion_id=filtered_suggestion_id,
+                       final_trip_id=ftrip.f_trip_id, total_budget=float(ftrip.totalbudget))
+    return {"trip_id": ftrip.f_trip_id, "total_budget": float(ftrip.totalbudget)}
+
+
+@handler("checkout")
+def checkout(final_trip_id):
+    """Background version of payment.checkout; paying twice settles once"""
+    try:
+        trip, newly_paid = payment.settle(final_trip_id)
+    except FinalTrip.DoesNotExist:
+        raise PermanentFailure(f"FinalTrip {final_trip_id} not found")
+    if newly_paid:
+        jobs.enqueue("send_confirmation", {"kind": "payment", "final_trip_id": final_trip_id})
+        events.publish(trip.user_id_id, "payment.settled", final_trip_id=final_trip_id,
+                       amount=float(trip.totalbudget))
+    return {"final_trip_id": final_trip_id, "paid": True}
+
+
+@handler("send_confirmation")
+def send_confirmation(kind, final_trip_id):
+    """Placeholder notification; swap in email/SMS delivery here"""
+    print(f"📧 Sent {kind} confirmation for trip {final_trip_id}")
+    return {"sent": True}
+
+
+@handler("compact_rollups")
+def compact_rollups(interval_seconds=None):
+    """Rebuild the booking rollups; with interval_seconds, the worker runs it again after that"""
+    months, weeks = rollups.rebuild()
+    return {"destination_months": months, "country_weeks": weeks}
+
+
+@handler("rebuild_catalog_snapshot")
+def rebuild_catalog_snapshot(path, interval_seconds=None):
+    """Write a fresh catalog snapshot for the API workers to map; periodic with interval_seconds"""
+    header = catalog_snapshot.build(path, planning.simulated_attributes, CATEGORIES)
+    return {"version": header["version"], "destinations": header["count"]}
+
+
+@handler("build_itineraries")
+def build_itineraries(final_trip_ids=None, workers=None):
+    """Solve the day-by-day plans of all trips (or the given ones) that are missing or stale.
+
+    Safe to run again after a timeout: plans already up to date are skipped.
+    """
+    return itinerary.build_batch(final_trip_ids, workers)
+
+
+@handler("archive_partitions")
+def archive_partitions(interval_seconds=None):
+    """Prepare coming partitions and move old months out; periodic with interval_seconds.
+
+    Safe to run again after a timeout: a month is only dropped once its
+    file holds every row.
+    """
+    created = partitions.ensure_partitions()
+    rolled = partitions.roll()
+    archived = archive.archive_old()
+    return {"partitions_created": created, "rolled": rolled, "archived": archived}
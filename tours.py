@@ -0,0 +1,346 @@
+# tours.py - Multi-city trips: the order to visit several destinations in
+#
+# A tour starts from the traveller's home city (or wherever is best),
+# visits every chosen destination once and, for a round trip, comes back.
+# Each leg is weighted by its money cost plus VALUE_OF_HOUR per hour of
+# travel, both from the cheapest Transport row between the two cities; a
+# pair with no Transport row is estimated from the great-circle distance.
+#
+# Up to EXACT_LIMIT stops the order is exact (Held-Karp dynamic programming
+# over subsets, vectorised across the last stop with NumPy). Past that, or
+# once the time limit is up, a nearest-neighbour route is improved with
+# 2-opt and or-opt moves until none helps or time runs out. Solved orders
+# are cached by destination set until a destination or Transport row
+# changes.
+import time
+from datetime import timedelta
+import numpy as np
+from database.database import connected, write_transaction, Destination, Transport, Trip, TripStop, User
+from database.deadlines import current_deadline
+from spatial_index import haversine_km
+from cache_bus import TableCache
+import planning
+
+MIN_STOPS = 2
+MAX_STOPS = 50
+EXACT_LIMIT = 12           # stops solved exactly; 2^12 subsets
+DEFAULT_TIME_LIMIT = 1.0   # seconds per solve
+VALUE_OF_HOUR = 25.0       # dollars a traveller would pay to save an hour
+ESTIMATED_BASE_FARE = 30.0  # legs with no Transport row
+ESTIMATED_FARE_PER_KM = 0.12
+ESTIMATED_KMH = 500.0
+ESTIMATED_OVERHEAD_HOURS = 2.0
+UNREACHABLE_FARE = 1000.0   # and no coordinates either
+UNREACHABLE_HOURS = 24.0
+
+orders = TableCache(["destinations", "transport"], key_of=lambda event: None, max_size=5000)
+
+
+# --- Solver (weights in, order out) ---
+#
+# Node 0 is the fixed start. A terminal node is appended to the weight
+# matrix: a copy of the start for round trips, or a free end (every edge
+# into it weighs 0) for one-way tours, so both are "a path from node 0 to
+# the terminal through every other node".
+
+def _with_terminal(weights, round_trip):
+    n = len(weights)
+    extended = np.zeros((n + 1, n + 1))
+    extended[:n, :n] = weights
+    if round_trip:
+        extended[:n, n] = weights[:, 0]
+    return extended
+
+
+def path_weight(extended, path):
+    path = np.asarray(path)
+    return float(extended[path[:-1], path[1:]].sum())
+
+
+def held_karp(extended, expires_at=None):
+    """Cheapest path 0 -> every node -> terminal, or None if time ran out"""
+    n = len(extended) - 1
+    k = n - 1  # nodes 1..n-1, bit j is node j + 1
+    if k == 0:
+        return [0, n]
+    inner = extended[1:n, 1:n].copy()
+    np.fill_diagonal(inner, np.inf)
+    full = (1 << k) - 1
+    cost = np.full((full + 1, k), np.inf)
+    parent = np.full((full + 1, k), -1, dtype=np.int16)
+    bits = 1 << np.arange(k)
+    cost[bits, np.arange(k)] = extended[0, 1:n]
+    for mask in range(1, full):
+        if expires_at is not None and not mask & 0xFF and time.monotonic() > expires_at:
+            return None
+        row = cost[mask]
+        # Best way to reach each next node j from this subset, over its last node i
+        through = row[:, None] + inner
+        best_last = through.argmin(axis=0)
+        best = through[best_last, np.arange(k)]
+        free = np.flatnonzero((mask & bits) == 0)
+        # Each (mask | j, j) is reached from exactly one mask, so no min() needed
+        cost[mask | bits[free], free] = best[free]
+        parent[mask | bits[free], free] = best_last[free]
+    last = int(np.argmin(cost[full] + extended[1:n, n]))
+    path, mask = [], full
+    while last >= 0:
+        path.append(last + 1)
+        last, mask = int(parent[mask, last]), mask & ~(1 << last)
+    return [0] + path[::-1] + [n]
+
+
+def nearest_neighbour(extended):
+    n = len(extended) - 1
+    path, left = [0], set(range(1, n))
+    while left:
+        here = path[-1]
+        step = min(left, key=lambda j: extended[here, j])
+        path.append(step)
+        left.remove(step)
+    return path + [n]
+
+
+def _two_opt(extended, path):
+    """Reverse the best-improving interior segment; True if one was found"""
+    p = np.asarray(path)
+    forward = np.concatenate(([0.0], np.cumsum(extended[p[:-1], p[1:]])))
+    backward = np.concatenate(([0.0], np.cumsum(extended[p[1:], p[:-1]])))
+    m = len(p)
+    i = np.arange(1, m - 2)[:, None]   # segment p[i..j], both interior
+    j = np.arange(2, m - 1)[None, :]
+    valid = j > i
+    if not valid.any():
+        return False
+    i, j = np.broadcast_arrays(i, j)
+    before = (extended[p[i - 1], p[i]] + forward[j] - forward[i] + extended[p[j], p[j + 1]])
+    after = (extended[p[i - 1], p[j]] + backward[j] - backward[i] + extended[p[i], p[j + 1]])
+    gain = np.where(valid, before - after, 0.0)
+    best = np.unravel_index(np.argmax(gain), gain.shape)
+    if gain[best] <= 1e-9:
+        return False
+    a, b = int(i[best]), int(j[best])
+    path[a:b + 1] = path[a:b + 1][::-1]
+    return True
+
+
+def _or_opt(extended, path):
+    """Move one run of 1-3 stops (kept in order) to where it saves most; True if it did"""
+    m = len(path)
+    best_gain, best_move = 1e-9, None
+    for length in (1, 2, 3):
+        for i in range(1, m - length):
+            first, last = path[i], path[i + length - 1]
+            prev, nxt = path[i - 1], path[i + length]
+            removed = extended[prev, first] + extended[last, nxt] - extended[prev, nxt]
+            for k in range(m - 1):
+                if i - 1 <= k < i + length:
+                    continue
+                a, b = path[k], path[k + 1]
+                gain = removed - (extended[a, first] + extended[last, b] - extended[a, b])
+                if gain > best_gain:
+                    best_gain, best_move = gain, (i, length, k)
+    if best_move is None:
+        return False
+    i, length, k = best_move
+    run = path[i:i + length]
+    rest = path[:i] + path[i + length:]
+    at = k + 1 if k < i else k + 1 - length
+    path[:] = rest[:at] + run + rest[at:]
+    return True
+
+
+def improve(extended, path, expires_at=None):
+    """2-opt and or-opt until neither helps or time runs out"""
+    while expires_at is None or time.monotonic() < expires_at:
+        if not _two_opt(extended, path) and not _or_opt(extended, path):
+            break
+    return path
+
+
+def solve_order(weights, round_trip=True, time_limit=DEFAULT_TIME_LIMIT):
+    """(order of nodes starting with 0, method) for a square weight matrix"""
+    extended = _with_terminal(np.asarray(weights, dtype=float), round_trip)
+    expires_at = time.monotonic() + time_limit if time_limit is not None else None
+    path = None
+    if len(weights) - 1 <= EXACT_LIMIT:
+        path = held_karp(extended, expires_at)
+        method = "exact"
+    if path is None:
+        path = improve(extended, nearest_neighbour(extended), expires_at)
+        method = "heuristic"
+    return path[:-1], method
+
+
+# --- Legs between cities ---
+
+def _hours(value):
+    if value is None:
+        return None
+    return value.hour + value.minute / 60 + value.second / 3600
+
+
+def _legs(places):
+    """weights and leg details between every pair of (city, country, lat, lon)"""
+    n = len(places)
+    cities = {place[0] for place in places}
+    index = {(city, country): i for i, (city, country, _, _) in enumerate(places)}
+    cheapest = {}
+    for transport_id, origin, origin_country, dest, dest_country, cost, duration in (
+            Transport
+            .select(Transport.transport_id, Transport.originCity, Transport.originCountry,
+                    Transport.destCity, Transport.destCountry, Transport.cost, Transport.time)
+            .where(Transport.originCity.in_(list(cities)) & Transport.destCity.in_(list(cities)))
+            .tuples()):
+        a, b = index.get((origin, origin_country)), index.get((dest, dest_country))
+        if a is None or b is None or a == b:
+            continue
+        if (a, b) not in cheapest or cost < cheapest[a, b]["cost"]:
+            cheapest[a, b] = {"transport_id": transport_id, "cost": float(cost),
+                              "hours": _hours(duration) or 0.0, "estimated": False}
+    weights = np.zeros((n, n))
+    legs = {}
+    for a in range(n):
+        for b in range(n):
+            if a == b:
+                continue
+            leg = cheapest.get((a, b))
+            if leg is None:
+                (_, _, lat1, lon1), (_, _, lat2, lon2) = places[a], places[b]
+                if None in (lat1, lon1, lat2, lon2):
+                    leg = {"transport_id": None, "cost": UNREACHABLE_FARE,
+                           "hours": UNREACHABLE_HOURS, "estimated": True}
+                else:
+                    km = haversine_km(lat1, lon1, lat2, lon2)
+                    leg = {"transport_id": None,
+                           "cost": round(ESTIMATED_BASE_FARE + ESTIMATED_FARE_PER_KM * km, 2),
+                           "hours": round(ESTIMATED_OVERHEAD_HOURS + km / ESTIMATED_KMH, 2),
+                           "estimated": True}
+            legs[a, b] = leg
+            weights[a, b] = leg["cost"] + VALUE_OF_HOUR * leg["hours"]
+    return weights, legs
+
+
+def _home(user_id):
+    """(city, country, lat, lon) of the user's home city, or None"""
+    user = User.get_or_none(User.user_id == user_id) if user_id else None
+    if user is None:
+        return None
+    match = (Destination
+             .select(Destination.latitude, Destination.longitude)
+             .where((Destination.city == user.city) & (Destination.country == user.country))
+             .first())
+    return (user.city, user.country, match.latitude if match else None, match.longitude if match else None)
+
+
+def _time_limit(requested):
+    """requested seconds, capped by what is left of the request deadline"""
+    deadline = current_deadline.get()
+    if deadline is not None:
+        return max(0.05, min(requested, deadline.remaining() / 2))
+    return requested
+
+
+def _solve(dest_ids, home, round_trip, time_limit):
+    destinations = {d.dest_id: d for d in Destination.select().where(Destination.dest_id.in_(dest_ids))}
+    missing = [dest_id for dest_id in dest_ids if dest_id not in destinations]
+    if missing:
+        return {"error": f"Destinations not found: {', '.join(map(str, missing))}"}
+    # Sorted, so the same set gives the same order whatever order it came in
+    stops = sorted(dest_ids)
+    places = [(destinations[d].city, destinations[d].country, destinations[d].latitude,
+               destinations[d].longitude) for d in stops]
+    started = time.perf_counter()
+    weights, legs = _legs(([home] if home else []) + places)
+    free_start = home is None and not round_trip
+    if free_start:
+        # One way from anywhere: a node 0 whose edges weigh nothing
+        padded = np.zeros((len(stops) + 1, len(stops) + 1))
+        padded[1:, 1:] = weights
+        weights = padded
+    order, method = solve_order(weights, round_trip, time_limit)
+    if free_start:
+        order = [i - 1 for i in order[1:]]  # back to indexes into places
+    labels = (["home"] if home is not None else []) + stops
+    visits = [labels[i] for i in order if labels[i] != "home"]
+    if round_trip:
+        order = order + order[:1]
+    route = [{"from": labels[a], "to": labels[b], **legs[a, b]} for a, b in zip(order, order[1:])]
+    return {
+        "order": visits,
+        "legs": route,
+        "round_trip": round_trip,
+        "total_cost": round(sum(leg["cost"] for leg in route), 2),
+        "total_hours": round(sum(leg["hours"] for leg in route), 2),
+        "method": method,
+        "solve_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+@connected
+def plan_tour(dest_ids, user_id=None, round_trip=True, time_limit=DEFAULT_TIME_LIMIT):
+    """Best order to visit dest_ids, from the user's home city if given"""
+    dest_ids = list(dict.fromkeys(dest_ids))
+    if not MIN_STOPS <= len(dest_ids) <= MAX_STOPS:
+        return {"error": f"A tour has {MIN_STOPS} to {MAX_STOPS} destinations."}
+    home = _home(user_id)
+    key = (frozenset(dest_ids), home[:2] if home else None, round_trip)
+    # A heuristic order for a set small enough to solve exactly means the
+    # deadline cut the solver short; the next request may do better
+    return orders.get(key, lambda: _solve(dest_ids, home, round_trip, _time_limit(time_limit)),
+                      keep=lambda tour: tour.get("method") != "heuristic" or len(dest_ids) > EXACT_LIMIT)
+
+
+@connected
+def create_tour(user_id: int, max_budget: float, start_date, end_date, dest_ids, round_trip=True):
+    """Creates a multi-city Trip visiting dest_ids in the best order, nights split evenly"""
+    try:
+        start, end = planning._as_date(start_date), planning._as_date(end_date)
+    except ValueError:
+        return {"error": "Dates must be in YYYY-MM-DD format."}
+    dest_ids = list(dict.fromkeys(dest_ids))
+    nights = (end - start).days
+    if nights < len(dest_ids):
+        return {"error": f"{len(dest_ids)} destinations need at least {len(dest_ids)} nights."}
+    tour = plan_tour(dest_ids, user_id, round_trip)
+    if "error" in tour:
+        return tour
+
+    destinations = {d.dest_id: d for d in Destination.select().where(Destination.dest_id.in_(dest_ids))}
+    # The closing leg of a round trip goes back to the start, it is not how we get there
+    outbound = tour["legs"][:-1] if tour["round_trip"] else tour["legs"]
+    legs_in = {leg["to"]: leg for leg in outbound}
+    share, extra = divmod(nights, len(dest_ids))
+    stops, arrive = [], start
+    # Check and insert together, or two requests could both pass the check
+    with write_transaction():
+        planning.lock_user(user_id)
+        conflicts = planning.find_trip_conflicts(user_id, start, end)
+        if conflicts:
+            return {"error": "You already have a trip during these dates.", "conflicts": conflicts}
+        trip = Trip.create(maxBudget=max_budget, destination=tour["order"][0],
+                           startDate=start, endDate=end, user_id=user_id)
+        for position, dest_id in enumerate(tour["order"]):
+            stay = share + (1 if position < extra else 0)
+            leg = legs_in.get(dest_id, {})
+            TripStop.create(trip=trip, position=position, destination=dest_id, arriveDate=arrive,
+                            nights=stay, transport=leg.get("transport_id"), leg_cost=leg.get("cost", 0))
+            stops.append({
+                "position": position,
+                "dest_id": dest_id,
+                "city": destinations[dest_id].city,
+                "country": destinations[dest_id].country,
+                "arriveDate": str(arrive),
+                "departDate": str(arrive + timedelta(days=stay)),
+                "nights": stay,
+            })
+            arrive += timedelta(days=stay)
+    return {
+        "message": "Tour created successfully",
+        "trip_id": trip.trip_id,
+        "stops": stops,
+        "legs": tour["legs"],
+        "total_cost": tour["total_cost"],
+        "total_hours": tour["total_hours"],
+        "method": tour["method"],
+    }
@@ -14,7 +14,8 @@ const api = {
     });
     if (!response.ok) {
       const error = await response.json();
-      throw new Error(error.detail || 'API request failed');
+      const detail = typeof error.detail === 'string' ? error.detail : error.detail?.message;
+      throw new Error(detail || 'API request failed');
     }
     return response.json();
   },
@@ -24,17 +25,104 @@ const api = {
     if (token) headers['Authorization'] = `Bearer ${token}`;
     
     const response = await fetch(`${API_BASE_URL}${endpoint}`, { headers });
-    if (!response.ok) throw new Error('API request failed');
+    if (!response.ok) {
+      const error = new Error('API request failed');
+      error.status = response.status;
+      throw error;
+    }
     return response.json();
   }
 };
 
+// Server-sent events read with fetch(), since EventSource can't send the
+// bearer token. Reconnects after the server's `retry` delay and resumes from
+// the last event id; gives up on 401/403. Returns a function that stops it.
+function followEvents(endpoint, token, onEvent) {
+  const controller = new AbortController();
+  let lastEventId = null;
+  let retry = 3000;
+
+  const dispatch = (block) => {
+    let kind = 'message';
+    const data = [];
+    block.split(/\r?\n/).forEach((line) => {
+      const colon = line.indexOf(':');
+      if (colon === 0) return; // comment
+      const field = colon < 0 ? line : line.slice(0, colon);
+      const value = colon < 0 ? '' : line.slice(colon + 1).replace(/^ /, '');
+      if (field === 'event') kind = value;
+      else if (field === 'data') data.push(value);
+      else if (field === 'id') lastEventId = value;
+      else if (field === 'retry' && /^\d+$/.test(value)) retry = Number(value);
+    });
+    if (data.length) onEvent(kind, data.join('\n'));
+  };
+
+  const run = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const headers = { Authorization: `Bearer ${token}` };
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+        const response = await fetch(`${API_BASE_URL}${endpoint}`, { headers, signal: controller.signal });
+        if (response.status === 401 || response.status === 403) return;
+        if (response.ok) {
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+          let buffer = '';
+          for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            const blocks = (buffer + value).split(/\r?\n\r?\n/);
+            buffer = blocks.pop();
+            blocks.forEach(dispatch);
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, retry));
+    }
+  };
+
+  run();
+  return () => controller.abort();
+}
+
+// Typeahead suggestions for a city or country input, fetched once typing pauses
+function useAutocomplete(query, kind) {
+  const [suggestions, setSuggestions] = useState([]);
+
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setSuggestions([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const result = await api.get(`/destinations/autocomplete?kind=${kind}&q=${encodeURIComponent(q)}`);
+        if (!cancelled) setSuggestions(result.suggestions);
+      } catch (error) {
+        if (!cancelled) setSuggestions([]);
+      }
+    }, 120);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [query, kind]);
+
+  return suggestions;
+}
+
 // Main App Component
 export default function TravelPlannerApp() {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(null);
   const [currentView, setCurrentView] = useState('auth');
   const [authMode, setAuthMode] = useState('login');
+  const [dashboard, setDashboard] = useState(null);
+  const [dashboardVersion, setDashboardVersion] = useState(0);
 
   useEffect(() => {
     const savedToken = localStorage.getItem('token');
@@ -46,7 +134,41 @@ export default function TravelPlannerApp() {
     }
   }, []);
 
+  // One round trip for everything the first screens show
+  useEffect(() => {
+    if (!token) return;
+    let cancelled = false;
+    api.get('/me/dashboard', token)
+      .then((result) => {
+        if (cancelled) return;
+        setDashboard(result);
+        if (performance.getEntriesByName('login').length) {
+          const tti = performance.measure('time-to-interactive', 'login');
+          console.info(`Time to interactive after login: ${Math.round(tti.duration)}ms`);
+          performance.clearMarks('login');
+        }
+      })
+      .catch((error) => {
+        if (cancelled) return;
+        if (error.status === 401) handleLogout();
+        else console.error('Error loading dashboard:', error);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [token, dashboardVersion]);
+
+  // Bookings and payments finish in the background; reload when one does.
+  useEffect(() => {
+    if (!user || !token) return;
+    const reloadOn = new Set(['booking.finalized', 'booking.failed', 'payment.settled', 'payment.failed', 'resync']);
+    return followEvents(`/events/${user.user_id}`, token, (kind) => {
+      if (reloadOn.has(kind)) setDashboardVersion((v) => v + 1);
+    });
+  }, [user?.user_id, token]);
+
   const handleLogin = async (credentials) => {
+    performance.mark('login');
     try {
       const result = await api.post('/auth/login', credentials);
       setToken(result.token);
@@ -61,6 +183,7 @@ export default function TravelPlannerApp() {
   };
 
   const handleSignup = async (credentials) => {
+    performance.mark('login');
     try {
       const result = await api.post('/auth/signup', credentials);
       setToken(result.token);
@@ -77,6 +200,7 @@ export default function TravelPlannerApp() {
   const handleLogout = () => {
     setUser(null);
     setToken(null);
+    setDashboard(null);
     localStorage.removeItem('token');
     localStorage.removeItem('user');
     setCurrentView('auth');
@@ -97,6 +221,7 @@ export default function TravelPlannerApp() {
     <MainApp 
       user={user} 
       token={token}
+      dashboard={dashboard}
       onLogout={handleLogout}
       currentView={currentView}
       setCurrentView={setCurrentView}
@@ -240,7 +365,7 @@ function AuthView({ mode, setMode, onLogin, onSignup }) {
 }
 
 // Main Application
-function MainApp({ user, token, onLogout, currentView, setCurrentView }) {
+function MainApp({ user, token, dashboard, onLogout, currentView, setCurrentView }) {
   return (
     <div className="min-h-screen bg-gray-50">
       <nav className="bg-white shadow-sm border-b">
@@ -286,15 +411,15 @@ function MainApp({ user, token, onLogout, currentView, setCurrentView }) {
       </nav>
 
       <div className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 py-8">
-        {currentView === 'main' && <PlanningView user={user} token={token} setCurrentView={setCurrentView} />}
-        {currentView === 'trips' && <TripsView user={user} token={token} />}
+        {currentView === 'main' && <PlanningView user={user} token={token} dashboard={dashboard} setCurrentView={setCurrentView} />}
+        {currentView === 'trips' && <TripsView user={user} token={token} dashboard={dashboard} />}
       </div>
     </div>
   );
 }
 
 // Planning View
-function PlanningView({ user, token, setCurrentView }) {
+function PlanningView({ user, token, dashboard, setCurrentView }) {
   const [step, setStep] = useState('trip-details');
   const [tripData, setTripData] = useState({
     maxBudget: '',
@@ -303,12 +428,35 @@ function PlanningView({ user, token, setCurrentView }) {
     destinationCity: '',
     destinationCountry: ''
   });
-  const [suggestions, setSuggestions] = useState([]);
+  const [suggestions, setSuggestions] = useState(dashboard?.suggestions || []);
   const [filteredDestinations, setFilteredDestinations] = useState([]);
   const [filters, setFilters] = useState({ budget: '', destination: '', category: '' });
   const [loading, setLoading] = useState(false);
   const [currentTrip, setCurrentTrip] = useState(null);
   const [bookedTrips, setBookedTrips] = useState([]);
+  // The dashboard may arrive after this view mounted
+  useEffect(() => {
+    if (dashboard && suggestions.length === 0) setSuggestions(dashboard.suggestions);
+  }, [dashboard]);
+
+  const continueTrip = (trip) => {
+    setCurrentTrip(trip.trip_id);
+    setTripData({ ...tripData, maxBudget: trip.maxBudget, startDate: trip.startDate, endDate: trip.endDate });
+    setStep('suggestions');
+  };
+
+  const citySuggestions = useAutocomplete(tripData.destinationCity, 'city');
+  const countrySuggestions = useAutocomplete(tripData.destinationCountry, 'country');
+
+  const handleCityChange = (value) => {
+    // Picking a suggestion also fills in its country when none was given
+    const picked = citySuggestions.find((s) => s.city === value);
+    setTripData({
+      ...tripData,
+      destinationCity: value,
+      destinationCountry: picked && !tripData.destinationCountry ? picked.country : tripData.destinationCountry
+    });
+  };
 
   const handleCreateTrip = async (e) => {
     e.preventDefault();
@@ -417,6 +565,26 @@ function PlanningView({ user, token, setCurrentView }) {
     return (
       <div className="max-w-2xl mx-auto">
         <h2 className="text-3xl font-bold text-gray-800 mb-6">Plan Your Trip</h2>
+        {dashboard?.pending_trips?.length > 0 && (
+          <div className="bg-white rounded-xl shadow-lg p-6 mb-6">
+            <h3 className="text-lg font-bold text-gray-800 mb-3">Continue Planning</h3>
+            <div className="space-y-2">
+              {dashboard.pending_trips.map((trip) => (
+                <button
+                  key={trip.trip_id}
+                  onClick={() => continueTrip(trip)}
+                  className="w-full flex justify-between items-center px-4 py-2 border border-gray-200 rounded-lg hover:bg-gray-50 transition"
+                >
+                  <span className="flex items-center gap-2 text-gray-800">
+                    <MapPin className="w-4 h-4" />
+                    {trip.destination}
+                  </span>
+                  <span className="text-sm text-gray-500">{trip.startDate} - {trip.endDate}</span>
+                </button>
+              ))}
+            </div>
+          </div>
+        )}
         <form onSubmit={handleCreateTrip} className="bg-white rounded-xl shadow-lg p-8 space-y-6">
           <div>
             <label className="block text-sm font-medium text-gray-700 mb-2">
@@ -467,10 +635,17 @@ function PlanningView({ user, token, setCurrentView }) {
             <input
               type="text"
               value={tripData.destinationCity}
-              onChange={(e) => setTripData({ ...tripData, destinationCity: e.target.value })}
+              onChange={(e) => handleCityChange(e.target.value)}
               className="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
               placeholder="e.g., Paris"
+              list="city-suggestions"
+              autoComplete="off"
             />
+            <datalist id="city-suggestions">
+              {citySuggestions.map((s) => (
+                <option key={s.dest_id} value={s.city}>{s.city}, {s.country}</option>
+              ))}
+            </datalist>
           </div>
           
           <div>
@@ -483,7 +658,14 @@ function PlanningView({ user, token, setCurrentView }) {
               onChange={(e) => setTripData({ ...tripData, destinationCountry: e.target.value })}
               className="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
               placeholder="e.g., France"
+              list="country-suggestions"
+              autoComplete="off"
             />
+            <datalist id="country-suggestions">
+              {countrySuggestions.map((s) => (
+                <option key={s.country} value={s.country} />
+              ))}
+            </datalist>
           </div>
           
           <button
@@ -649,9 +831,11 @@ function DestinationCard({ destination, showBooking, onBook }) {
 }
 
 // Trips View
-function TripsView({ user, token }) {
-  const [trips, setTrips] = useState([]);
-  const [loading, setLoading] = useState(true);
+function TripsView({ user, token, dashboard }) {
+  const savedTrips = () => JSON.parse(localStorage.getItem(`trips_${user.user_id}`) || '[]');
+  // Show the dashboard's recent trips at once; the full list replaces them when it arrives
+  const [trips, setTrips] = useState(dashboard ? [...savedTrips(), ...dashboard.recent_trips] : []);
+  const [loading, setLoading] = useState(!dashboard);
 
   useEffect(() => {
     fetchTrips();
@@ -660,7 +844,7 @@ function TripsView({ user, token }) {
   const fetchTrips = async () => {
     try {
       // Get trips from localStorage
-      const localTrips = JSON.parse(localStorage.getItem(`trips_${user.user_id}`) || '[]');
+      const localTrips = savedTrips();
       
       // Try to get trips from backend
       try {